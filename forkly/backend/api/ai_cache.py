@@ -0,0 +1,207 @@
+"""
+Cache de respostas do assistente de gamificação.
+
+Perguntas quase idênticas ("como subir de tier?", "Como subo de tier??")
+de usuários em situação parecida recebem a mesma resposta do LLM. A chave é
+a mensagem normalizada (minúsculas, sem acentos nem pontuação) mais um
+"bucket" do contexto do usuário: tier, próximo tier, faixa de referências e
+faixa de pontos. Um acerto evita a chamada ao LLM por completo.
+
+Como a resposta de um usuário é servida aos outros do mesmo bucket, o prompt
+é montado só com `shared_context` (sem nome, números em faixas), que é
+exatamente o que entra na chave: nada de um usuário chega à resposta de outro.
+
+O cache é local ao processo (LRU com TTL). Opcionalmente, quando não há
+acerto exato, procura no mesmo bucket a pergunta mais parecida usando um
+embedding local (n-gramas de caracteres com feature hashing) e aceita se a
+similaridade de cosseno passar do limite configurado.
+"""
+
+import math
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+
+REFERRAL_BANDS = (0, 1, 3, 6, 11, 26)
+POINTS_BANDS = (0, 100, 500, 1000, 2500, 5000, 10000)
+EMBEDDING_DIM = 512
+
+
+def _band(value: int, bands: Tuple[int, ...]) -> int:
+    """Índice da maior faixa cujo limite inferior é <= value"""
+    band = 0
+    for i, lower in enumerate(bands):
+        if value >= lower:
+            band = i
+    return band
+
+
+def normalize_message(message: str) -> str:
+    """Minúsculas, sem acentos, sem pontuação e com espaços colapsados"""
+    text = unicodedata.normalize('NFKD', message.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r'[^\w\s]', ' ', text)
+    return ' '.join(text.split())
+
+
+def _band_label(value: int, bands: Tuple[int, ...]) -> str:
+    """Faixa de value em texto: '3-5', ou '26+' na última"""
+    band = _band(value, bands)
+    if band == len(bands) - 1:
+        return f"{bands[band]}+"
+    upper = bands[band + 1] - 1
+    return str(upper) if upper == bands[band] else f"{bands[band]}-{upper}"
+
+
+def shared_context(context: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Parte do contexto que pode entrar num prompt cujas respostas são compartilhadas.
+
+    Todos os usuários de um bucket têm exatamente estes valores; o prompt usa só
+    eles e a chave do cache é formada por todos eles.
+    """
+    return {
+        'tier': str(context.get('current_tier') or '-'),
+        'next_tier': str(context.get('next_tier') or '-'),
+        'referrals': _band_label(context.get('current_referrals') or 0, REFERRAL_BANDS),
+        'points': _band_label(context.get('total_points') or 0, POINTS_BANDS),
+    }
+
+
+def context_bucket(context: Dict[str, Any]) -> str:
+    """Resumo grosso do contexto: usuários no mesmo bucket compartilham respostas"""
+    return '|'.join(f"{name}={value}" for name, value in shared_context(context).items())
+
+
+def embed(text: str) -> Dict[int, float]:
+    """Vetor esparso normalizado de trigramas de caracteres (feature hashing)"""
+    padded = f"  {text}  "
+    vector = defaultdict(float)
+    for i in range(len(padded) - 2):
+        vector[zlib.crc32(padded[i:i + 3].encode()) % EMBEDDING_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+    return {k: v / norm for k, v in vector.items()}
+
+
+def _cosine(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(k, 0.0) for k, v in a.items())
+
+
+class ResponseCache:
+    """LRU com TTL; entradas indexadas por (bucket, mensagem normalizada)"""
+
+    def __init__(self, max_entries: int, ttl: int, similarity_threshold: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # (bucket, normalized) -> (expires_at, response, vector)
+        self._by_bucket = defaultdict(set)
+        self._lock = threading.Lock()
+        self.metrics = {'hits': 0, 'similar_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0}
+
+    def _drop(self, key) -> None:
+        self._entries.pop(key, None)
+        keys = self._by_bucket.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_bucket[key[0]]
+
+    def _similar(self, bucket: str, vector: Dict[int, float], now: float) -> Optional[Tuple]:
+        best_key, best_score = None, self.similarity_threshold
+        for key in list(self._by_bucket.get(bucket, ())):
+            expires_at, _, candidate = self._entries[key]
+            if expires_at <= now:
+                self._drop(key)
+                self.metrics['expired'] += 1
+                continue
+            score = _cosine(vector, candidate)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def get(self, message: str, context: Dict[str, Any]) -> Optional[str]:
+        """Resposta cacheada para a pergunta no bucket do usuário, ou None"""
+        key = (context_bucket(context), normalize_message(message))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._drop(key)
+                self.metrics['expired'] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.metrics['hits'] += 1
+                return entry[1]
+
+            if self.similarity_threshold > 0:
+                similar_key = self._similar(key[0], embed(key[1]), now)
+                if similar_key is not None:
+                    self._entries.move_to_end(similar_key)
+                    self.metrics['similar_hits'] += 1
+                    return self._entries[similar_key][1]
+
+            self.metrics['misses'] += 1
+            return None
+
+    def set(self, message: str, context: Dict[str, Any], response: str) -> None:
+        key = (context_bucket(context), normalize_message(message))
+        if not key[1] or not response:
+            return
+        vector = embed(key[1]) if self.similarity_threshold > 0 else None
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, response, vector)
+            self._by_bucket[key[0]].add(key)
+            self.metrics['stores'] += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.metrics['evictions'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_bucket.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de acerto/erro e tamanho atual"""
+        with self._lock:
+            lookups = self.metrics['hits'] + self.metrics['similar_hits'] + self.metrics['misses']
+            hit_rate = (self.metrics['hits'] + self.metrics['similar_hits']) / lookups if lookups else 0.0
+            return {**self.metrics, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Cache do processo, ou None se desabilitado (AI_RESPONSE_CACHE_TTL = 0)"""
+    global _cache
+    ttl = getattr(settings, 'AI_RESPONSE_CACHE_TTL', 3600)
+    if ttl <= 0:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=getattr(settings, 'AI_RESPONSE_CACHE_MAX_ENTRIES', 2000),
+                    ttl=ttl,
+                    similarity_threshold=getattr(settings, 'AI_RESPONSE_CACHE_SIMILARITY', 0.0),
+                )
+    return _cache
+
+
+def stats() -> Dict[str, Any]:
+    cache = get_response_cache()
+    return cache.stats() if cache is not None else {'enabled': False}
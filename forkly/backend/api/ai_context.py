@@ -0,0 +1,76 @@
+"""
+Snapshots do contexto usado pelos assistentes de IA.
+
+Montar o contexto de gamificação ou do restaurante custa várias consultas;
+numa conversa, ele quase não muda entre uma mensagem e outra. O snapshot é
+calculado uma vez e guardado no cache (por usuário para gamificação, por
+restaurante para o dono) até expirar (`AI_CONTEXT_CACHE_TIMEOUT`) ou até um
+evento relevante invalidá-lo (ver `api/signals.py`).
+
+Mudanças globais (tiers, recompensas) trocam a geração das chaves em vez de
+apagar snapshot por snapshot.
+"""
+
+import time
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+
+CONTEXT_CACHE_PREFIX = 'ai:ctx'
+GENERATION_KEY = f'{CONTEXT_CACHE_PREFIX}:gen'
+
+GAMIFICATION = 'gamification'
+RESTAURANT = 'restaurant'
+
+
+def _timeout() -> int:
+    return getattr(settings, 'AI_CONTEXT_CACHE_TIMEOUT', 300)
+
+
+def _generation() -> int:
+    return cache.get(GENERATION_KEY, 0)
+
+
+def _key(kind: str, object_id: int, generation: Optional[int] = None) -> str:
+    if generation is None:
+        generation = _generation()
+    return f"{CONTEXT_CACHE_PREFIX}:{kind}:{generation}:{object_id}"
+
+
+def get_snapshot(kind: str, object_id: int, build: Callable[[], Dict]) -> Dict:
+    """
+    Snapshot cacheado, montado com `build` quando ausente.
+
+    Contextos com erro (chave 'error') não são cacheados.
+
+    Args:
+        kind: GAMIFICATION (id do usuário) ou RESTAURANT (id do restaurante)
+        object_id: ID do usuário ou restaurante
+        build: Função que monta o contexto a partir do banco
+
+    Returns:
+        dict: Contexto, com 'built_at' (timestamp da montagem)
+    """
+    key = _key(kind, object_id)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        snapshot = build()
+        if 'error' in snapshot:
+            return snapshot
+        snapshot['built_at'] = time.time()
+        cache.set(key, snapshot, timeout=_timeout())
+    return snapshot
+
+
+def invalidate(kind: str, *object_ids: int) -> None:
+    """Descarta os snapshots dos IDs informados"""
+    generation = _generation()
+    keys = [_key(kind, object_id, generation) for object_id in object_ids if object_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_all() -> None:
+    """Invalida todos os snapshots (tiers ou recompensas mudaram)"""
+    cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
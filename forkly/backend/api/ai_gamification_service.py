@@ -1,27 +1,42 @@
 import os
 import json
 import uuid
-from typing import Dict, List, Any
+from typing import AsyncIterator, Dict, List, Any, Optional, Sequence
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.models import User
 from .models import (
     Profile, UserTier, Tier, Achievement, UserAchievement, 
-    Reward, UserReward, Friendship, AIConversation, AIMessage
+    Reward, UserReward, AIConversation, AIMessage
 )
+from .social_graph import count_referred_friends
+from .llm_client import AsyncLLMClient, LLMError, stream_text
+from .ai_cache import get_response_cache, shared_context
+from . import ai_context, ai_history
+
+CONTEXT_ERROR_MESSAGE = "Desculpe, não consegui acessar suas informações no momento. Tente novamente mais tarde."
+
 
 class AIGamificationService:
     """Serviço de IA para gamificação e recomendações"""
     
     def __init__(self):
         self.openai_key = os.getenv("OPENAI_API_KEY")
+        self.llm = AsyncLLMClient(api_key=self.openai_key)
     
     def get_user_gamification_context(self, user: User) -> Dict[str, Any]:
-        """Obtém contexto completo de gamificação do usuário"""
+        """Obtém contexto completo de gamificação do usuário (snapshot cacheado, ver ai_context)"""
+        return ai_context.get_snapshot(
+            ai_context.GAMIFICATION, user.id, lambda: self._build_gamification_context(user)
+        )
+    
+    def _build_gamification_context(self, user: User) -> Dict[str, Any]:
+        """Monta o contexto de gamificação a partir do banco"""
         try:
             profile = Profile.objects.get(user=user)
-            user_tier = UserTier.objects.get(user=user)
+            user_tier = UserTier.objects.select_related('tier').get(user=user)
             
             # Estatísticas de referrals
-            total_referrals = Friendship.objects.filter(user=user, is_referred=True).count()
+            total_referrals = count_referred_friends(user.id)
             successful_referrals = total_referrals  # Todos são considerados bem-sucedidos
             
             # Conquistas
@@ -58,55 +73,110 @@ class AIGamificationService:
         except Exception as e:
             return {'error': str(e)}
     
-    def generate_ai_response(self, user: User, user_message: str) -> str:
-        """Gera resposta da IA baseada no contexto do usuário"""
-        context = self.get_user_gamification_context(user)
+    def generate_ai_response(self, user: User, user_message: str, conversation: Optional[AIConversation] = None) -> str:
+        """Gera resposta da IA baseada no contexto do usuário (views síncronas)"""
+        return async_to_sync(self.agenerate_ai_response)(user, user_message, conversation)
+    
+    async def agenerate_ai_response(self, user: User, user_message: str,
+                                    conversation: Optional[AIConversation] = None) -> str:
+        """Gera resposta da IA sem bloquear o worker enquanto o LLM responde.
+
+        Com `conversation`, o resumo e as mensagens recentes dela vão no prompt.
+        """
+        context = await sync_to_async(self.get_user_gamification_context)(user)
         
         if 'error' in context:
-            return "Desculpe, não consegui acessar suas informações no momento. Tente novamente mais tarde."
-        
-        # Prompt baseado no contexto
-        prompt = self._build_prompt(context, user_message)
+            return CONTEXT_ERROR_MESSAGE
         
         # Se não há chave da OpenAI, usar respostas pré-definidas
         if not self.openai_key:
             return self._get_fallback_response(context, user_message)
         
+        history = await self._history(conversation)
+        # Perguntas parecidas de usuários com contexto parecido reaproveitam a resposta
+        # (só no primeiro turno: com histórico a resposta depende da conversa)
+        response_cache = get_response_cache() if not history else None
+        cached = response_cache.get(user_message, context) if response_cache else None
+        if cached is not None:
+            return cached
+        
         try:
-            import openai
-            openai.api_key = self.openai_key
-            
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
-            
-            return response.choices[0].message.content.strip()
-        except Exception as e:
+            response = await self.llm.chat(self._llm_messages(context, user_message, history), max_tokens=500, temperature=0.7)
+        except LLMError:
             return self._get_fallback_response(context, user_message)
+        if response_cache:
+            response_cache.set(user_message, context, response)
+        return response
+    
+    async def astream_ai_response(self, user: User, user_message: str,
+                                  conversation: Optional[AIConversation] = None) -> AsyncIterator[str]:
+        """Versão em streaming: repassa os tokens do LLM conforme chegam (cache e fallback são enviados em partes)"""
+        context = await sync_to_async(self.get_user_gamification_context)(user)
+        
+        # Resposta pronta (erro, fallback ou cache) é enviada em partes; senão, stream do LLM
+        if 'error' in context:
+            ready = CONTEXT_ERROR_MESSAGE
+        elif not self.openai_key:
+            ready = self._get_fallback_response(context, user_message)
+        else:
+            history = await self._history(conversation)
+            response_cache = get_response_cache() if not history else None
+            ready = response_cache.get(user_message, context) if response_cache else None
+        
+        if ready is None:
+            parts = []
+            try:
+                async for delta in self.llm.stream_chat(self._llm_messages(context, user_message, history), max_tokens=500, temperature=0.7):
+                    parts.append(delta)
+                    yield delta
+            except LLMError:
+                # Se parte da resposta já foi enviada, encerra com o que houver
+                if not parts:
+                    ready = self._get_fallback_response(context, user_message)
+            else:
+                if response_cache and parts:
+                    response_cache.set(user_message, context, ''.join(parts))
+        
+        if ready:
+            async for chunk in stream_text(ready):
+                yield chunk
+    
+    async def _history(self, conversation: Optional[AIConversation]) -> List[Dict[str, str]]:
+        """Resumo e janela recente da conversa (vazio sem conversa)"""
+        if conversation is None:
+            return []
+        return await sync_to_async(ai_history.prompt_history)(conversation)
+    
+    def _llm_messages(self, context: Dict[str, Any], user_message: str,
+                      history: Sequence[Dict[str, str]] = ()) -> List[Dict[str, str]]:
+        """Mensagens enviadas ao LLM (prompt de sistema + histórico da conversa + prompt com contexto)"""
+        return [
+            {"role": "system", "content": self._get_system_prompt()},
+            *history,
+            {"role": "user", "content": self._build_prompt(context, user_message)}
+        ]
     
     def _build_prompt(self, context: Dict[str, Any], user_message: str) -> str:
-        """Constrói prompt para a IA"""
+        """
+        Constrói prompt para a IA.
+
+        A resposta é reaproveitada por todos os usuários do mesmo bucket do
+        cache (ver ai_cache), então o prompt leva só o contexto compartilhado:
+        sem nome e com referrals e pontos em faixas.
+        """
+        shared = shared_context(context)
+        next_tier = shared['next_tier'] if shared['next_tier'] != '-' else 'Máximo alcançado'
         return f"""
 Contexto do usuário:
-- Nome: {context['username']}
-- Tier atual: {context['current_tier']}
-- Referrals: {context['current_referrals']}
-- Pontos: {context['total_points']}
-- Próximo tier: {context['next_tier'] or 'Máximo alcançado'}
-- Referrals para próximo tier: {context['referrals_to_next']}
-- Conquistas: {context['achievements_count']}
-- Recompensas resgatadas: {context['claimed_rewards']}
-- Recompensas disponíveis: {context['available_rewards_count']}
+- Tier atual: {shared['tier']}
+- Referrals: {shared['referrals']}
+- Pontos: {shared['points']}
+- Próximo tier: {next_tier}
 
 Mensagem do usuário: {user_message}
 
 Responda de forma amigável e útil, dando conselhos específicos sobre como melhorar o tier, usar pontos e ganhar mais referrals.
+Não chame o usuário pelo nome nem cite números exatos: referrals e pontos são faixas.
 """
     
     def _get_system_prompt(self) -> str:
@@ -224,16 +294,6 @@ O que você gostaria de saber? 😊"""
             metadata=metadata or {}
         )
     
-    def get_conversation_history(self, conversation: AIConversation) -> List[Dict]:
-        """Obtém histórico da conversa"""
-        messages = conversation.messages.all()
-        return [
-            {
-                'role': msg.role,
-                'content': msg.content,
-                'message_type': msg.message_type,
-                'created_at': msg.created_at.isoformat(),
-                'metadata': msg.metadata
-            }
-            for msg in messages
-        ]
+    def get_conversation_history(self, conversation: AIConversation, limit: int = None) -> List[Dict]:
+        """Obtém as últimas mensagens da conversa (janela AI_HISTORY_WINDOW)"""
+        return ai_history.get_history(conversation, limit)
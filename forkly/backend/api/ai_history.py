@@ -0,0 +1,148 @@
+"""
+Histórico das conversas com os assistentes de IA.
+
+Cada turno só lê as últimas N mensagens (índice (conversation, created_at)),
+então o custo não cresce com o tamanho da conversa. O que sai da janela é
+condensado num resumo incremental guardado em `AIConversation.metadata`:
+
+    {'summary': '...', 'summarized_until': <id da última mensagem resumida>}
+
+O resumo é extrativo (trechos das perguntas e respostas), sem chamada ao LLM.
+Resumo e janela vão no prompt de cada turno (`prompt_history`).
+"""
+
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import AIConversation, AIMessage
+
+SUMMARY_SNIPPET_CHARS = 160
+
+
+def _window() -> int:
+    return getattr(settings, 'AI_HISTORY_WINDOW', 50)
+
+
+def _summary_max_chars() -> int:
+    return getattr(settings, 'AI_SUMMARY_MAX_CHARS', 2000)
+
+
+def serialize_message(msg: AIMessage) -> Dict:
+    return {
+        'role': msg.role,
+        'content': msg.content,
+        'message_type': msg.message_type,
+        'created_at': msg.created_at.isoformat(),
+        'metadata': msg.metadata
+    }
+
+
+def recent_messages(conversation: AIConversation, limit: Optional[int] = None) -> List[AIMessage]:
+    """Últimas `limit` mensagens em ordem cronológica"""
+    limit = limit or _window()
+    latest = AIMessage.objects.filter(conversation=conversation).order_by('-created_at', '-id')[:limit]
+    return list(reversed(latest))
+
+
+def get_history(conversation: AIConversation, limit: Optional[int] = None) -> List[Dict]:
+    return [serialize_message(msg) for msg in recent_messages(conversation, limit)]
+
+
+def prompt_history(conversation: AIConversation) -> List[Dict[str, str]]:
+    """
+    Memória da conversa no formato de mensagens do LLM.
+
+    O resumo do que saiu da janela vira uma mensagem de sistema, seguida das
+    mensagens da janela. A última pergunta do usuário fica de fora: é a que
+    está sendo respondida e vai no prompt junto com o contexto.
+    """
+    messages = recent_messages(conversation)
+    if messages and messages[-1].role == 'user':
+        messages = messages[:-1]
+    history = []
+    summary = (conversation.metadata or {}).get('summary')
+    if summary:
+        history.append({'role': 'system', 'content': f"Resumo das mensagens anteriores da conversa:\n{summary}"})
+    history.extend({'role': msg.role, 'content': msg.content} for msg in messages)
+    return history
+
+
+def _snippet(text: str) -> str:
+    text = ' '.join(text.split())
+    if len(text) <= SUMMARY_SNIPPET_CHARS:
+        return text
+    return text[:SUMMARY_SNIPPET_CHARS - 1].rstrip() + '…'
+
+
+def roll_summary(conversation: AIConversation) -> bool:
+    """
+    Incorpora ao resumo as mensagens que saíram da janela.
+
+    Lê no máximo a janela mais as mensagens novas desde o último resumo, e
+    mantém o resumo abaixo de AI_SUMMARY_MAX_CHARS descartando as linhas
+    mais antigas.
+
+    Args:
+        conversation: Conversa a atualizar
+
+    Returns:
+        bool: True se o resumo mudou
+    """
+    with transaction.atomic():
+        # Trava a conversa: dois turnos simultâneos resumiriam as mesmas mensagens
+        locked = AIConversation.objects.select_for_update().only('id', 'metadata').get(pk=conversation.pk)
+        metadata = locked.metadata or {}
+        conversation.metadata = metadata
+        until = metadata.get('summarized_until', 0)
+        pending = list(
+            AIMessage.objects.filter(conversation=conversation, id__gt=until)
+            .order_by('created_at', 'id')
+            .only('id', 'role', 'content')
+        )
+        overflow = len(pending) - _window()
+        if overflow <= 0:
+            return False
+
+        lines = [line for line in metadata.get('summary', '').split('\n') if line]
+        for msg in pending[:overflow]:
+            speaker = 'Usuário' if msg.role == 'user' else 'Assistente'
+            lines.append(f"{speaker}: {_snippet(msg.content)}")
+        max_chars = _summary_max_chars()
+        while lines and sum(len(line) + 1 for line in lines) > max_chars:
+            lines.pop(0)
+
+        metadata['summary'] = '\n'.join(lines)
+        metadata['summarized_until'] = pending[overflow - 1].id
+        metadata['summarized_count'] = metadata.get('summarized_count', 0) + overflow
+        locked.metadata = metadata
+        locked.save(update_fields=['metadata', 'updated_at'])
+    return True
+
+
+def get_thread_page(conversation: AIConversation, before: Optional[int] = None, limit: int = 50) -> Dict:
+    """
+    Página de mensagens anteriores a `before` (ID de mensagem), em ordem cronológica.
+
+    Returns:
+        dict: messages, has_more e next_before (cursor da página anterior)
+    """
+    messages = AIMessage.objects.filter(conversation=conversation)
+    if before is not None:
+        # Cursor (created_at, id), a mesma ordem da página: o ID sozinho não
+        # acompanha created_at se as mensagens não forem gravadas em ordem
+        anchor = messages.filter(id=before).values_list('created_at', flat=True).first()
+        if anchor is None:
+            messages = messages.filter(id__lt=before)
+        else:
+            messages = messages.filter(Q(created_at__lt=anchor) | Q(created_at=anchor, id__lt=before))
+    page = list(messages.order_by('-created_at', '-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = list(reversed(page[:limit]))
+    return {
+        'messages': page,
+        'has_more': has_more,
+        'next_before': page[0].id if has_more and page else None,
+    }
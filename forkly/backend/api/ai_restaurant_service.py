@@ -1,12 +1,17 @@
 import os
 import uuid
-from typing import Dict, List
+from typing import AsyncIterator, Dict, List, Optional, Sequence
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.models import User
+from django.db.models import Avg, Count, Q
 from django.utils import timezone
 from datetime import timedelta
 from .models import (
-    RestaurantOwner, Reservation, RestaurantAnalytics, AIConversation, AIMessage
+    Restaurant, RestaurantOwner, Reservation, RestaurantAnalytics, Review, AIConversation, AIMessage
 )
+from . import ai_context, ai_history
+from .insights import get_insights
+from .llm_client import AsyncLLMClient, LLMError, stream_text
 
 
 class AIRestaurantService:
@@ -14,6 +19,7 @@ class AIRestaurantService:
 
     def __init__(self):
         self.openai_key = os.getenv("OPENAI_API_KEY")
+        self.llm = AsyncLLMClient(api_key=self.openai_key)
 
     # ===== Conversa (utilidades iguais às do serviço de gamificação) =====
     def create_conversation(self, user: User) -> AIConversation:
@@ -34,215 +40,194 @@ class AIRestaurantService:
             metadata=metadata or {}
         )
 
-    def get_conversation_history(self, conversation: AIConversation) -> List[Dict]:
-        messages = conversation.messages.all()
-        return [
-            {
-                'role': msg.role,
-                'content': msg.content,
-                'message_type': msg.message_type,
-                'created_at': msg.created_at.isoformat(),
-                'metadata': msg.metadata
-            }
-            for msg in messages
-        ]
+    def get_conversation_history(self, conversation: AIConversation, limit: int = None) -> List[Dict]:
+        """Obtém as últimas mensagens da conversa (janela AI_HISTORY_WINDOW)"""
+        return ai_history.get_history(conversation, limit)
 
     # ===== Dados e respostas =====
     def get_restaurant_context(self, user: User) -> Dict:
-        owner = RestaurantOwner.objects.get(user=user)
-        restaurant = owner.restaurant
-        # garantir analytics atualizados
-        restaurant.analytics.update_stats()
+        """Contexto do restaurante do dono (snapshot cacheado por restaurante, ver ai_context)"""
+        restaurant_id = RestaurantOwner.objects.values_list('restaurant_id', flat=True).get(user=user)
+        return ai_context.get_snapshot(
+            ai_context.RESTAURANT, restaurant_id, lambda: self._build_restaurant_context(restaurant_id)
+        )
+
+    def _build_restaurant_context(self, restaurant_id: int) -> Dict:
+        """Monta o contexto só com leituras (sem regravar RestaurantAnalytics a cada mensagem)"""
+        restaurant = Restaurant.objects.select_related('profile').get(id=restaurant_id)
 
         now = timezone.now()
         month_ago = now - timedelta(days=30)
-
-        monthly_done = Reservation.objects.filter(
-            restaurant=restaurant,
-            created_at__gte=month_ago,
-            status__in=['confirmed', 'completed']
-        )
-        monthly_no_show = Reservation.objects.filter(
-            restaurant=restaurant,
-            created_at__gte=month_ago,
-            status='no_show'
+        done = Q(status__in=['confirmed', 'completed'])
+        recent = Q(created_at__gte=month_ago)
+        reservations = Reservation.objects.filter(restaurant=restaurant).aggregate(
+            total=Count('id', filter=done),
+            monthly=Count('id', filter=done & recent),
+            no_shows=Count('id', filter=recent & Q(status='no_show')),
         )
+        reviews = Review.objects.filter(restaurant=restaurant).aggregate(count=Count('id'), avg=Avg('rating'))
 
-        monthly_count = monthly_done.count()
-        avg_ticket = float(getattr(restaurant.profile, 'average_ticket', 0) or 0)
-        monthly_revenue = monthly_count * avg_ticket
+        profile = getattr(restaurant, 'profile', None)
+        avg_ticket = float(getattr(profile, 'average_ticket', 0) or 0)
 
         return {
             'restaurant_name': restaurant.name,
-            'average_rating': restaurant.analytics.average_rating,
-            'total_reviews': restaurant.analytics.total_reviews,
-            'total_reservations': restaurant.analytics.total_reservations,
-            'total_revenue': float(restaurant.analytics.total_revenue),
-            'monthly_reservations': monthly_count,
-            'monthly_revenue': float(monthly_revenue),
-            'no_shows_30d': monthly_no_show.count(),
+            'average_rating': float(reviews['avg'] or 0),
+            'total_reviews': reviews['count'],
+            'total_reservations': reservations['total'],
+            'total_revenue': reservations['total'] * avg_ticket,
+            'monthly_reservations': reservations['monthly'],
+            'monthly_revenue': reservations['monthly'] * avg_ticket,
+            'no_shows_30d': reservations['no_shows'],
             'period': 'últimos 30 dias',
         }
 
-    def generate_ai_response(self, user: User, user_message: str) -> str:
+    def generate_ai_response(self, user: User, user_message: str, conversation: Optional[AIConversation] = None) -> str:
+        """Gera resposta da IA com foco em desempenho do restaurante (views síncronas)."""
+        return async_to_sync(self.agenerate_ai_response)(user, user_message, conversation)
+
+    async def agenerate_ai_response(self, user: User, user_message: str,
+                                    conversation: Optional[AIConversation] = None) -> str:
         """Gera resposta da IA com foco em desempenho do restaurante.
-        Usa OpenAI se disponível, senão fallback determinístico.
+        Usa o LLM (chamada HTTP assíncrona) se disponível, senão fallback determinístico.
+        Com `conversation`, o resumo e as mensagens recentes dela vão no prompt.
         """
         try:
-            context = self.get_restaurant_context(user)
+            context = await sync_to_async(self.get_restaurant_context)(user)
         except RestaurantOwner.DoesNotExist:
             return 'Você ainda não possui um restaurante cadastrado.'
 
-        # Fallback: regras simples baseadas em palavras-chave
         if not self.openai_key:
-            text = user_message.lower()
-            # Projeção inteligente baseada em tendências reais das reservas
-            if any(k in text for k in ['próximo mês', 'proximo mes', 'mês que vem', 'mes que vem', 'expectativa', 'expectativa de ganho', 'previsão', 'projecao', 'projeção']):
-                try:
-                    from django.utils import timezone
-                    from datetime import timedelta
-                    from api.models import Reservation
-                    
-                    owner = RestaurantOwner.objects.get(user=user)
-                    restaurant = owner.restaurant
-                    now = timezone.now()
-                    
-                    # Analisar tendências dos últimos 3 meses
-                    three_months_ago = now - timedelta(days=90)
-                    two_months_ago = now - timedelta(days=60)
-                    one_month_ago = now - timedelta(days=30)
-                    
-                    # Reservas por período
-                    reservations_3m = Reservation.objects.filter(
-                        restaurant=restaurant,
-                        created_at__gte=three_months_ago,
-                        created_at__lt=two_months_ago,
-                        status__in=['confirmed', 'completed']
-                    ).count()
-                    
-                    reservations_2m = Reservation.objects.filter(
-                        restaurant=restaurant,
-                        created_at__gte=two_months_ago,
-                        created_at__lt=one_month_ago,
-                        status__in=['confirmed', 'completed']
-                    ).count()
-                    
-                    reservations_1m = Reservation.objects.filter(
-                        restaurant=restaurant,
-                        created_at__gte=one_month_ago,
-                        status__in=['confirmed', 'completed']
-                    ).count()
-                    
-                    # Calcular tendência
-                    if reservations_2m > 0 and reservations_1m > 0:
-                        # Tendência baseada nos últimos 2 meses
-                        growth_rate = (reservations_1m - reservations_2m) / reservations_2m
-                    elif reservations_3m > 0:
-                        # Tendência baseada nos últimos 3 meses
-                        growth_rate = (reservations_1m - reservations_3m) / reservations_3m
-                    else:
-                        growth_rate = 0.0
-                    
-                    # Aplicar lift de exposição em listas
-                    analytics = restaurant.analytics
-                    times_in_lists = float(analytics.times_in_lists or 0)
-                    times_recommended = float(analytics.times_recommended or 0)
-                    k = 200.0
-                    raw_lift = (times_in_lists + times_recommended) / k
-                    lift = max(0.0, min(raw_lift, 0.3))  # Máximo 30% de lift
-                    
-                    # Projeção baseada na tendência real + lift
-                    base_rev = float(context['monthly_revenue'])
-                    trend_factor = 1.0 + (growth_rate * 0.5)  # Suavizar tendência
-                    lift_factor = 1.0 + lift
-                    next_month_revenue = base_rev * trend_factor * lift_factor
-                    
-                    delta = next_month_revenue - base_rev
-                    direction = '↑' if delta >= 0 else '↓'
-                    
-                    # Explicação da projeção
-                    explanation = []
-                    if growth_rate > 0.1:
-                        explanation.append(f"crescimento de {(growth_rate*100):.1f}%")
-                    elif growth_rate < -0.1:
-                        explanation.append(f"queda de {(abs(growth_rate)*100):.1f}%")
-                    else:
-                        explanation.append("tendência estável")
-                    
-                    if lift > 0.05:
-                        explanation.append(f"exposição em listas (+{(lift*100):.1f}%)")
-                    
-                    return (
-                        f"Expectativa de receita para o próximo mês: R$ {next_month_revenue:.2f} ({direction} R$ {abs(delta):.2f} vs. mês atual).\n"
-                        f"Baseado em: {', '.join(explanation)}. "
-                        f"Reservas: {reservations_1m} (último mês), {reservations_2m} (mês anterior)."
-                    )
-                    
-                except Exception as e:
-                    return f"Erro ao calcular projeção: {str(e)}"
-            if any(k in text for k in ['resumo', 'mês', 'mensal', '30 dias']):
-                return (
-                    f"Resumo {context['period']} – {context['restaurant_name']}\n"
-                    f"• Reservas concluídas/confirmadas: {context['monthly_reservations']}\n"
-                    f"• Receita estimada: R$ {context['monthly_revenue']:.2f}\n"
-                    f"• No-shows: {context['no_shows_30d']}\n"
-                    f"• Avaliação média geral: {context['average_rating']:.1f} ({context['total_reviews']} avaliações)\n"
-                    f"Sugestão: reduza no-shows confirmando reservas por mensagem e oferecendo lembretes."
-                )
-            if any(k in text for k in ['reserva', 'reservas']):
-                return (
-                    f"Você teve {context['monthly_reservations']} reservas nos {context['period']}. "
-                    f"Capriche no pico de movimento com equipe e estoque alinhados."
-                )
-            if any(k in text for k in ['receita', 'faturamento']):
-                return (
-                    f"Receita estimada do período ({context['period']}): R$ {context['monthly_revenue']:.2f}. "
-                    f"Ticket médio atual: otimize combos e upsell para aumentar o valor por mesa."
-                )
-            if any(k in text for k in ['avaliação', 'reviews']):
+            return await sync_to_async(self._get_fallback_response)(user, context, user_message)
+
+        history = await self._history(conversation)
+        try:
+            return await self.llm.chat(self._llm_messages(context, user_message, history), max_tokens=500, temperature=0.4)
+        except LLMError:
+            # fallback se o LLM falhar
+            return await sync_to_async(self._get_fallback_response)(user, context, user_message)
+
+    async def astream_ai_response(self, user: User, user_message: str,
+                                  conversation: Optional[AIConversation] = None) -> AsyncIterator[str]:
+        """Versão em streaming de agenerate_ai_response (fallback também é enviado em partes)"""
+        try:
+            context = await sync_to_async(self.get_restaurant_context)(user)
+        except RestaurantOwner.DoesNotExist:
+            async for chunk in stream_text('Você ainda não possui um restaurante cadastrado.'):
+                yield chunk
+            return
+
+        use_fallback = not self.openai_key
+        if not use_fallback:
+            history = await self._history(conversation)
+            started = False
+            try:
+                async for delta in self.llm.stream_chat(self._llm_messages(context, user_message, history), max_tokens=500, temperature=0.4):
+                    started = True
+                    yield delta
+            except LLMError:
+                # Se parte da resposta já foi enviada, encerra com o que houver
+                use_fallback = not started
+
+        if use_fallback:
+            fallback = await sync_to_async(self._get_fallback_response)(user, context, user_message)
+            async for chunk in stream_text(fallback):
+                yield chunk
+
+    async def _history(self, conversation: Optional[AIConversation]) -> List[Dict[str, str]]:
+        """Resumo e janela recente da conversa (vazio sem conversa)"""
+        if conversation is None:
+            return []
+        return await sync_to_async(ai_history.prompt_history)(conversation)
+
+    def _llm_messages(self, context: Dict, user_message: str, history: Sequence[Dict[str, str]] = ()) -> List[Dict[str, str]]:
+        # Incluir contexto e instruções específicas
+        system_prompt = (
+            "Você é um assistente de inteligência para donos de restaurante. "
+            "Responda de forma objetiva, com números, tendências e sugestões práticas. "
+            "Use dados do contexto quando citados."
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            *history,
+            {"role": "user", "content": self._build_prompt(context, user_message)},
+        ]
+
+    def _build_prompt(self, ctx: Dict, user_message: str) -> str:
+        return (
+            f"Contexto:\n"
+            f"Restaurante: {ctx['restaurant_name']}\n"
+            f"Avaliação média: {ctx['average_rating']} ({ctx['total_reviews']} avaliações)\n"
+            f"Reservas totais: {ctx['total_reservations']} | Receita total: R$ {ctx['total_revenue']:.2f}\n"
+            f"Últimos 30 dias: reservas={ctx['monthly_reservations']}, receita=R$ {ctx['monthly_revenue']:.2f}, no-shows={ctx['no_shows_30d']}\n\n"
+            f"Pergunta: {user_message}"
+        )
+
+    def _get_fallback_response(self, user: User, context: Dict, user_message: str) -> str:
+        """Resposta determinística (regras simples baseadas em palavras-chave)"""
+        text = user_message.lower()
+        # Projeção inteligente baseada em tendências reais das reservas
+        if any(k in text for k in ['próximo mês', 'proximo mes', 'mês que vem', 'mes que vem', 'expectativa', 'expectativa de ganho', 'previsão', 'projecao', 'projeção']):
+            try:
+                # Tendência e projeção pré-calculadas pelo job de insights
+                restaurant = RestaurantOwner.objects.select_related('restaurant').get(user=user).restaurant
+                insights = get_insights(restaurant)
+                growth_rate = insights.growth_rate
+                lift = insights.lift
+                next_month_revenue = insights.projected_revenue
+                
+                delta = next_month_revenue - insights.monthly_revenue
+                direction = '↑' if delta >= 0 else '↓'
+                
+                # Explicação da projeção
+                explanation = []
+                if growth_rate > 0.1:
+                    explanation.append(f"crescimento de {(growth_rate*100):.1f}%")
+                elif growth_rate < -0.1:
+                    explanation.append(f"queda de {(abs(growth_rate)*100):.1f}%")
+                else:
+                    explanation.append("tendência estável")
+                
+                if lift > 0.05:
+                    explanation.append(f"exposição em listas (+{(lift*100):.1f}%)")
+                
                 return (
-                    f"Sua avaliação média geral é {context['average_rating']:.1f} baseada em {context['total_reviews']} reviews. "
-                    f"Estimule feedbacks pós-refeição e responda avaliações-chave."
+                    f"Expectativa de receita para o próximo mês: R$ {next_month_revenue:.2f} ({direction} R$ {abs(delta):.2f} vs. mês atual).\n"
+                    f"Baseado em: {', '.join(explanation)}. "
+                    f"Reservas: {insights.reservations_30d} (último mês), {insights.reservations_prev_30d} (mês anterior)."
                 )
-            # Default
+                
+            except Exception as e:
+                return f"Erro ao calcular projeção: {str(e)}"
+        if any(k in text for k in ['resumo', 'mês', 'mensal', '30 dias']):
             return (
-                f"Olá! Posso analisar métricas do seu restaurante. Pergunte por exemplo: \n"
-                f"• 'Me dê um resumo do mês'\n"
-                f"• 'Como estão as reservas?'\n"
-                f"• 'Qual foi a receita estimada?'\n"
-                f"• 'Como está minha avaliação?'"
+                f"Resumo {context['period']} – {context['restaurant_name']}\n"
+                f"• Reservas concluídas/confirmadas: {context['monthly_reservations']}\n"
+                f"• Receita estimada: R$ {context['monthly_revenue']:.2f}\n"
+                f"• No-shows: {context['no_shows_30d']}\n"
+                f"• Avaliação média geral: {context['average_rating']:.1f} ({context['total_reviews']} avaliações)\n"
+                f"Sugestão: reduza no-shows confirmando reservas por mensagem e oferecendo lembretes."
             )
-
-        # Se houver OpenAI, incluir contexto e instruções específicas
-        try:
-            import openai
-            openai.api_key = self.openai_key
-            system_prompt = (
-                "Você é um assistente de inteligência para donos de restaurante. "
-                "Responda de forma objetiva, com números, tendências e sugestões práticas. "
-                "Use dados do contexto quando citados."
+        if any(k in text for k in ['reserva', 'reservas']):
+            return (
+                f"Você teve {context['monthly_reservations']} reservas nos {context['period']}. "
+                f"Capriche no pico de movimento com equipe e estoque alinhados."
             )
-            ctx = self.get_restaurant_context(user)
-            prompt = (
-                f"Contexto:\n"
-                f"Restaurante: {ctx['restaurant_name']}\n"
-                f"Avaliação média: {ctx['average_rating']} ({ctx['total_reviews']} avaliações)\n"
-                f"Reservas totais: {ctx['total_reservations']} | Receita total: R$ {ctx['total_revenue']:.2f}\n"
-                f"Últimos 30 dias: reservas={ctx['monthly_reservations']}, receita=R$ {ctx['monthly_revenue']:.2f}, no-shows={ctx['no_shows_30d']}\n\n"
-                f"Pergunta: {user_message}"
+        if any(k in text for k in ['receita', 'faturamento']):
+            return (
+                f"Receita estimada do período ({context['period']}): R$ {context['monthly_revenue']:.2f}. "
+                f"Ticket médio atual: otimize combos e upsell para aumentar o valor por mesa."
             )
-            resp = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": prompt},
-                ],
-                max_tokens=500,
-                temperature=0.4,
+        if any(k in text for k in ['avaliação', 'reviews']):
+            return (
+                f"Sua avaliação média geral é {context['average_rating']:.1f} baseada em {context['total_reviews']} reviews. "
+                f"Estimule feedbacks pós-refeição e responda avaliações-chave."
             )
-            return resp.choices[0].message.content.strip()
-        except Exception:
-            # fallback se OpenAI falhar
-            return self.generate_ai_response.__wrapped__(self, user, user_message)  # type: ignore
-
-
+        # Default
+        return (
+            f"Olá! Posso analisar métricas do seu restaurante. Pergunte por exemplo: \n"
+            f"• 'Me dê um resumo do mês'\n"
+            f"• 'Como estão as reservas?'\n"
+            f"• 'Qual foi a receita estimada?'\n"
+            f"• 'Como está minha avaliação?'"
+        )
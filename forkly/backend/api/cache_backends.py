@@ -0,0 +1,365 @@
+"""
+Two-level cache backend for Forkly API.
+
+`TieredCache` keeps a small in-process LRU (short TTL) in front of a shared
+cache (normally django_redis), so hot, read-mostly keys - friend sets, AI
+context snapshots - are served from memory instead of a network round trip.
+Only keys under the configured prefixes are kept locally; every other key
+goes straight to the shared cache.
+
+Writes go to the shared cache and drop the local copy. Other processes see
+the change after at most LOCAL_TIMEOUT seconds, or immediately with
+`INVALIDATION: 'pubsub'`, which broadcasts written keys over a Redis
+channel to every process.
+
+Configuration (settings.CACHES):
+
+    'default': {
+        'BACKEND': 'api.cache_backends.TieredCache',
+        'OPTIONS': {
+            'REMOTE': 'redis',               # alias of the shared cache
+            'LOCAL_TIMEOUT': 5,              # max seconds a key lives in memory
+            'LOCAL_MAX_ENTRIES': 10000,
+            'LOCAL_PREFIXES': ['social:', 'ai:ctx:'],
+            'INVALIDATION': 'pubsub',        # or None (TTL only)
+        },
+    },
+"""
+
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import observe_cache
+
+logger = logging.getLogger('api')
+
+_MISSING = object()
+
+
+def shared_cache_alias(alias: str = 'default') -> str:
+    """Alias of the cache that actually holds the data (the remote tier of a TieredCache)"""
+    config = settings.CACHES.get(alias, {})
+    if config.get('BACKEND', '').endswith('.TieredCache'):
+        return config.get('OPTIONS', {}).get('REMOTE', 'remote')
+    return alias
+
+
+def _timed(method):
+    """Report the call's duration as cache time of the current request (api.metrics)"""
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            observe_cache(time.perf_counter() - started)
+    return wrapper
+
+
+class _LocalTier:
+    """Bounded LRU of pickled values with per-entry expiry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, pickled value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            data = entry[1]
+        return pickle.loads(data)
+
+    def set(self, key: str, value, ttl: float) -> None:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _TierState:
+    """Process-wide part of a TieredCache (Django creates one backend instance per thread)"""
+
+    def __init__(self, max_entries: int):
+        self.local = _LocalTier(max_entries)
+        self.node = uuid.uuid4().hex
+        self.listener = None
+        self.listener_lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'local_hits': 0, 'remote_hits': 0, 'misses': 0})
+        self.stats_lock = threading.Lock()
+
+
+_states: Dict[tuple, _TierState] = {}
+_states_lock = threading.Lock()
+
+
+def _state_for(name: str, max_entries: int) -> _TierState:
+    key = (os.getpid(), name)  # a forked worker starts with an empty tier and its own listener
+    with _states_lock:
+        if key not in _states:
+            _states[key] = _TierState(max_entries)
+        return _states[key]
+
+
+class TieredCache(BaseCache):
+    """
+    In-process LRU in front of another configured cache.
+
+    Args:
+        server: Unused (the shared cache is referenced by alias in OPTIONS['REMOTE'])
+        params: Cache settings; see the module docstring for OPTIONS
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.remote_alias = options.get('REMOTE', 'remote')
+        self.local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        self.local_prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.invalidation = options.get('INVALIDATION')
+        self.channel = options.get('CHANNEL', 'tiered-cache:invalidate')
+
+        self._state = _state_for(f"{self.remote_alias}:{self.channel}", int(options.get('LOCAL_MAX_ENTRIES', 10000)))
+        self.local = self._state.local
+
+    @property
+    def remote(self) -> BaseCache:
+        return caches[self.remote_alias]
+
+    # ----- helpers -----
+
+    def _prefix(self, key: str) -> str:
+        for prefix in self.local_prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return key.split(':', 1)[0] + ':' if ':' in key else '(other)'
+
+    def _is_local(self, key: str) -> bool:
+        return key.startswith(self.local_prefixes)
+
+    def _local_key(self, key: str, version=None) -> str:
+        return self.make_and_validate_key(key, version=version)
+
+    def _local_ttl(self, timeout) -> float:
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(float(timeout), self.local_timeout)
+
+    def _count(self, key: str, outcome: str) -> None:
+        with self._state.stats_lock:
+            self._state.stats[self._prefix(key)][outcome] += 1
+
+    def _invalidate(self, keys, version=None) -> None:
+        """Drop local copies of `keys` here and, with pub/sub, in every other process"""
+        local_keys = [self._local_key(key, version) for key in keys if self._is_local(key)]
+        if not local_keys:
+            return
+        self.local.discard(local_keys)
+        if self.invalidation == 'pubsub':
+            self._ensure_listener()
+            try:
+                self._redis().publish(self.channel, json.dumps({'node': self._state.node, 'keys': local_keys}))
+            except Exception as e:
+                logger.warning(f"Cache invalidation publish failed: {e.__class__.__name__}: {e}")
+
+    # ----- pub/sub invalidation -----
+
+    def _redis(self):
+        from django_redis import get_redis_connection
+        return get_redis_connection(self.remote_alias)
+
+    def _ensure_listener(self) -> None:
+        """Start the invalidation listener thread (lazily, so it is fork-safe)"""
+        state = self._state
+        if self.invalidation != 'pubsub' or state.listener is not None:
+            return
+        with state.listener_lock:
+            if state.listener is None:
+                state.listener = threading.Thread(target=self._listen, name='tiered-cache-invalidation', daemon=True)
+                state.listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            try:
+                pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    if payload.get('node') != self._state.node:
+                        self.local.discard(payload.get('keys', []))
+            except Exception as e:
+                # Messages may have been missed while disconnected
+                logger.warning(f"Cache invalidation listener reconnecting: {e.__class__.__name__}: {e}")
+                self.local.clear()
+                time.sleep(1)
+
+    # ----- cache API -----
+
+    @_timed
+    def get(self, key, default=None, version=None):
+        if not self._is_local(key):
+            value = self.remote.get(key, _MISSING, version=version)
+            self._count(key, 'misses' if value is _MISSING else 'remote_hits')
+            return default if value is _MISSING else value
+
+        self._ensure_listener()
+        local_key = self._local_key(key, version)
+        value = self.local.get(local_key)
+        if value is not _MISSING:
+            self._count(key, 'local_hits')
+            return value
+        value = self.remote.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'remote_hits')
+        self.local.set(local_key, value, self.local_timeout)
+        return value
+
+    @_timed
+    def get_many(self, keys, version=None):
+        found = {}
+        pending = []
+        for key in keys:
+            if self._is_local(key):
+                value = self.local.get(self._local_key(key, version))
+                if value is not _MISSING:
+                    self._count(key, 'local_hits')
+                    found[key] = value
+                    continue
+            pending.append(key)
+
+        if pending:
+            fetched = self.remote.get_many(pending, version=version)
+            for key in pending:
+                if key not in fetched:
+                    self._count(key, 'misses')
+                    continue
+                self._count(key, 'remote_hits')
+                found[key] = fetched[key]
+                if self._is_local(key):
+                    self.local.set(self._local_key(key, version), fetched[key], self.local_timeout)
+        return found
+
+    @_timed
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self.local.get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.remote.has_key(key, version=version)
+
+    @_timed
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.remote.set(key, value, timeout=timeout, version=version)
+        self._invalidate([key], version)
+        if self._is_local(key) and (timeout is DEFAULT_TIMEOUT or timeout is None or timeout > 0):
+            self.local.set(self._local_key(key, version), value, self._local_ttl(timeout))
+
+    @_timed
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.remote.add(key, value, timeout=timeout, version=version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    @_timed
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.remote.set_many(data, timeout=timeout, version=version)
+        self._invalidate(list(data), version)
+        return failed
+
+    @_timed
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        touched = self.remote.touch(key, timeout=timeout, version=version)
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None and timeout <= 0:
+            self._invalidate([key], version)
+        return touched
+
+    @_timed
+    def delete(self, key, version=None):
+        deleted = self.remote.delete(key, version=version)
+        self._invalidate([key], version)
+        return deleted
+
+    @_timed
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.remote.delete_many(keys, version=version)
+        self._invalidate(keys, version)
+
+    @_timed
+    def incr(self, key, delta=1, version=None):
+        value = self.remote.incr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    @_timed
+    def decr(self, key, delta=1, version=None):
+        value = self.remote.decr(key, delta, version=version)
+        self._invalidate([key], version)
+        return value
+
+    def clear(self):
+        self.remote.clear()
+        self.local.clear()
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+    # ----- metrics -----
+
+    def stats(self) -> Dict:
+        """Local entries and hit ratios per key prefix"""
+        with self._state.stats_lock:
+            prefixes = {prefix: dict(counts) for prefix, counts in self._state.stats.items()}
+        for counts in prefixes.values():
+            total = counts['local_hits'] + counts['remote_hits'] + counts['misses']
+            counts['local_hit_ratio'] = round(counts['local_hits'] / total, 3) if total else None
+            counts['hit_ratio'] = round((counts['local_hits'] + counts['remote_hits']) / total, 3) if total else None
+        return {
+            'local_entries': len(self.local),
+            'local_timeout': self.local_timeout,
+            'invalidation': self.invalidation,
+            'prefixes': prefixes,
+        }
+
+    def reset_stats(self) -> None:
+        with self._state.stats_lock:
+            self._state.stats.clear()
+
+
+def stats(alias: str = 'default') -> Optional[Dict]:
+    """Stats of the cache `alias` if it is a TieredCache, else None"""
+    cache = caches[alias]
+    return cache.stats() if isinstance(cache, TieredCache) else None
@@ -0,0 +1,38 @@
+"""
+PostgreSQL backend with connection pool metrics.
+
+Django's psycopg 3 backend checks a connection out of the pool when a request
+first touches the database and returns it when the connection is closed at
+the end of the request. This subclass times both ends and reports them to
+api.metrics (forkly_db_pool_wait_seconds, forkly_db_pool_checkout_seconds).
+
+Selected by settings.py when DB_POOL_ENABLED; otherwise identical to
+django.db.backends.postgresql.
+"""
+
+import time
+
+from django.db.backends.postgresql import base
+
+from api import metrics
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    _checked_out_at = None
+
+    def get_new_connection(self, conn_params):
+        if not self.pool:
+            return super().get_new_connection(conn_params)
+        started = time.perf_counter()
+        connection = super().get_new_connection(conn_params)
+        self._checked_out_at = time.perf_counter()
+        metrics.observe_db_pool(self.alias, 'wait', self._checked_out_at - started)
+        return connection
+
+    def _close(self):
+        checked_out_at, self._checked_out_at = self._checked_out_at, None
+        try:
+            return super()._close()
+        finally:
+            if checked_out_at is not None:
+                metrics.observe_db_pool(self.alias, 'checkout', time.perf_counter() - checked_out_at)
@@ -0,0 +1,154 @@
+"""
+Read-replica routing for Forkly API.
+
+With DATABASE_REPLICA_URLS set, ReplicaRouter sends the reads of safe
+(GET/HEAD/OPTIONS) requests to a replica and everything else to 'default':
+
+- writes, reads inside a transaction and reads after the request has
+  written go to the primary, as do all queries of unsafe requests (their
+  reads usually feed a write);
+- read-your-writes: after a user writes, their requests read from the
+  primary for REPLICA_STICKY_SECONDS (flag kept in the cache, so every
+  worker sees it);
+- each request sticks to one replica; a replica that fails to connect is
+  skipped for REPLICA_RETRY_SECONDS and its reads fall back to the primary;
+- authentication and session state (PRIMARY_APPS) is always read from the
+  primary: a user who just registered or changed password must not be
+  judged by a lagging copy;
+- outside HTTP requests (management commands, job workers) everything
+  uses the primary.
+
+ReplicaRoutingMiddleware opens and closes the per-request state.
+"""
+
+import base64
+import contextvars
+import json
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+logger = logging.getLogger('api')
+
+PRIMARY = 'default'
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+STICKY_PREFIX = 'db:sticky:'
+PRIMARY_APPS = frozenset({'auth', 'sessions', 'axes', 'token_blacklist'})
+
+
+class _RequestState:
+    __slots__ = ('use_replica', 'identity', 'wrote', 'replica')
+
+    def __init__(self, use_replica: bool, identity: Optional[str]):
+        self.use_replica = use_replica
+        self.identity = identity
+        self.wrote = False
+        self.replica = None
+
+
+# A context variable so the state follows the request into sync_to_async threads
+_state = contextvars.ContextVar('forkly_db_routing', default=None)
+
+_down_until: Dict[str, float] = {}  # replica alias -> time.monotonic() when it may be retried
+counters = {'replica_reads': 0, 'primary_reads': 0, 'sticky_requests': 0, 'fallbacks': 0}
+
+
+def replica_aliases() -> List[str]:
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def client_identity(request) -> Optional[str]:
+    """
+    Who is asking, for read-your-writes.
+
+    The user id is read from the bearer JWT payload without verifying it:
+    it only chooses a database, authentication happens in the view.
+    Falls back to the session cookie.
+    """
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if header.startswith('Bearer '):
+        try:
+            payload = header[7:].split('.')[1]
+            user_id = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))).get('user_id')
+        except (IndexError, ValueError, AttributeError):
+            user_id = None
+        if user_id is not None:
+            return f"user:{user_id}"
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    return f"session:{session_key}" if session_key else None
+
+
+def begin_request(request) -> contextvars.Token:
+    identity = client_identity(request)
+    use_replica = request.method in SAFE_METHODS
+    if use_replica and identity is not None and cache.get(STICKY_PREFIX + identity):
+        use_replica = False
+        counters['sticky_requests'] += 1
+    return _state.set(_RequestState(use_replica, identity))
+
+
+def finish_request(token: contextvars.Token) -> None:
+    """Close the request state; pin the user to the primary if the request wrote"""
+    state = _state.get()
+    _state.reset(token)
+    if state is not None and state.wrote and state.identity is not None:
+        cache.set(STICKY_PREFIX + state.identity, 1, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+def _pick_replica() -> str:
+    """A connectable replica, or the primary when none is"""
+    now = time.monotonic()
+    candidates = [alias for alias in replica_aliases() if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as e:
+            _down_until[alias] = now + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+            counters['fallbacks'] += 1
+            logger.warning(f"Replica {alias} unavailable, reading from the primary: {e}")
+            continue
+        return alias
+    return PRIMARY
+
+
+class ReplicaRouter:
+    """Routes reads to replicas per the rules in the module docstring"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or not state.use_replica or state.wrote
+                or model._meta.app_label in PRIMARY_APPS or connections[PRIMARY].in_atomic_block):
+            counters['primary_reads'] += 1
+            return PRIMARY
+        if state.replica is None:
+            state.replica = _pick_replica()
+        counters['replica_reads' if state.replica != PRIMARY else 'primary_reads'] += 1
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        aliases = {PRIMARY, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return False if db in replica_aliases() else None
+
+
+def stats() -> Dict:
+    now = time.monotonic()
+    return {**counters, 'replicas_down': sum(1 for until in _down_until.values() if until > now)}
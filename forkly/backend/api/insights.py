@@ -0,0 +1,182 @@
+"""
+Insights dos restaurantes para os donos.
+
+Tendência de reservas (três janelas de 30 dias), taxa de no-show,
+sazonalidade (dia da semana e horário, últimos 90 dias) e projeção de
+receita do próximo mês são calculados por um job
+(`python manage.py refresh_restaurant_insights`, agendado à noite) e
+guardados em `RestaurantInsights`. O chat do dono, as recomendações e o
+dashboard apenas leem esse registro; se ele ainda não existir ou estiver
+velho demais, é recalculado na hora para aquele restaurante. O dashboard,
+que mostra os números ao lado de reservas ao vivo, aceita um registro bem
+mais novo (INSIGHTS_DASHBOARD_MAX_AGE_HOURS).
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Reservation, Restaurant, RestaurantInsights
+
+DONE_STATUSES = ['confirmed', 'completed']
+WEEKDAYS = ['dom', 'seg', 'ter', 'qua', 'qui', 'sex', 'sáb']  # ordem de __week_day (1 = domingo)
+LIFT_K = 200.0
+MAX_LIFT = 0.3
+
+
+def _window_counts(restaurant_ids: Optional[Iterable[int]], now) -> Dict[int, Dict[str, int]]:
+    """Contagens das três janelas de 30 dias e no-shows, agrupadas por restaurante (uma consulta)"""
+    month_ago, two_months_ago, three_months_ago = (now - timedelta(days=30 * i) for i in (1, 2, 3))
+    done = Q(status__in=DONE_STATUSES)
+    reservations = Reservation.objects.filter(created_at__gte=three_months_ago)
+    if restaurant_ids is not None:
+        reservations = reservations.filter(restaurant_id__in=list(restaurant_ids))
+    rows = reservations.values('restaurant_id').annotate(
+        current=Count('id', filter=done & Q(created_at__gte=month_ago)),
+        previous=Count('id', filter=done & Q(created_at__gte=two_months_ago, created_at__lt=month_ago)),
+        oldest=Count('id', filter=done & Q(created_at__lt=two_months_ago)),
+        no_shows=Count('id', filter=Q(status='no_show', created_at__gte=month_ago)),
+    )
+    return {row.pop('restaurant_id'): row for row in rows}
+
+
+def _seasonality(restaurant_ids: Optional[Iterable[int]], now) -> Dict[int, Dict]:
+    """Reservas por dia da semana e hora nos últimos 90 dias (duas consultas)"""
+    reservations = Reservation.objects.filter(status__in=DONE_STATUSES, created_at__gte=now - timedelta(days=90))
+    if restaurant_ids is not None:
+        reservations = reservations.filter(restaurant_id__in=list(restaurant_ids))
+
+    by_restaurant = defaultdict(lambda: {'weekday': {day: 0 for day in WEEKDAYS}, 'hour': {}})
+    for row in reservations.values('restaurant_id', 'date__week_day').annotate(n=Count('id')):
+        by_restaurant[row['restaurant_id']]['weekday'][WEEKDAYS[row['date__week_day'] - 1]] = row['n']
+    for row in reservations.values('restaurant_id', 'time__hour').annotate(n=Count('id')):
+        by_restaurant[row['restaurant_id']]['hour'][str(row['time__hour'])] = row['n']
+
+    for data in by_restaurant.values():
+        weekday = data['weekday']
+        data['busiest_weekday'] = max(weekday, key=weekday.get) if any(weekday.values()) else None
+        data['peak_hour'] = int(max(data['hour'], key=data['hour'].get)) if data['hour'] else None
+    return by_restaurant
+
+
+def _growth_rate(current: int, previous: int, oldest: int) -> float:
+    """Tendência pelos dois últimos meses; sem dados suficientes, compara com o terceiro mês"""
+    if previous > 0 and current > 0:
+        return (current - previous) / previous
+    if oldest > 0:
+        return (current - oldest) / oldest
+    return 0.0
+
+
+def _build(restaurant: Restaurant, counts: Dict[str, int], seasonality: Dict, now) -> Dict:
+    profile = getattr(restaurant, 'profile', None)
+    avg_ticket = float(getattr(profile, 'average_ticket', 0) or 0)
+
+    current = counts.get('current', 0)
+    no_shows = counts.get('no_shows', 0)
+    growth_rate = _growth_rate(current, counts.get('previous', 0), counts.get('oldest', 0))
+
+    # Lift de exposição em listas (listas + recomendações, como em RestaurantAnalytics)
+    lift = max(0.0, min((2 * restaurant.list_count) / LIFT_K, MAX_LIFT))
+    monthly_revenue = current * avg_ticket
+    projected_revenue = monthly_revenue * (1.0 + growth_rate * 0.5) * (1.0 + lift)  # tendência suavizada
+
+    return {
+        'reservations_30d': current,
+        'reservations_prev_30d': counts.get('previous', 0),
+        'reservations_60_90d': counts.get('oldest', 0),
+        'no_shows_30d': no_shows,
+        'no_show_rate': no_shows / (current + no_shows) if current + no_shows else 0.0,
+        'monthly_revenue': monthly_revenue,
+        'growth_rate': growth_rate,
+        'lift': lift,
+        'projected_revenue': projected_revenue,
+        'trend_direction': 'up' if growth_rate > 0.05 else 'down' if growth_rate < -0.05 else 'stable',
+        'seasonality': seasonality or {},
+        'computed_at': now,
+    }
+
+
+def refresh(restaurant_ids: Optional[Iterable[int]] = None, batch_size: int = 500) -> int:
+    """
+    Recalcula os insights dos restaurantes informados (todos se None).
+
+    Returns:
+        int: Número de restaurantes atualizados
+    """
+    now = timezone.now()
+    restaurants = Restaurant.objects.select_related('profile').order_by('id')
+    if restaurant_ids is not None:
+        restaurant_ids = list(restaurant_ids)
+        restaurants = restaurants.filter(id__in=restaurant_ids)
+
+    counts = _window_counts(restaurant_ids, now)
+    seasonality = _seasonality(restaurant_ids, now)
+
+    fields = [
+        'reservations_30d', 'reservations_prev_30d', 'reservations_60_90d', 'no_shows_30d', 'no_show_rate',
+        'monthly_revenue', 'growth_rate', 'lift', 'projected_revenue', 'trend_direction', 'seasonality', 'computed_at',
+    ]
+    rows = [
+        RestaurantInsights(
+            restaurant_id=restaurant.id,
+            **_build(restaurant, counts.get(restaurant.id, {}), seasonality.get(restaurant.id), now),
+        )
+        for restaurant in restaurants.iterator(chunk_size=batch_size)
+    ]
+    # Upsert (INSERT ... ON CONFLICT (restaurant_id) DO UPDATE): um leitor pode ter
+    # criado o registro (_refresh_one) enquanto o job calculava
+    RestaurantInsights.objects.bulk_create(
+        rows, batch_size=batch_size, update_conflicts=True, unique_fields=['restaurant'], update_fields=fields,
+    )
+    return len(rows)
+
+
+def get_insights(restaurant: Restaurant, max_age_hours: Optional[float] = None) -> RestaurantInsights:
+    """
+    Insights do restaurante; recalcula se ausentes ou velhos demais.
+
+    Args:
+        restaurant: Restaurante do dono
+        max_age_hours: Idade máxima aceita (padrão INSIGHTS_MAX_AGE_HOURS)
+    """
+    if max_age_hours is None:
+        max_age_hours = getattr(settings, 'INSIGHTS_MAX_AGE_HOURS', 36)
+    max_age = timedelta(hours=max_age_hours)
+    insights = RestaurantInsights.objects.filter(restaurant=restaurant).first()
+    if insights is None or timezone.now() - insights.computed_at > max_age:
+        insights = _refresh_one(restaurant)
+    return insights
+
+
+def _refresh_one(restaurant: Restaurant) -> RestaurantInsights:
+    """
+    Recalcula os insights de um restaurante na leitura.
+
+    update_or_create em vez do bulk_create de refresh(): duas requisições
+    que leem o restaurante pela primeira vez ao mesmo tempo não colidem na
+    unicidade do OneToOne (a segunda relê a linha criada e a atualiza).
+    """
+    now = timezone.now()
+    values = _build(
+        restaurant,
+        _window_counts([restaurant.id], now).get(restaurant.id, {}),
+        _seasonality([restaurant.id], now).get(restaurant.id),
+        now,
+    )
+    insights, _ = RestaurantInsights.objects.update_or_create(restaurant=restaurant, defaults=values)
+    return insights
+
+
+def projection_summary(insights: RestaurantInsights) -> Dict:
+    """Projeção no formato usado pelo dashboard"""
+    return {
+        'next_month_revenue': insights.projected_revenue,
+        'growth_rate': insights.growth_rate,
+        'lift_factor': insights.lift,
+        'trend_direction': insights.trend_direction,
+    }
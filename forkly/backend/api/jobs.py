@@ -0,0 +1,336 @@
+"""
+Persistent background jobs for Forkly API.
+
+Jobs are rows of api.Job: views enqueue them (one INSERT, committed together
+with the rest of the request's writes) and `python manage.py run_job_worker`
+processes execute them.
+
+- Claiming is a conditional UPDATE (pending -> running), so any number of
+  workers can poll the same table; where the database supports
+  SKIP LOCKED, candidate rows are also locked so workers don't compete.
+- Failures are retried with exponential backoff (JOB_RETRY_BASE_SECONDS,
+  capped at JOB_RETRY_MAX_SECONDS) up to Job.max_attempts, then marked failed.
+- Jobs left running by a dead worker are released after
+  JOB_LOCK_TIMEOUT_SECONDS.
+- Batch handlers receive every claimed job of their kind at once: outbound
+  mail is sent over one connection that the worker keeps open between
+  batches (EMAIL_BACKEND; use the console or file backend locally).
+"""
+
+import logging
+import os
+import random
+import socket
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connections, router, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('api')
+
+PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+# kind -> (handler, batch)
+_handlers: Dict[str, tuple] = {}
+
+
+def handler(kind: str, batch: bool = False) -> Callable:
+    """
+    Register the handler of a job kind.
+
+    Args:
+        kind: Job.kind it executes
+        batch: If True the handler receives a list of payloads and returns one
+            result per payload (None or the exception it failed with);
+            otherwise it receives one payload and raises on failure
+    """
+    def decorator(func: Callable) -> Callable:
+        _handlers[kind] = (func, batch)
+        return func
+    return decorator
+
+
+# ----- enqueueing -----
+
+def _new_job(kind: str, payload: Dict, delay: float, max_attempts: Optional[int]) -> Job:
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind {kind!r}")
+    return Job(
+        kind=kind,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def enqueue(kind: str, payload: Dict, delay: float = 0, max_attempts: Optional[int] = None) -> Job:
+    """
+    Persist a job for the workers.
+
+    Args:
+        kind: Registered job kind
+        payload: JSON-serializable arguments of the handler
+        delay: Seconds before the job may run
+        max_attempts: Overrides JOB_MAX_ATTEMPTS
+
+    Returns:
+        Job: The saved job
+    """
+    job = _new_job(kind, payload, delay, max_attempts)
+    job.save()
+    return job
+
+
+async def aenqueue(kind: str, payload: Dict, delay: float = 0, max_attempts: Optional[int] = None) -> Job:
+    """Async variant of `enqueue`"""
+    job = _new_job(kind, payload, delay, max_attempts)
+    await job.asave()
+    return job
+
+
+def _email_payload(subject: str, message: str, recipients: Sequence[str], from_email: Optional[str]) -> Dict:
+    return {
+        'subject': subject,
+        'message': message,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'recipients': list(recipients),
+    }
+
+
+def enqueue_email(subject: str, message: str, recipients: Sequence[str], from_email: Optional[str] = None) -> Job:
+    """Queue a plain-text email (sent by the workers, never on the request path)"""
+    return enqueue('email', _email_payload(subject, message, recipients, from_email))
+
+
+async def aenqueue_email(subject: str, message: str, recipients: Sequence[str], from_email: Optional[str] = None) -> Job:
+    """Async variant of `enqueue_email`"""
+    return await aenqueue('email', _email_payload(subject, message, recipients, from_email))
+
+
+# ----- email -----
+
+class MailSender:
+    """
+    Sends email payloads over one backend connection, reused across batches.
+
+    The connection is reopened after an error (it may be broken) and closed
+    once idle for longer than `idle_timeout` seconds.
+    """
+
+    def __init__(self, idle_timeout: float = 60.0):
+        self.idle_timeout = idle_timeout
+        self._connection = None
+        self._used_at = 0.0
+        self.counters = {'sent': 0, 'errors': 0, 'connections_opened': 0}
+
+    def _open(self):
+        if self._connection is not None and time.monotonic() - self._used_at > self.idle_timeout:
+            self.close()
+        if self._connection is None:
+            connection = get_connection(fail_silently=False)
+            connection.open()
+            self._connection = connection
+            self.counters['connections_opened'] += 1
+        return self._connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+    def send(self, payloads: List[Dict]) -> List[Optional[Exception]]:
+        results: List[Optional[Exception]] = []
+        for index, payload in enumerate(payloads):
+            try:
+                connection = self._open()
+            except Exception as e:
+                # Server unreachable: fail the rest of the batch now instead of timing out on each
+                self.counters['errors'] += len(payloads) - index
+                results.extend([e] * (len(payloads) - index))
+                break
+            message = EmailMessage(payload['subject'], payload['message'], payload['from_email'],
+                                   payload['recipients'], connection=connection)
+            try:
+                message.send()
+                results.append(None)
+                self.counters['sent'] += 1
+            except Exception as e:
+                results.append(e)
+                self.counters['errors'] += 1
+                self.close()
+            self._used_at = time.monotonic()
+        return results
+
+
+_mail_sender: Optional[MailSender] = None
+
+
+def get_mail_sender() -> MailSender:
+    """Process-wide sender (each worker process holds its own connection)"""
+    global _mail_sender
+    if _mail_sender is None:
+        _mail_sender = MailSender(getattr(settings, 'EMAIL_CONNECTION_IDLE_SECONDS', 60))
+    return _mail_sender
+
+
+@handler('email', batch=True)
+def send_emails(payloads: List[Dict]) -> List[Optional[Exception]]:
+    return get_mail_sender().send(payloads)
+
+
+# ----- worker -----
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before attempt `attempts + 1`: base * 2^(attempts - 1), capped, with ±20% jitter"""
+    base = getattr(settings, 'JOB_RETRY_BASE_SECONDS', 30)
+    cap = getattr(settings, 'JOB_RETRY_MAX_SECONDS', 3600)
+    return min(cap, base * 2 ** max(0, attempts - 1)) * random.uniform(0.8, 1.2)
+
+
+class JobWorker:
+    """
+    Claims and executes due jobs.
+
+    Args:
+        worker_id: Stored in Job.locked_by (default host:pid)
+        batch_size: Max jobs claimed per round
+        kinds: Only claim these kinds (default: all registered)
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, batch_size: int = 50, kinds: Optional[List[str]] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.kinds = kinds
+        self.counters = {'claimed': 0, 'done': 0, 'retried': 0, 'failed': 0, 'released': 0, 'purged': 0, 'lost': 0}
+
+    def release_stale(self) -> int:
+        """Return jobs locked by dead workers to the queue"""
+        timeout = getattr(settings, 'JOB_LOCK_TIMEOUT_SECONDS', 300)
+        released = Job.objects.filter(
+            status=RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+        ).update(status=PENDING, locked_by='', locked_at=None)
+        if released:
+            logger.warning(f"Released {released} stale jobs")
+        self.counters['released'] += released
+        return released
+
+    def purge_finished(self) -> int:
+        """Delete finished jobs older than JOB_RETENTION_DAYS (failed ones are kept for inspection)"""
+        cutoff = timezone.now() - timedelta(days=getattr(settings, 'JOB_RETENTION_DAYS', 7))
+        purged, _ = Job.objects.filter(status=DONE, finished_at__lt=cutoff).delete()
+        self.counters['purged'] += purged
+        return purged
+
+    def claim(self) -> List[Job]:
+        now = timezone.now()
+        candidates = Job.objects.filter(status=PENDING, run_at__lte=now)
+        if self.kinds:
+            candidates = candidates.filter(kind__in=self.kinds)
+        candidates = candidates.order_by('run_at').values_list('id', flat=True)[:self.batch_size]
+
+        def mark(ids):
+            # Re-checks the status: rows another worker claimed in the meantime are skipped
+            return Job.objects.filter(id__in=ids, status=PENDING).update(
+                status=RUNNING, locked_by=self.worker_id, locked_at=now, attempts=F('attempts') + 1
+            )
+
+        using = router.db_for_write(Job)
+        if connections[using].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=using):
+                ids = list(candidates.select_for_update(skip_locked=True))
+                claimed = mark(ids) if ids else 0
+        else:
+            ids = list(candidates)
+            claimed = mark(ids) if ids else 0
+        if not claimed:
+            return []
+        jobs = list(Job.objects.filter(id__in=ids, status=RUNNING, locked_by=self.worker_id).order_by('run_at'))
+        self.counters['claimed'] += len(jobs)
+        return jobs
+
+    def _execute(self, kind: str, jobs: List[Job]) -> List[Optional[Exception]]:
+        if kind not in _handlers:
+            return [LookupError(f"No handler registered for job kind {kind!r}")] * len(jobs)
+        func, batch = _handlers[kind]
+        if batch:
+            try:
+                return func([job.payload for job in jobs])
+            except Exception as e:
+                return [e] * len(jobs)
+        results = []
+        for job in jobs:
+            try:
+                func(job.payload)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _finish(self, job: Job, error: Optional[Exception]) -> None:
+        now = timezone.now()
+        # Only while this worker still holds the lock: a job released as stale
+        # and claimed again by another worker is not overwritten
+        owned = Job.objects.filter(pk=job.pk, status=RUNNING, locked_by=self.worker_id)
+        if error is None:
+            if owned.update(status=DONE, locked_by='', locked_at=None, finished_at=now, last_error=''):
+                self.counters['done'] += 1
+            else:
+                self._lost(job)
+            return
+
+        message = f"{error.__class__.__name__}: {error}"[:2000]
+        if job.attempts < job.max_attempts:
+            delay = retry_delay(job.attempts)
+            if not owned.update(status=PENDING, locked_by='', locked_at=None,
+                                run_at=now + timedelta(seconds=delay), last_error=message):
+                self._lost(job)
+                return
+            self.counters['retried'] += 1
+            logger.warning(f"Job {job.kind} #{job.pk} attempt {job.attempts}/{job.max_attempts} failed, retry in {delay:.0f}s: {message}")
+        else:
+            if not owned.update(status=FAILED, locked_by='', locked_at=None, finished_at=now, last_error=message):
+                self._lost(job)
+                return
+            self.counters['failed'] += 1
+            logger.error(f"Job {job.kind} #{job.pk} failed after {job.attempts} attempts: {message}")
+
+    def _lost(self, job: Job) -> None:
+        self.counters['lost'] += 1
+        logger.warning(f"Job {job.kind} #{job.pk} lost its lock (released as stale?); result of {self.worker_id} dropped")
+
+    def run_once(self) -> int:
+        """
+        Claim and execute one batch.
+
+        Returns:
+            int: Jobs executed (0 when nothing was due)
+        """
+        jobs = self.claim()
+        by_kind = defaultdict(list)
+        for job in jobs:
+            by_kind[job.kind].append(job)
+        for kind, kind_jobs in by_kind.items():
+            for job, error in zip(kind_jobs, self._execute(kind, kind_jobs)):
+                self._finish(job, error)
+        return len(jobs)
+
+    def stats(self) -> Dict:
+        return {**self.counters, 'mail': dict(get_mail_sender().counters)}
+
+
+def queue_stats() -> Dict[str, int]:
+    """Jobs per status (pending ones split into due and scheduled)"""
+    counts = dict(Job.objects.values('status').annotate(n=Count('id')).values_list('status', 'n'))
+    counts['due'] = Job.objects.filter(status=PENDING, run_at__lte=timezone.now()).count()
+    return counts
@@ -0,0 +1,143 @@
+"""
+Async LLM client for Forkly AI services.
+
+Talks to any OpenAI-compatible `/chat/completions` endpoint (OpenAI itself or
+the local stub started with `python manage.py llm_stub`) without blocking a
+worker while the completion is generated. Requests go through the process-wide
+gateway (`api/llm_gateway.py`), which pools connections, enforces concurrency
+and rate limits and coalesces identical in-flight prompts.
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+from typing import AsyncIterator, Dict, List, Optional
+
+from django.conf import settings
+
+from .llm_gateway import LLMError, get_gateway
+
+logger = logging.getLogger('api')
+
+__all__ = ['AsyncLLMClient', 'LLMError', 'stream_text']
+
+
+class AsyncLLMClient:
+    """
+    Minimal async client for chat completions.
+
+    Concurrency is capped by the gateway worker pool (`LLM_MAX_CONCURRENCY`);
+    requests waiting longer than `LLM_QUEUE_TIMEOUT_SECONDS` in the gateway
+    queue fail fast so the caller can fall back to a deterministic answer.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, model: Optional[str] = None):
+        self.api_key = api_key
+        self.base_url = (base_url or getattr(settings, 'LLM_BASE_URL', 'https://api.openai.com/v1')).rstrip('/')
+        self.model = model or getattr(settings, 'LLM_MODEL', 'gpt-3.5-turbo')
+
+    @property
+    def limit_key(self) -> str:
+        """Key used by the gateway for per-key limits (never the raw API key)"""
+        return f"{self.model}:{hashlib.sha256((self.api_key or '').encode()).hexdigest()[:12]}"
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        return headers
+
+    def _payload(self, messages: List[Dict[str, str]], max_tokens: int, temperature: float, **extra) -> Dict:
+        return {
+            'model': self.model,
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature,
+            **extra,
+        }
+
+    async def chat(self, messages: List[Dict[str, str]], max_tokens: int = 500, temperature: float = 0.7) -> str:
+        """
+        Run a chat completion and return the assistant text.
+
+        Args:
+            messages: OpenAI-style message list
+            max_tokens: Completion token limit
+            temperature: Sampling temperature
+
+        Returns:
+            str: Assistant message content
+
+        Raises:
+            LLMError: On timeout, saturation, HTTP error or malformed response
+        """
+        gateway = get_gateway()
+        future = gateway.submit(
+            f'{self.base_url}/chat/completions',
+            self._headers(),
+            self._payload(messages, max_tokens, temperature),
+            self.limit_key,
+        )
+        # shield: a cancelled caller must not cancel a request shared with deduplicated callers
+        try:
+            data = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), gateway.caller_timeout)
+        except asyncio.TimeoutError:
+            gateway.abandon(future)
+            raise LLMError('LLM request timed out') from None
+        try:
+            return data['choices'][0]['message']['content'].strip()
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            logger.warning(f"LLM returned an unexpected payload: {e.__class__.__name__}: {e}")
+            raise LLMError(str(e)) from e
+
+    async def stream_chat(self, messages: List[Dict[str, str]], max_tokens: int = 500,
+                          temperature: float = 0.7) -> AsyncIterator[str]:
+        """
+        Run a streaming chat completion, yielding content deltas as they arrive.
+
+        The gateway worker slot is held until the stream ends (or the consumer
+        stops iterating).
+
+        Args:
+            messages: OpenAI-style message list
+            max_tokens: Completion token limit
+            temperature: Sampling temperature
+
+        Yields:
+            str: Assistant content deltas
+
+        Raises:
+            LLMError: On timeout, saturation, HTTP error or malformed chunk
+        """
+        stream = get_gateway().stream(
+            f'{self.base_url}/chat/completions',
+            self._headers(),
+            self._payload(messages, max_tokens, temperature, stream=True),
+            self.limit_key,
+        )
+        try:
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+
+
+async def stream_text(text: str, delay: float = 0.0) -> AsyncIterator[str]:
+    """
+    Stream an already-computed answer word by word.
+
+    Lets deterministic fallback answers go through the same streaming path
+    as LLM output.
+
+    Args:
+        text: Full answer
+        delay: Optional pause between chunks, in seconds
+
+    Yields:
+        str: Chunks that concatenate back to `text`
+    """
+    for chunk in re.findall(r'\s*\S+|\s+$', text):
+        yield chunk
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,378 @@
+"""
+In-process gateway for outbound LLM requests.
+
+Every AI chat call (async views, sync views through async_to_sync, management
+commands) is funnelled through one background event loop per process that
+owns a single pooled httpx client. Requests are queued and served by a fixed
+pool of worker coroutines, which gives:
+
+- connection reuse across all requests of the process;
+- a global concurrency cap (number of workers) and per-key concurrency and
+  rate limits (key = API key + model);
+- coalescing of identical in-flight prompts: concurrent callers with the same
+  payload share one upstream request;
+- queue depth, wait time and upstream latency metrics (`stats()`).
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger('api')
+
+
+class LLMError(Exception):
+    """Raised when the LLM call fails, times out or returns an unusable payload."""
+
+
+class _TokenBucket:
+    """Async token bucket (runs on the gateway loop only, so no locking needed)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class _Job:
+    __slots__ = ('url', 'headers', 'payload', 'limit_key', 'future', 'sink', 'enqueued_at', 'deadline', 'cancelled')
+
+    def __init__(self, url, headers, payload, limit_key, future, sink=None, queue_timeout=5.0):
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.limit_key = limit_key
+        self.future = future
+        self.sink = sink
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + queue_timeout
+        self.cancelled = False
+
+
+def _resolve(future: concurrent.futures.Future, result=None, error: Optional[Exception] = None) -> None:
+    """Set the outcome unless the future is already done (e.g. the caller timed out)"""
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except concurrent.futures.InvalidStateError:
+        pass
+
+
+def _percentile(samples, pct: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(pct * len(ordered)))] * 1000, 1)
+
+
+class LLMGateway:
+    """
+    Queue + worker pool in front of an OpenAI-compatible API.
+
+    Args:
+        workers: Worker coroutines (global in-flight cap)
+        max_queue: Queued requests beyond which new ones are rejected
+        key_concurrency: In-flight requests per key
+        key_rate: Requests per second per key (0 = unlimited)
+        queue_timeout: Max seconds a request may wait in the queue (including
+            the per-key concurrency and rate limits)
+        transport: httpx transport of the pooled client (default network
+            transport; tests pass an httpx.MockTransport)
+    """
+
+    def __init__(self, workers: int = 20, max_queue: int = 1000, key_concurrency: int = 20,
+                 key_rate: float = 0.0, queue_timeout: float = 5.0,
+                 timeout: float = 15.0, connect_timeout: float = 3.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.key_concurrency = key_concurrency
+        self.key_rate = key_rate
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.transport = transport
+
+        self._loop = None
+        self._queue = None
+        self._client = None
+        self._started = threading.Event()
+        self._start_lock = threading.Lock()
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._key_limits: Dict[str, tuple] = {}
+
+        self.counters = {
+            'submitted': 0, 'deduplicated': 0, 'completed': 0, 'failed': 0,
+            'rejected': 0, 'expired': 0, 'streams': 0,
+        }
+        self.active = 0
+        self._wait_times = deque(maxlen=2000)
+        self._latencies = deque(maxlen=2000)
+
+    # ----- lifecycle -----
+
+    def start(self) -> None:
+        """Start the gateway loop thread (idempotent)"""
+        if self._started.is_set():
+            return
+        with self._start_lock:
+            if self._started.is_set():
+                return
+            thread = threading.Thread(target=self._run, name='llm-gateway', daemon=True)
+            thread.start()
+            self._started.wait()
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers),
+            transport=self.transport,
+        )
+        for i in range(self.workers):
+            loop.create_task(self._worker(), name=f'llm-gateway-worker-{i}')
+        self._started.set()
+        loop.run_forever()
+
+    # ----- submission (any thread) -----
+
+    def _limits_for(self, key: str) -> tuple:
+        limits = self._key_limits.get(key)
+        if limits is None:
+            bucket = _TokenBucket(self.key_rate, max(1.0, self.key_rate)) if self.key_rate > 0 else None
+            limits = (asyncio.Semaphore(self.key_concurrency), bucket)
+            self._key_limits[key] = limits
+        return limits
+
+    def _enqueue(self, job: _Job) -> None:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters['rejected'] += 1
+            self._fail(job, LLMError('LLM gateway queue is full'))
+
+    def _fail(self, job: _Job, error: Exception) -> None:
+        if job.sink is not None:
+            job.sink(('error', error))
+        else:
+            _resolve(job.future, error=error)
+
+    @property
+    def caller_timeout(self) -> float:
+        """Upper bound a caller waits for a result: queue wait plus the upstream request"""
+        return self.queue_timeout + self.timeout
+
+    def submit(self, url: str, headers: Dict[str, str], payload: Dict, limit_key: str) -> concurrent.futures.Future:
+        """
+        Queue a non-streaming completion.
+
+        Identical in-flight requests (same URL, key and payload) share the
+        same future.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the parsed JSON response
+        """
+        self.start()
+        dedupe_key = hashlib.sha256(
+            json.dumps([url, limit_key, payload], sort_keys=True, default=str).encode()
+        ).hexdigest()
+        with self._inflight_lock:
+            self.counters['submitted'] += 1
+            existing = self._inflight.get(dedupe_key)
+            if existing is not None:
+                self.counters['deduplicated'] += 1
+                return existing
+            future = concurrent.futures.Future()
+            self._inflight[dedupe_key] = future
+
+        def release(_):
+            with self._inflight_lock:
+                if self._inflight.get(dedupe_key) is future:
+                    del self._inflight[dedupe_key]
+
+        future.add_done_callback(release)
+        job = _Job(url, headers, payload, limit_key, future, queue_timeout=self.queue_timeout)
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+        return future
+
+    def abandon(self, future: concurrent.futures.Future) -> None:
+        """
+        Fail a submitted request whose caller stopped waiting (e.g. timed out).
+
+        Resolving the future releases its deduplication entry, so later
+        identical prompts are sent upstream again.
+        """
+        _resolve(future, error=LLMError('LLM request abandoned by the caller'))
+
+    async def stream(self, url: str, headers: Dict[str, str], payload: Dict, limit_key: str) -> AsyncIterator[str]:
+        """
+        Queue a streaming completion and yield content deltas on the caller's loop.
+
+        Streams are never deduplicated. Closing the iterator early tells the
+        worker to stop reading from upstream.
+        """
+        self.start()
+        caller_loop = asyncio.get_running_loop()
+        channel = asyncio.Queue()
+
+        def sink(item):
+            caller_loop.call_soon_threadsafe(channel.put_nowait, item)
+
+        with self._inflight_lock:
+            self.counters['submitted'] += 1
+            self.counters['streams'] += 1
+        job = _Job(url, headers, payload, limit_key, None, sink=sink, queue_timeout=self.queue_timeout)
+        self._loop.call_soon_threadsafe(self._enqueue, job)
+        try:
+            while True:
+                try:
+                    kind, value = await asyncio.wait_for(channel.get(), self.caller_timeout)
+                except asyncio.TimeoutError:
+                    raise LLMError('LLM stream timed out') from None
+                if kind == 'delta':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            job.cancelled = True
+
+    # ----- workers (gateway loop) -----
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._serve(job)
+            except Exception as e:  # never let a worker die (nor leave the caller waiting)
+                logger.exception(f"LLM gateway worker error: {e}")
+                self._fail(job, LLMError(str(e)))
+            finally:
+                self._queue.task_done()
+
+    def _expired(self, job: _Job) -> bool:
+        """Fails the job if it waited past its deadline (or was abandoned by the caller)"""
+        if job.cancelled:
+            return True
+        if time.monotonic() > job.deadline:
+            self.counters['expired'] += 1
+            self._fail(job, LLMError('LLM request expired in queue'))
+            return True
+        return False
+
+    async def _serve(self, job: _Job) -> None:
+        if self._expired(job):
+            return
+
+        semaphore, bucket = self._limits_for(job.limit_key)
+        async with semaphore:
+            if bucket is not None:
+                await bucket.acquire()
+            # The per-key limits can hold a job well past its queue deadline
+            if self._expired(job):
+                return
+            started = time.monotonic()
+            self._wait_times.append(started - job.enqueued_at)
+            self.active += 1
+            try:
+                if job.sink is not None:
+                    await self._serve_stream(job)
+                else:
+                    response = await self._client.post(job.url, headers=job.headers, json=job.payload)
+                    response.raise_for_status()
+                    _resolve(job.future, result=response.json())
+                self.counters['completed'] += 1
+            except Exception as e:  # any failure must resolve the caller's future or stream
+                self.counters['failed'] += 1
+                logger.warning(f"LLM request failed: {e.__class__.__name__}: {e}")
+                self._fail(job, LLMError(str(e)))
+            finally:
+                self.active -= 1
+                self._latencies.append(time.monotonic() - started)
+
+    async def _serve_stream(self, job: _Job) -> None:
+        async with self._client.stream('POST', job.url, headers=job.headers, json=job.payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if job.cancelled:
+                    break
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                delta = json.loads(data)['choices'][0].get('delta', {}).get('content')
+                if delta:
+                    job.sink(('delta', delta))
+        job.sink(('end', None))
+
+    # ----- metrics -----
+
+    def stats(self) -> Dict:
+        """Counters, queue depth and wait/latency percentiles (ms)"""
+        waits = list(self._wait_times)
+        latencies = list(self._latencies)
+        return {
+            **self.counters,
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'active': self.active,
+            'in_flight_unique': len(self._inflight),
+            'workers': self.workers,
+            'wait_ms_p50': _percentile(waits, 0.5),
+            'wait_ms_p95': _percentile(waits, 0.95),
+            'latency_ms_p50': _percentile(latencies, 0.5),
+            'latency_ms_p95': _percentile(latencies, 0.95),
+        }
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Process-wide gateway configured from settings (created lazily, so it is fork-safe)"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway(
+                    workers=getattr(settings, 'LLM_MAX_CONCURRENCY', 20),
+                    max_queue=getattr(settings, 'LLM_GATEWAY_QUEUE_SIZE', 1000),
+                    key_concurrency=getattr(settings, 'LLM_KEY_MAX_CONCURRENCY', 20),
+                    key_rate=getattr(settings, 'LLM_KEY_RATE_PER_SECOND', 0.0),
+                    queue_timeout=getattr(settings, 'LLM_QUEUE_TIMEOUT_SECONDS', 5.0),
+                    timeout=getattr(settings, 'LLM_TIMEOUT_SECONDS', 15.0),
+                    connect_timeout=getattr(settings, 'LLM_CONNECT_TIMEOUT_SECONDS', 3.0),
+                )
+    return _gateway
+
+
+def stats() -> Dict:
+    return get_gateway().stats() if _gateway is not None else {'started': False}
@@ -0,0 +1,170 @@
+"""
+Buffered request logging for Forkly API.
+
+ForklyMiddleware only appends a compact tuple to an in-memory
+queue; a background thread drains it in batches and writes JSON lines to
+REQUEST_LOG_PATH, so no formatting or disk I/O happens on the request path.
+
+- 2xx/3xx responses are sampled (REQUEST_LOG_SAMPLE_RATE); errors are
+  always kept. Each line carries the sample rate so counts can be reweighted.
+- The queue is bounded (REQUEST_LOG_QUEUE_SIZE): when the writer falls
+  behind, new records are dropped and counted instead of blocking requests.
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from django.conf import settings
+
+logger = logging.getLogger('api')
+
+FIELDS = ('ts', 'method', 'path', 'status', 'ms', 'ip', 'ua')
+
+
+class RequestLogPipeline:
+    """
+    Bounded queue + background batch writer of request records.
+
+    Args:
+        path: JSON-lines output file
+        max_queue: Records held in memory before new ones are dropped
+        batch_size: Records per write (a full batch wakes the writer early)
+        flush_interval: Max seconds between writes
+        sample_rate: Fraction of non-error responses recorded (0-1)
+    """
+
+    def __init__(self, path: str, max_queue: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, sample_rate: float = 1.0):
+        self.path = path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        self.counters = {'accepted': 0, 'sampled_out': 0, 'dropped': 0, 'written': 0, 'batches': 0, 'write_errors': 0}
+
+    # ----- request path -----
+
+    def record(self, method: str, path: str, status: int, duration_ms: float,
+               ip: Optional[str], user_agent: Optional[str]) -> bool:
+        """
+        Queue one request record (never blocks).
+
+        Returns:
+            bool: True if the record was queued
+        """
+        if status < 400 and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.counters['sampled_out'] += 1
+            return False
+        if len(self._queue) >= self.max_queue:
+            self.counters['dropped'] += 1
+            return False
+
+        self._ensure_started()
+        self._queue.append((time.time(), method, path, status, round(duration_ms, 2), ip, user_agent))
+        self.counters['accepted'] += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    # ----- writer thread -----
+
+    def _ensure_started(self) -> None:
+        """Start the writer thread (lazily and again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run, name='request-log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _line(self, item) -> str:
+        record = dict(zip(FIELDS, item))
+        if record['ua']:
+            record['ua'] = record['ua'][:200]
+        if record['status'] < 400:
+            record['sample_rate'] = self.sample_rate
+        return json.dumps(record, separators=(',', ':'))
+
+    def flush(self) -> int:
+        """
+        Write everything queued so far, in batches.
+
+        Returns:
+            int: Records written
+        """
+        written = 0
+        with self._write_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write('\n'.join(self._line(item) for item in batch) + '\n')
+                except OSError as e:
+                    self.counters['write_errors'] += 1
+                    logger.error(f"Request log write failed, {len(batch)} records lost: {e}")
+                    continue
+                written += len(batch)
+                self.counters['written'] += len(batch)
+                self.counters['batches'] += 1
+        return written
+
+    # ----- metrics -----
+
+    def stats(self) -> Dict:
+        return {
+            **self.counters,
+            'queue_depth': len(self._queue),
+            'max_queue': self.max_queue,
+            'sample_rate': self.sample_rate,
+        }
+
+
+_pipeline: Optional[RequestLogPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> RequestLogPipeline:
+    """Process-wide pipeline configured from settings"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                path = getattr(settings, 'REQUEST_LOG_PATH', 'logs/requests.jsonl')
+                os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+                _pipeline = RequestLogPipeline(
+                    path,
+                    max_queue=getattr(settings, 'REQUEST_LOG_QUEUE_SIZE', 10000),
+                    batch_size=getattr(settings, 'REQUEST_LOG_BATCH_SIZE', 500),
+                    flush_interval=getattr(settings, 'REQUEST_LOG_FLUSH_INTERVAL', 1.0),
+                    sample_rate=getattr(settings, 'REQUEST_LOG_SAMPLE_RATE', 1.0),
+                )
+                atexit.register(_pipeline.flush)
+    return _pipeline
+
+
+def stats() -> Dict:
+    return get_pipeline().stats() if _pipeline is not None else {'started': False}
@@ -0,0 +1,42 @@
+import json
+import random
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from api.cache_backends import TieredCache, shared_cache_alias
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark cache reads of hot keys through the default cache vs. its shared (remote) tier"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keys", type=int, default=500, help="Distinct hot keys")
+        parser.add_argument("--reads", type=int, default=20000)
+        parser.add_argument("--prefix", type=str, default="social:friends:bench", help="Key prefix (must be a local prefix to hit memory)")
+
+    def _time(self, label, cache, keys, reads):
+        started = time.perf_counter()
+        for _ in range(reads):
+            cache.get(random.choice(keys))
+        per_call_us = (time.perf_counter() - started) / reads * 1e6
+        self.stdout.write(self.style.SUCCESS(f"{label:<40} {per_call_us:8.2f} µs/get"))
+
+    def handle(self, *args, **options):
+        cache = caches["default"]
+        remote_alias = shared_cache_alias("default")
+        keys = [f"{options['prefix']}:{i}" for i in range(options["keys"])]
+        value = {"friends": list(range(50)), "referred": list(range(5))}
+        cache.set_many({key: value for key in keys}, timeout=300)
+
+        self.stdout.write(f"{options['reads']} reads over {len(keys)} keys ({type(cache).__name__})")
+        if isinstance(cache, TieredCache):
+            cache.reset_stats()
+        self._time(f"default ({type(cache).__name__})", cache, keys, options["reads"])
+        if remote_alias != "default":
+            remote = caches[remote_alias]
+            self._time(f"{remote_alias} ({type(remote).__name__})", remote, keys, options["reads"])
+        if isinstance(cache, TieredCache):
+            self.stdout.write(json.dumps(cache.stats(), indent=2))
+        cache.delete_many(keys)
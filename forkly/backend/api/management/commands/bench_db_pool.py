@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import re
+import secrets
+import sys
+import tempfile
+import time
+
+import httpx
+from django.core.management.base import CommandError
+
+from api.management.commands.loadtest import Command as LoadTestCommand
+
+# Connection handling compared: env overrides for the gunicorn workers
+MODES = {
+    'direct': {'DB_POOL_ENABLED': 'False', 'DB_CONN_MAX_AGE': '0'},  # new connection per request
+    'persistent': {'DB_POOL_ENABLED': 'False', 'DB_CONN_MAX_AGE': '60'},  # one connection per thread
+    'pool': {'DB_POOL_ENABLED': 'True'},
+}
+
+
+class Command(LoadTestCommand):
+    help = (
+        "Load-test a DB-bound endpoint under gunicorn against PostgreSQL with and without the "
+        "psycopg connection pool; reports p50/p95/p99 and the pool wait/checkout metrics"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database-url", type=str, default=os.getenv('DATABASE_URL'),
+                            help="PostgreSQL URL (migrated, with seed_restaurants data)")
+        parser.add_argument("--modes", type=str, default="direct,persistent,pool")
+        parser.add_argument("--server-mode", type=str, default="asgi", help="wsgi or asgi")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per mode")
+        parser.add_argument("--pool-size", type=int, default=None,
+                            help="DB_POOL_MAX_SIZE per worker (default: derived from ASGI_SYNC_VIEW_CONCURRENCY)")
+        parser.add_argument("--path", type=str, default="/api/nearby/?lat=-23.56&lng=-46.65&radius=50000")
+        parser.add_argument("--port", type=int, default=8811)
+
+    async def _hammer(self, url, options):
+        latencies, errors = [], 0
+        deadline = time.monotonic() + options["duration"]
+        limits = httpx.Limits(max_connections=options["concurrency"], max_keepalive_connections=options["concurrency"])
+
+        async def client_loop(client):
+            nonlocal errors
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    ok = (await client.get(url)).status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[client_loop(client) for _ in range(options["concurrency"])])
+            return latencies, errors, time.perf_counter() - started
+
+    def _pool_summary(self, metrics_text):
+        """Mean pool wait and checkout time from the /metrics exposition"""
+        values = dict(re.findall(r'^(forkly_db_pool_\w+?_(?:sum|count))\{database="default"\} (\S+)$', metrics_text, re.M))
+        summary = []
+        for phase in ('wait', 'checkout'):
+            count = float(values.get(f"forkly_db_pool_{phase}_seconds_count", 0))
+            if count:
+                total = float(values[f"forkly_db_pool_{phase}_seconds_sum"])
+                summary.append(f"{phase} avg={total / count * 1000:.2f}ms (n={count:.0f})")
+        return ', '.join(summary)
+
+    def handle(self, *args, **options):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        if not (options["database_url"] or '').startswith(('postgres://', 'postgresql://')):
+            raise CommandError("--database-url (or DATABASE_URL) must point at PostgreSQL")
+
+        bind = f"127.0.0.1:{options['port']}"
+        self.stdout.write(
+            f"{options['concurrency']} clients, {options['duration']:.0f}s per mode, {options['workers']} "
+            f"{options['server_mode']} workers, GET {options['path']}"
+        )
+        for mode in options["modes"].split(','):
+            mode = mode.strip()
+            if mode not in MODES:
+                raise CommandError(f"Unknown mode {mode!r} (choose from {', '.join(MODES)})")
+            metrics_token = secrets.token_hex(16)
+            with tempfile.TemporaryDirectory() as metrics_dir:
+                env = {
+                    **os.environ, **MODES[mode],
+                    'DATABASE_URL': options["database_url"],
+                    'SERVER_MODE': options["server_mode"],
+                    'BIND': bind,
+                    'WEB_CONCURRENCY': str(options["workers"]),
+                    'RATE_LIMIT_ENABLED': 'False',
+                    'REQUEST_LOG_ENABLED': 'False',
+                    'METRICS_DIR': metrics_dir,
+                    'METRICS_TOKEN': metrics_token,
+                }
+                if options["pool_size"]:
+                    env['DB_POOL_MAX_SIZE'] = str(options["pool_size"])
+                server = self._start([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env)
+                try:
+                    url = f"http://{bind}{options['path']}"
+                    self._wait_ready(url, server)
+                    latencies, errors, elapsed = asyncio.run(self._hammer(url, options))
+                    pool_summary = self._pool_summary(httpx.get(
+                        f"http://{bind}/metrics", headers={'Authorization': f'Bearer {metrics_token}'}, timeout=10.0
+                    ).text)
+                finally:
+                    self._stop(server)
+
+            self.stdout.write(self.style.SUCCESS(
+                f"[{mode:<10}] {len(latencies) / elapsed:7.1f} req/s  "
+                f"p50={self._percentile(latencies, 0.5):6.1f}ms  p95={self._percentile(latencies, 0.95):6.1f}ms  "
+                f"p99={self._percentile(latencies, 0.99):6.1f}ms  errors={errors}"
+            ))
+            if pool_summary:
+                self.stdout.write(f"    pool: {pool_summary}")
@@ -0,0 +1,146 @@
+import asyncio
+import math
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory
+from django.utils.deprecation import MiddlewareMixin
+from ipware import get_client_ip
+
+from api.logging_pipeline import RequestLogPipeline
+from api.middleware import ForklyMiddleware
+from api.ratelimit import Limit, LocalTokenBuckets, RateLimiter
+
+
+# Original middleware stack (four MiddlewareMixin classes), kept for comparison
+
+class LegacyRateLimitMiddleware(MiddlewareMixin):
+    limiter = None
+
+    def process_request(self, request):
+        if request.path.startswith('/admin/') or request.path.startswith('/static/'):
+            return None
+        client_ip, _ = get_client_ip(request)
+        request.client_ip = client_ip
+        if not client_ip:
+            return None
+        decision = self.limiter.hit(client_ip, request.path)
+        if decision.allowed:
+            return None
+        retry_after = max(1, math.ceil(decision.retry_after))
+        response = JsonResponse({'error': 'Rate limit exceeded', 'retry_after': retry_after}, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+
+
+class LegacyRequestLoggingMiddleware(MiddlewareMixin):
+    pipeline = None
+
+    def process_request(self, request):
+        request._log_started = time.perf_counter()
+
+    def process_response(self, request, response):
+        started = getattr(request, '_log_started', None)
+        duration_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+        client_ip = getattr(request, 'client_ip', None) or get_client_ip(request)[0]
+        self.pipeline.record(request.method, request.path, response.status_code, duration_ms,
+                             client_ip, request.META.get('HTTP_USER_AGENT'))
+        return response
+
+
+class LegacySecurityHeadersMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        response['X-Content-Type-Options'] = 'nosniff'
+        response['X-Frame-Options'] = 'DENY'
+        response['X-XSS-Protection'] = '1; mode=block'
+        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
+        if not request.path.startswith('/admin/'):
+            csp = (
+                "default-src 'self'; "
+                "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+                "style-src 'self' 'unsafe-inline'; "
+                "img-src 'self' data: https:; "
+                "font-src 'self' data:; "
+                "connect-src 'self'; "
+                "frame-ancestors 'none';"
+            )
+            response['Content-Security-Policy'] = csp
+        return response
+
+
+class LegacyAPIVersionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        response['X-API-Version'] = '1.0'
+        response['X-Server'] = 'Forkly-API'
+        return response
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark the per-request overhead of the middleware stack (original four classes vs. ForklyMiddleware)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--ips", type=int, default=1000, help="Distinct client identities")
+
+    def _requests(self, iterations, ips):
+        factory = RequestFactory()
+        return [
+            factory.get('/api/restaurants/nearby/', HTTP_USER_AGENT='Mozilla/5.0 (bench)',
+                        REMOTE_ADDR=f"10.0.{(i % ips) // 256}.{i % 256}")
+            for i in range(iterations)
+        ]
+
+    def _report(self, label, elapsed, iterations):
+        self.stdout.write(self.style.SUCCESS(f"{label:<36} {elapsed / iterations * 1e6:8.2f} µs/request"))
+
+    def handle(self, *args, **options):
+        iterations, ips = options["iterations"], options["ips"]
+        # Generous limits so every request goes all the way through the stack
+        limiter = RateLimiter([Limit(1e9, 60, 10 ** 9)], [], LocalTokenBuckets())
+
+        with tempfile.TemporaryDirectory() as tmp:
+            pipeline = RequestLogPipeline(os.path.join(tmp, 'requests.jsonl'), max_queue=10 ** 7)
+            LegacyRateLimitMiddleware.limiter = limiter
+            LegacyRequestLoggingMiddleware.pipeline = pipeline
+
+            def legacy_stack(view):
+                return LegacyRateLimitMiddleware(LegacyRequestLoggingMiddleware(
+                    LegacySecurityHeadersMiddleware(LegacyAPIVersionMiddleware(view))
+                ))
+
+            def forkly_stack(view):
+                middleware = ForklyMiddleware(view)
+                middleware.rate_limit_enabled, middleware.limiter = True, limiter
+                middleware.log_enabled, middleware.pipeline = True, pipeline
+                return middleware
+
+            def view(request):
+                return HttpResponse(b'{}', content_type='application/json')
+
+            async def async_view(request):
+                return HttpResponse(b'{}', content_type='application/json')
+
+            self.stdout.write(f"{iterations} requests over {ips} IPs")
+            for label, build in (("original stack (sync)", legacy_stack), ("ForklyMiddleware (sync)", forkly_stack)):
+                handler = build(view)
+                requests = self._requests(iterations, ips)
+                started = time.perf_counter()
+                for request in requests:
+                    handler(request)
+                self._report(label, time.perf_counter() - started, iterations)
+
+            for label, build in (("original stack (async)", legacy_stack), ("ForklyMiddleware (async)", forkly_stack)):
+                handler = build(async_view)
+                requests = self._requests(iterations, ips)
+
+                async def run():
+                    started = time.perf_counter()
+                    for request in requests:
+                        await handler(request)
+                    return time.perf_counter() - started
+
+                self._report(label, asyncio.run(run()), iterations)
+            pipeline.flush()
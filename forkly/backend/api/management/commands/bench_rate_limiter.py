@@ -0,0 +1,48 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from api.ratelimit import LocalTokenBuckets, RateLimiter, get_rate_limiter
+
+
+def legacy_hit(key, requests_per_minute=60, burst_size=10):
+    """Original RateLimitMiddleware logic (cache.get + cache.set of a dict), kept for comparison"""
+    now = time.time()
+    bucket = cache.get(key, {'tokens': burst_size, 'last_update': now})
+    bucket['tokens'] = min(burst_size, bucket['tokens'] + (now - bucket['last_update']) * (requests_per_minute / 60.0))
+    bucket['last_update'] = now
+    if bucket['tokens'] >= 1:
+        bucket['tokens'] -= 1
+        cache.set(key, bucket, timeout=3600)
+        return True
+    return False
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark the per-request overhead of the rate limiter (configured store vs. legacy get/set)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--ips", type=int, default=1000, help="Distinct client identities")
+        parser.add_argument("--path", type=str, default="/api/ai/chat/send/", help="Path used to pick limit tiers")
+
+    def _time(self, label, fn, iterations, ips):
+        started = time.perf_counter()
+        for i in range(iterations):
+            fn(f"10.0.{(i % ips) // 256}.{i % 256}")
+        per_call_us = (time.perf_counter() - started) / iterations * 1e6
+        self.stdout.write(self.style.SUCCESS(f"{label:<40} {per_call_us:8.2f} µs/request"))
+
+    def handle(self, *args, **options):
+        iterations, ips, path = options["iterations"], options["ips"], options["path"]
+        limiter = get_rate_limiter()
+        store_name = type(limiter.store).__name__
+        buckets = len(limiter.buckets_for("bench", path))
+        self.stdout.write(f"{iterations} requests over {ips} IPs, path {path} ({buckets} buckets per request)")
+
+        self._time(f"limiter ({store_name})", lambda ip: limiter.hit(ip, path), iterations, ips)
+        if store_name != LocalTokenBuckets.__name__:
+            local = RateLimiter(limiter.default_limits, limiter.rules, LocalTokenBuckets())
+            self._time("limiter (LocalTokenBuckets)", lambda ip: local.hit(ip, path), iterations, ips)
+        self._time("legacy cache.get + cache.set", lambda ip: legacy_hit(f"bench_legacy:{ip}"), iterations, ips)
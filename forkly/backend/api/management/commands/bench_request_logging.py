@@ -0,0 +1,88 @@
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from ipware import get_client_ip
+
+from api.logging_pipeline import RequestLogPipeline
+from api.middleware import ForklyMiddleware
+
+
+def make_legacy_logger(path):
+    """Logger configured like settings.LOGGING's 'file' handler (console left out)"""
+    legacy = logging.getLogger('bench.legacy_request_log')
+    legacy.handlers = []
+    legacy.propagate = False
+    legacy.setLevel(logging.INFO)
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter(settings.LOGGING['formatters']['verbose']['format'], style='{'))
+    legacy.addHandler(handler)
+    return legacy
+
+
+def legacy_log(legacy, request, response):
+    """Original RequestLoggingMiddleware logic (synchronous f-string lines), kept for comparison"""
+    client_ip, _ = get_client_ip(request)
+    user_agent = request.META.get('HTTP_USER_AGENT', 'Unknown')
+    legacy.info(f"Request: {request.method} {request.path} from {client_ip} - {user_agent}")
+    if request.path in ['/api/auth/login/', '/api/auth/register/']:
+        legacy.info(f"Authentication attempt from {client_ip}")
+    if response.status_code >= 400:
+        legacy.warning(f"Error response: {response.status_code} for {request.path}")
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark the per-request overhead of request logging (legacy synchronous lines vs. buffered pipeline)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("--sample-rate", type=float, default=1.0, help="Pipeline sample rate for 2xx responses")
+
+    def _time(self, label, fn, requests):
+        started = time.perf_counter()
+        for request, response in requests:
+            fn(request, response)
+        per_call_us = (time.perf_counter() - started) / len(requests) * 1e6
+        self.stdout.write(self.style.SUCCESS(f"{label:<40} {per_call_us:8.2f} µs/request"))
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        paths = ['/api/restaurants/nearby/', '/api/auth/login/', '/api/gamification/stats/', '/api/ai/chat/send/']
+        requests = []
+        for i in range(options["iterations"]):
+            request = factory.get(paths[i % len(paths)], HTTP_USER_AGENT='Mozilla/5.0 (bench)', REMOTE_ADDR=f'10.0.0.{i % 250}')
+            requests.append((request, HttpResponse(status=500 if i % 50 == 0 else 200)))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            legacy = make_legacy_logger(os.path.join(tmp, 'legacy.log'))
+            self._time("legacy (sync FileHandler)", lambda req, resp: legacy_log(legacy, req, resp), requests)
+            for handler in legacy.handlers:
+                handler.close()
+
+            middleware = ForklyMiddleware(lambda request: None)
+            middleware.pipeline = RequestLogPipeline(
+                os.path.join(tmp, 'requests.jsonl'), max_queue=2 * len(requests), sample_rate=options["sample_rate"]
+            )
+
+            def pipelined(request, response):
+                started = time.perf_counter()
+                request.client_ip = get_client_ip(request)[0]
+                middleware.log_request(request, response, started)
+
+            self._time("pipeline (resolves client IP)", pipelined, requests)
+
+            def pipelined_shared_ip(request, response):
+                # ForklyMiddleware resolves the IP once for rate limiting and logging
+                middleware.log_request(request, response, time.perf_counter())
+
+            self._time("pipeline (IP already resolved)", pipelined_shared_ip, requests)
+            started = time.perf_counter()
+            middleware.pipeline.flush()
+            self.stdout.write(f"final flush {(time.perf_counter() - started) * 1000:.1f} ms (off the request path)")
+            self.stdout.write(json.dumps(middleware.pipeline.stats(), indent=2))
@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+
+from api.management.commands.loadtest import Command as LoadTestCommand
+from api.models import Restaurant
+
+READ_PATHS = ('/api/nearby/?lat=-23.56&lng=-46.65&radius=50000', '/api/gamification/stats/')
+
+
+class Command(LoadTestCommand):
+    help = (
+        "Load-test mixed read/write API traffic under gunicorn on a copy of the SQLite database, "
+        "with the default rollback journal and with the WAL/pragma tuning (SQLITE_TUNING_ENABLED)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", type=str, default="journal,tuned", help="journal (untuned) and/or tuned")
+        parser.add_argument("--server-mode", type=str, default="wsgi", help="wsgi or asgi")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per mode")
+        parser.add_argument("--write-share", type=float, default=0.3, help="Fraction of requests that post a review")
+        parser.add_argument("--port", type=int, default=8812)
+
+    def _copy_database(self, source, target, tuned):
+        """Consistent copy of the database; the untuned copy goes back to the rollback journal
+        (journal_mode is stored in the file, the tuned workers switch it to WAL themselves)"""
+        src, dst = sqlite3.connect(source), sqlite3.connect(target)
+        try:
+            src.backup(dst)
+            if not tuned:
+                dst.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            src.close()
+            dst.close()
+
+    async def _traffic(self, base_url, token, user_id, restaurant_ids, options):
+        results = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        deadline = time.monotonic() + options["duration"]
+        limits = httpx.Limits(max_connections=options["concurrency"], max_keepalive_connections=options["concurrency"])
+
+        async def client_loop(client, rng):
+            while time.monotonic() < deadline:
+                write = rng.random() < options["write_share"]
+                kind = 'write' if write else 'read'
+                started = time.perf_counter()
+                try:
+                    if write:
+                        response = await client.post('/api/reviews/', json={
+                            'restaurant': rng.choice(restaurant_ids), 'user': user_id,
+                            'rating': rng.randint(1, 5), 'text': 'bench',
+                        })
+                    else:
+                        response = await client.get(rng.choice(READ_PATHS))
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    results[kind].append(time.perf_counter() - started)
+                else:
+                    errors[kind] += 1
+
+        headers = {'Authorization': f'Bearer {token}'}
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60.0) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[client_loop(client, random.Random(i)) for i in range(options["concurrency"])])
+            return results, errors, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        database = settings.DATABASES['default']
+        if 'sqlite3' not in database['ENGINE']:
+            raise CommandError("The default database is not SQLite")
+        token = self._token()
+        user_id = User.objects.get(username='loadtest').id
+        restaurant_ids = list(Restaurant.objects.values_list('id', flat=True))
+        if not restaurant_ids:
+            raise CommandError("No restaurants; run 'python manage.py seed_restaurants' first")
+
+        bind = f"127.0.0.1:{options['port']}"
+        self.stdout.write(
+            f"{options['concurrency']} clients, {options['duration']:.0f}s per mode, {options['workers']} "
+            f"{options['server_mode']} workers, {options['write_share']:.0%} writes (POST /api/reviews/)"
+        )
+        for mode in options["modes"].split(','):
+            mode = mode.strip()
+            if mode not in ('journal', 'tuned'):
+                raise CommandError(f"Unknown mode {mode!r} (journal or tuned)")
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'db.sqlite3')
+                self._copy_database(str(database['NAME']), path, tuned=mode == 'tuned')
+                env = {
+                    **os.environ,
+                    'DATABASE_URL': f"sqlite:///{path}",
+                    'SQLITE_TUNING_ENABLED': str(mode == 'tuned'),
+                    'SERVER_MODE': options["server_mode"],
+                    'BIND': bind,
+                    'WEB_CONCURRENCY': str(options["workers"]),
+                    'RATE_LIMIT_ENABLED': 'False',
+                    'REQUEST_LOG_ENABLED': 'False',
+                }
+                server = self._start([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env)
+                try:
+                    self._wait_ready(f"http://{bind}{READ_PATHS[0]}", server)
+                    results, errors, elapsed = asyncio.run(
+                        self._traffic(f"http://{bind}", token, user_id, restaurant_ids, options)
+                    )
+                finally:
+                    self._stop(server)
+
+            total = sum(len(v) for v in results.values())
+            self.stdout.write(self.style.SUCCESS(f"[{mode}] {total / elapsed:7.1f} req/s total"))
+            for kind in ('read', 'write'):
+                latencies = results[kind]
+                self.stdout.write(
+                    f"    {kind:<6} {len(latencies) / elapsed:7.1f} req/s  "
+                    f"p50={self._percentile(latencies, 0.5):6.1f}ms  p95={self._percentile(latencies, 0.95):6.1f}ms  "
+                    f"p99={self._percentile(latencies, 0.99):6.1f}ms  errors={errors[kind]}"
+                )
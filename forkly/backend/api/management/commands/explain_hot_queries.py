@@ -0,0 +1,86 @@
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from api.insights import DONE_STATUSES
+from api.models import (
+    AIConversation, Friendship, Profile, Referral, Reservation, Restaurant, RewardLedger, UserAchievement,
+)
+
+# Index use in EXPLAIN output: SQLite ("SEARCH t USING INDEX i", "SCAN t USING COVERING INDEX i")
+# and PostgreSQL ("Index Scan using i on t", "Index Only Scan using i", "Bitmap Index Scan on i")
+INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX (\w+)|Index (?:Only )?Scan (?:Backward )?using (\w+)|Bitmap Index Scan on (\w+)')
+FULL_SCAN_RE = re.compile(r'^\W*SCAN (\w+)(?! USING)|Seq Scan on (\w+)', re.M)
+
+
+def hot_queries(user_id, restaurant_id, now):
+    """(view, expected index, queryset) for the hot filters, written as the views write them"""
+    return [
+        ('referred_friends_view', 'friendship_user_referred_idx',
+         Friendship.objects.filter(user_id=user_id, is_referred=True)),
+        ('gamification_stats_view (referrals)', 'referral_inviter_status_idx',
+         Referral.objects.filter(inviter_id=user_id, status='registered').values('id')),
+        ('create_review (first review)', 'referral_invitee_status_idx',
+         Referral.objects.filter(invitee_id=user_id, status='registered').order_by('-created_at')[:1]),
+        ('RestaurantAnalytics.update_stats', 'reservation_rest_status_idx',
+         # .count(): no ORDER BY and no columns outside the index
+         Reservation.objects.filter(restaurant_id=restaurant_id, status__in=DONE_STATUSES).order_by().values('status')),
+        ('gamification_ledger_view', 'ledger_user_created_idx',
+         RewardLedger.objects.filter(user_id=user_id).order_by('-created_at')),
+        ('notifications_feed_view', 'userach_user_unlocked_idx',
+         UserAchievement.objects.filter(user_id=user_id, unlocked_at__gte=now - timedelta(days=30)).order_by('-unlocked_at')),
+        ('get_ai_conversations_view', 'aiconv_user_active_idx',
+         AIConversation.objects.filter(user_id=user_id, is_active=True).order_by('-updated_at')),
+        ('leaderboard_view (points)', 'profile_points_idx',
+         Profile.objects.order_by('-points')[:20]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN the hot queries of the API views and check that each one is served by an index (fails on full scans)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verbose-plans", action="store_true", help="Print the full plan of every query")
+        parser.add_argument("--no-seqscan", action="store_true",
+                            help="PostgreSQL: SET enable_seqscan = off, so small dev tables (where a "
+                                 "sequential scan is cheaper) still show whether the index is usable")
+        parser.add_argument("--analyze", action="store_true", help="PostgreSQL: EXPLAIN ANALYZE (runs the queries)")
+
+    def handle(self, *args, **options):
+        postgres = connection.vendor == 'postgresql'
+        if options["no_seqscan"] and postgres:
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        explain_options = {'analyze': True} if options["analyze"] and postgres else {}
+
+        user_id = Profile.objects.order_by('-points').values_list('user_id', flat=True).first() or \
+            User.objects.values_list('id', flat=True).first() or 0
+        restaurant_id = Restaurant.objects.values_list('id', flat=True).first() or 0
+        self.stdout.write(f"{connection.vendor}, sample user={user_id} restaurant={restaurant_id}")
+
+        misses = []
+        for view, expected, queryset in hot_queries(user_id, restaurant_id, timezone.now()):
+            plan = queryset.explain(**explain_options)
+            used = [name for match in INDEX_RE.findall(plan) for name in match if name]
+            table = queryset.model._meta.db_table
+            full_scan = any(table in match for match in FULL_SCAN_RE.findall(plan))
+            if expected in used:
+                self.stdout.write(self.style.SUCCESS(f"[ok]    {view:<40} {expected}"))
+            elif used and not full_scan:
+                # Another index won on this data (e.g. the plain FK index on a tiny table)
+                self.stdout.write(self.style.WARNING(f"[index] {view:<40} {', '.join(used)} (expected {expected})"))
+            else:
+                misses.append(view)
+                self.stdout.write(self.style.ERROR(f"[scan]  {view:<40} full scan of {table} (expected {expected})"))
+            if options["verbose_plans"] or expected not in used:
+                for line in plan.splitlines():
+                    self.stdout.write(f"          {line}")
+
+        if misses:
+            raise CommandError(f"{len(misses)} hot queries scan the whole table (not migrated? on small "
+                               "PostgreSQL tables the planner prefers scans: try --no-seqscan)")
+        self.stdout.write(self.style.SUCCESS("All hot queries are served by an index"))
@@ -0,0 +1,55 @@
+import asyncio
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.llm_client import AsyncLLMClient, LLMError
+from api.llm_gateway import get_gateway
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire a burst of chat completions through the LLM gateway and print its metrics "
+        "(run 'python manage.py llm_stub' first and point --base-url at it)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", type=str, default="http://127.0.0.1:8808/v1")
+        parser.add_argument("--api-key", type=str, default="stub")
+        parser.add_argument("--requests", type=int, default=500, help="Total requests")
+        parser.add_argument("--distinct", type=int, default=50, help="Distinct prompts (the rest are duplicates)")
+        parser.add_argument("--spread", type=float, default=1.0, help="Seconds over which requests arrive")
+
+    def handle(self, *args, **options):
+        client = AsyncLLMClient(api_key=options["api_key"], base_url=options["base_url"])
+        prompts = [f"pergunta {i}" for i in range(options["distinct"])]
+
+        async def one(delay):
+            await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                await client.chat([{"role": "user", "content": random.choice(prompts)}], temperature=0)
+                return time.perf_counter() - started, None
+            except LLMError as e:
+                return time.perf_counter() - started, str(e)
+
+        async def burst():
+            return await asyncio.gather(*[
+                one(random.uniform(0, options["spread"])) for _ in range(options["requests"])
+            ])
+
+        started = time.perf_counter()
+        results = asyncio.run(burst())
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(r[0] for r in results)
+        errors = [r[1] for r in results if r[1]]
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(results)} requests in {elapsed:.2f}s, errors={len(errors)}, "
+            f"client p50={p50:.0f}ms p95={p95:.0f}ms"
+        ))
+        self.stdout.write(json.dumps(get_gateway().stats(), indent=2))
@@ -0,0 +1,108 @@
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions stub with configurable latency (supports `stream: true`)."""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.5
+    token_delay = 0.02
+    fail_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply_text(self, payload):
+        last = payload.get('messages', [{}])[-1].get('content', '')
+        return f"[stub:{payload.get('model', 'stub')}] {last.strip()[:200]}"
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+
+        time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self.send_error(503, 'stub failure')
+            return
+
+        if payload.get('stream'):
+            self._stream(payload)
+            return
+
+        body = json.dumps({
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'model': payload.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': self._reply_text(payload)},
+                'finish_reason': 'stop',
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, payload):
+        """Server-sent events in the OpenAI `chat.completion.chunk` format, one word per chunk"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send(data):
+            event = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(event):X}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+
+        words = self._reply_text(payload).split(' ')
+        for i, word in enumerate(words):
+            delta = word if i == 0 else f" {word}"
+            send(json.dumps({
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion.chunk',
+                'model': payload.get('model', 'stub'),
+                'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}],
+            }))
+            time.sleep(self.token_delay)
+        send('[DONE]')
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class Command(BaseCommand):
+    help = "Run a local OpenAI-compatible stub LLM server (point LLM_BASE_URL at http://HOST:PORT/v1)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", type=str, default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8808)
+        parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before answering")
+        parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+        parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with HTTP 503")
+
+    def handle(self, *args, **options):
+        StubLLMHandler.latency = options["latency"]
+        StubLLMHandler.token_delay = options["token_delay"]
+        StubLLMHandler.fail_rate = options["fail_rate"]
+        server = ThreadingHTTPServer((options["host"], options["port"]), StubLLMHandler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Stub LLM listening on http://{options['host']}:{options['port']}/v1 "
+            f"(latency={options['latency']}s, fail_rate={options['fail_rate']})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import httpx
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.models import Profile, Tier, UserTier
+
+
+def _children(pid):
+    """PIDs of the process tree rooted at `pid` (from /proc)"""
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # "pid (comm) state ppid ..." - comm may contain spaces
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(parents.get(current, []))
+    return tree
+
+
+def _rss_mb(pid):
+    total = 0
+    for child in _children(pid):
+        try:
+            with open(f'/proc/{child}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total / 1024
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the backend under gunicorn in WSGI and ASGI mode (AI chat against the stub LLM "
+        "plus a sync ORM endpoint) and compare throughput, latency and memory"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--modes", type=str, default="wsgi,asgi")
+        parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers per mode")
+        parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per mode")
+        parser.add_argument("--chat-share", type=float, default=0.5, help="Fraction of requests sent to the AI chat")
+        parser.add_argument("--llm-latency", type=float, default=0.5, help="Stub LLM latency (seconds)")
+        parser.add_argument("--port", type=int, default=8810)
+        parser.add_argument("--stub-port", type=int, default=8808)
+
+    # ----- setup -----
+
+    def _token(self):
+        user, _ = User.objects.get_or_create(username='loadtest', defaults={'email': 'loadtest@forkly.local'})
+        Profile.objects.get_or_create(user=user, defaults={'referral_code': 'LOADTEST'})
+        if not UserTier.objects.filter(user=user).exists():
+            tier = Tier.objects.order_by('min_referrals').first() or Tier.objects.create(name='Bronze', min_referrals=0)
+            UserTier.objects.create(user=user, tier=tier)
+        return str(RefreshToken.for_user(user).access_token)
+
+    def _start(self, args, env):
+        return subprocess.Popen(args, env=env, cwd=settings.BASE_DIR,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _stop(self, process):
+        if process.poll() is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def _wait_ready(self, url, process, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with code {process.returncode}")
+            try:
+                httpx.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise CommandError(f"Server not ready after {timeout:.0f}s: {url}")
+
+    # ----- load -----
+
+    async def _load(self, base_url, token, options):
+        results = {'chat': [], 'sync': []}
+        errors = {'chat': 0, 'sync': 0}
+        headers = {'Authorization': f'Bearer {token}'}
+        deadline = time.monotonic() + options["duration"]
+        limits = httpx.Limits(max_connections=options["concurrency"], max_keepalive_connections=options["concurrency"])
+
+        async def client_loop(index, client):
+            sent = 0
+            while time.monotonic() < deadline:
+                # Deterministic mix per client; unique messages so nothing is served from cache
+                chat = (sent * options["concurrency"] + index) % 100 < options["chat_share"] * 100
+                kind = 'chat' if chat else 'sync'
+                started = time.perf_counter()
+                try:
+                    if chat:
+                        response = await client.post('/api/ai/chat/send/', json={'message': f'sugestão {uuid.uuid4().hex}'})
+                    else:
+                        response = await client.get('/api/gamification/stats/')
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    results[kind].append(time.perf_counter() - started)
+                else:
+                    errors[kind] += 1
+                sent += 1
+
+        async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60.0) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*[client_loop(i, client) for i in range(options["concurrency"])])
+            elapsed = time.perf_counter() - started
+        return results, errors, elapsed
+
+    def _run_mode(self, mode, token, options, env):
+        bind = f"127.0.0.1:{options['port']}"
+        env = {**env, 'SERVER_MODE': mode, 'BIND': bind, 'WEB_CONCURRENCY': str(options["workers"])}
+        server = self._start([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env)
+        peak_rss = [0.0]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.wait(0.25):
+                peak_rss[0] = max(peak_rss[0], _rss_mb(server.pid))
+
+        try:
+            self._wait_ready(f"http://{bind}/api/gamification/stats/", server)
+            idle_rss = _rss_mb(server.pid)
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+            results, errors, elapsed = asyncio.run(self._load(f"http://{bind}", token, options))
+            sampling.set()
+            sampler.join()
+        finally:
+            self._stop(server)
+        return {'results': results, 'errors': errors, 'elapsed': elapsed, 'idle_rss': idle_rss, 'peak_rss': peak_rss[0]}
+
+    # ----- report -----
+
+    def _percentile(self, values, fraction):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+    def _report(self, mode, run):
+        elapsed = run['elapsed']
+        total = sum(len(v) for v in run['results'].values())
+        self.stdout.write(self.style.SUCCESS(
+            f"[{mode}] {total / elapsed:7.1f} req/s total, RSS idle={run['idle_rss']:.0f}MB peak={run['peak_rss']:.0f}MB"
+        ))
+        for kind, label in (('chat', 'AI chat (async view)'), ('sync', 'gamification stats (sync view)')):
+            latencies = run['results'][kind]
+            self.stdout.write(
+                f"    {label:<32} {len(latencies) / elapsed:7.1f} req/s  "
+                f"p50={self._percentile(latencies, 0.5):6.0f}ms  p95={self._percentile(latencies, 0.95):6.0f}ms  "
+                f"errors={run['errors'][kind]}"
+            )
+
+    def handle(self, *args, **options):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        token = self._token()
+        env = {
+            **os.environ,
+            'LLM_BASE_URL': f"http://127.0.0.1:{options['stub_port']}/v1",
+            'OPENAI_API_KEY': 'stub',
+            'RATE_LIMIT_ENABLED': 'False',
+            'REQUEST_LOG_ENABLED': 'False',
+        }
+        stub = self._start([sys.executable, 'manage.py', 'llm_stub', '--port', str(options["stub_port"]),
+                            '--latency', str(options["llm_latency"])], env)
+        try:
+            self.stdout.write(
+                f"{options['concurrency']} clients, {options['duration']:.0f}s per mode, {options['workers']} workers, "
+                f"{options['chat_share']:.0%} AI chat, LLM latency {options['llm_latency']}s"
+            )
+            for mode in options["modes"].split(','):
+                self._report(mode, self._run_mode(mode.strip(), token, options, env))
+        finally:
+            self._stop(stub)
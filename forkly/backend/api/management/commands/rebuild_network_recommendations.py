@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.recommendations import rebuild_all
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed 'trending in your network' vectors offline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="Rebuild only this user id (repeatable)")
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_all(options["users"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt network recommendations for {rebuilt} users"))
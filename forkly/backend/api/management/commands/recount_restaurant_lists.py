@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.popularity import recount
+
+
+class Command(BaseCommand):
+    help = "Recompute Restaurant.list_count/public_list_count from ListItem (e.g. after seeding)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurant", type=int, action="append", dest="restaurants", help="Recount only this restaurant id (repeatable)")
+
+    def handle(self, *args, **options):
+        updated = recount(options["restaurants"])
+        self.stdout.write(self.style.SUCCESS(f"Recounted list counters for {updated} restaurants"))
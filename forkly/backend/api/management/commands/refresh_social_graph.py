@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.social_graph import refresh_snapshot
+
+
+class Command(BaseCommand):
+    help = "Rebuild the CSR friendship snapshot used for friend suggestions and publish it to the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", type=int, default=0, help="Keep refreshing every N seconds (0 = run once)")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            snapshot = refresh_snapshot()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(
+                f"Snapshot: {len(snapshot.user_ids)} users, {snapshot.edge_count} edges in {elapsed_ms:.1f} ms"
+            ))
+            if options["loop"] <= 0:
+                break
+            time.sleep(options["loop"])
@@ -0,0 +1,70 @@
+import json
+import logging
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from api.jobs import JobWorker, get_mail_sender, queue_stats
+
+logger = logging.getLogger('api')
+
+# Housekeeping (stale locks, purge of finished jobs) at most this often
+MAINTENANCE_INTERVAL = 60
+# Backoff after a database error: doubles from the first value up to the cap
+DB_ERROR_BACKOFF = (1.0, 60.0)
+
+
+class Command(BaseCommand):
+    help = "Run a background job worker (emails, notifications); start one or more next to the web processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Jobs claimed per round (default JOB_BATCH_SIZE)")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds between polls when idle (default JOB_POLL_INTERVAL)")
+        parser.add_argument("--kind", action="append", help="Only run these job kinds (repeatable)")
+        parser.add_argument("--worker-id", type=str, default=None, help="Default host:pid")
+        parser.add_argument("--once", action="store_true", help="Drain the due jobs and exit")
+
+    def handle(self, *args, **options):
+        worker = JobWorker(
+            worker_id=options["worker_id"],
+            batch_size=options["batch_size"] or settings.JOB_BATCH_SIZE,
+            kinds=options["kind"],
+        )
+        poll_interval = options["poll_interval"] if options["poll_interval"] is not None else settings.JOB_POLL_INTERVAL
+        stopping = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        self.stdout.write(self.style.SUCCESS(f"Job worker {worker.worker_id} started ({json.dumps(queue_stats())})"))
+        last_maintenance = 0.0
+        backoff = DB_ERROR_BACKOFF[0]
+        try:
+            while not stopping.is_set():
+                try:
+                    if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                        worker.release_stale()
+                        worker.purge_finished()
+                        last_maintenance = time.monotonic()
+                    # Long-running process: drop connections that errored or exceeded CONN_MAX_AGE
+                    close_old_connections()
+                    executed = worker.run_once()
+                except DatabaseError as e:
+                    # Database restart or failover: keep the worker alive and retry on a new connection
+                    logger.error(f"Job worker {worker.worker_id}: database error, retrying in {backoff:.0f}s: {e}")
+                    close_old_connections()
+                    stopping.wait(backoff)
+                    backoff = min(backoff * 2, DB_ERROR_BACKOFF[1])
+                    continue
+                backoff = DB_ERROR_BACKOFF[0]
+                if executed:
+                    continue
+                if options["once"]:
+                    break
+                stopping.wait(poll_interval)
+        finally:
+            get_mail_sender().close()
+            self.stdout.write(self.style.SUCCESS(f"Job worker {worker.worker_id} stopped: {json.dumps(worker.stats())}"))
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from django.contrib.auth.models import User
+from django.core.management.base import CommandError
+from django.db.models import Count, Sum
+
+from api.management.commands.loadtest import Command as LoadTestCommand
+from api.models import Profile, Referral, Restaurant, RewardLedger
+from api.referrals import FIRST_REVIEW_POINTS, REGISTER_POINTS
+
+
+class Command(LoadTestCommand):
+    help = (
+        "Stress the referral flow under gunicorn: hundreds of parallel sign-ups on one referral "
+        "code, then parallel first reviews, and check the inviter's points, ledger and referrals exactly"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=200, help="Sign-ups on the shared referral code")
+        parser.add_argument("--concurrency", type=int, default=100, help="Requests in flight")
+        parser.add_argument("--reviews-per-user", type=int, default=2,
+                            help="Reviews each invitee posts at once (only the first may pay the inviter)")
+        parser.add_argument("--server-mode", type=str, default="asgi", help="wsgi or asgi")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--port", type=int, default=8813)
+        parser.add_argument("--keep", action="store_true", help="Keep the users, reviews and restaurant created")
+
+    async def _burst(self, base_url, requests, concurrency):
+        """Fires (method, path, json, token) requests with `concurrency` in flight; returns the responses"""
+        semaphore = asyncio.Semaphore(concurrency)
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+        async def send(client, method, path, payload, token):
+            headers = {'Authorization': f'Bearer {token}'} if token else {}
+            async with semaphore:
+                try:
+                    return await client.request(method, path, json=payload, headers=headers)
+                except httpx.HTTPError:
+                    return None
+
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+            return await asyncio.gather(*[send(client, *request) for request in requests])
+
+    def _failures(self, responses, ok_status):
+        """Failed requests by status code ('error' when the request itself failed)"""
+        failures = Counter('error' if r is None else r.status_code for r in responses if r is None or r.status_code != ok_status)
+        return ', '.join(f"{status}: {n}" for status, n in failures.most_common()) or 'none'
+
+    def _setup(self, run_id):
+        inviter = User.objects.create_user(username=f"stress_{run_id}", email=f"stress_{run_id}@forkly.local")
+        profile = Profile.objects.create(user=inviter, referral_code=f"S{run_id.upper()}")
+        restaurant = Restaurant.objects.create(name=f"Stress {run_id}", lat=-23.56, lng=-46.65)
+        return inviter, profile, restaurant
+
+    def _check(self, inviter, registered, reviewed):
+        """Compares the inviter's state with what the successful requests must have produced"""
+        points = Profile.objects.get(user=inviter).points
+        ledger = {
+            row['reason']: (row['n'], row['total'])
+            for row in RewardLedger.objects.filter(user=inviter).values('reason').annotate(n=Count('id'), total=Sum('points'))
+        }
+        referrals = dict(Referral.objects.filter(inviter=inviter).values_list('status').annotate(n=Count('id')))
+        expected_points = registered * REGISTER_POINTS + reviewed * FIRST_REVIEW_POINTS
+        checks = [
+            ('inviter points', points, expected_points),
+            ('ledger total', sum(total for _, total in ledger.values()), expected_points),
+            ('ledger invite_registered', ledger.get('invite_registered', (0, 0))[0], registered),
+            ('ledger invite_first_review', ledger.get('invite_first_review', (0, 0))[0], reviewed),
+            ('referrals registered + first_review', referrals.get('registered', 0) + referrals.get('first_review', 0), registered),
+            ('referrals first_review', referrals.get('first_review', 0), reviewed),
+        ]
+        failed = 0
+        for label, actual, expected in checks:
+            if actual == expected:
+                self.stdout.write(self.style.SUCCESS(f"    [ok]   {label:<38} {actual}"))
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"    [fail] {label:<38} {actual} (expected {expected})"))
+        return failed
+
+    def handle(self, *args, **options):
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+        run_id = uuid.uuid4().hex[:8]
+        inviter, profile, restaurant = self._setup(run_id)
+        bind = f"127.0.0.1:{options['port']}"
+        base_url = f"http://{bind}"
+        env = {
+            **os.environ,
+            'SERVER_MODE': options["server_mode"],
+            'BIND': bind,
+            'WEB_CONCURRENCY': str(options["workers"]),
+            'RATE_LIMIT_ENABLED': 'False',
+            'REQUEST_LOG_ENABLED': 'False',
+        }
+        self.stdout.write(
+            f"{options['signups']} sign-ups on code {profile.referral_code}, {options['concurrency']} in flight, "
+            f"{options['workers']} {options['server_mode']} workers"
+        )
+        server = self._start([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'], env)
+        try:
+            self._wait_ready(f"{base_url}/api/nearby/?lat=0&lng=0", server)
+            password = f"Stress-{run_id}-pw!"
+            started = time.perf_counter()
+            responses = asyncio.run(self._burst(base_url, [
+                ('POST', '/api/auth/register/', {
+                    'username': f"stress_{run_id}_{i}", 'email': f"stress_{run_id}_{i}@forkly.local",
+                    'password': password, 'password_confirm': password, 'referral_code': profile.referral_code,
+                }, None)
+                for i in range(options["signups"])
+            ], options["concurrency"]))
+            invitees = [r.json() for r in responses if r is not None and r.status_code == 201]
+            self.stdout.write(
+                f"sign-ups: {len(invitees)} created in {time.perf_counter() - started:.1f}s, "
+                f"failed: {self._failures(responses, 201)}"
+            )
+
+            started = time.perf_counter()
+            review_requests = [
+                ('POST', '/api/reviews/', {
+                    'restaurant': restaurant.id, 'user': invitee['user']['id'], 'rating': 5, 'text': 'stress',
+                }, invitee['token'])
+                for invitee in invitees for _ in range(options["reviews_per_user"])
+            ]
+            responses = asyncio.run(self._burst(base_url, review_requests, options["concurrency"]))
+            reviewers = {
+                request[2]['user'] for request, response in zip(review_requests, responses)
+                if response is not None and response.status_code == 200
+            }
+            self.stdout.write(
+                f"reviews: {len(reviewers)} invitees reviewed in {time.perf_counter() - started:.1f}s, "
+                f"failed: {self._failures(responses, 200)}"
+            )
+        finally:
+            self._stop(server)
+
+        try:
+            failed = self._check(inviter, len(invitees), len(reviewers))
+        finally:
+            if not options["keep"]:
+                User.objects.filter(username__startswith=f"stress_{run_id}").delete()
+                restaurant.delete()
+        if failed:
+            raise CommandError(f"{failed} checks failed: referral rewards were lost or duplicated")
+        self.stdout.write(self.style.SUCCESS("Inviter points, ledger and referrals match exactly"))
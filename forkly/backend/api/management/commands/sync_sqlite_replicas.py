@@ -0,0 +1,57 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _sqlite_path(database):
+    """File path of a SQLite NAME (replicas are opened as read-only URIs)"""
+    name = str(database['NAME'])
+    if name.startswith('file:'):
+        name = name[len('file:'):].split('?', 1)[0]
+    return name
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the SQLite replicas of DATABASE_REPLICA_URLS "
+        "(local stand-in for replication; --interval simulates replication lag)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0, help="Repeat every N seconds (default: copy once)")
+
+    def _targets(self):
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("The primary database is not SQLite")
+        targets = [
+            _sqlite_path(settings.DATABASES[alias]) for alias in settings.DATABASE_REPLICAS
+            if settings.DATABASES[alias]['ENGINE'] == 'django.db.backends.sqlite3'
+        ]
+        if not targets:
+            raise CommandError("No SQLite replicas in DATABASE_REPLICA_URLS")
+        return targets
+
+    def _sync(self, source, target):
+        src, dst = sqlite3.connect(source), sqlite3.connect(target)
+        try:
+            src.backup(dst)
+            # Read-only replica connections can only open WAL databases without writing to them
+            dst.execute('PRAGMA journal_mode=WAL')
+        finally:
+            src.close()
+            dst.close()
+
+    def handle(self, *args, **options):
+        source = _sqlite_path(settings.DATABASES['default'])
+        targets = self._targets()
+        while True:
+            started = time.perf_counter()
+            for target in targets:
+                self._sync(source, target)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(self.style.SUCCESS(f"Synced {source} -> {', '.join(targets)} in {elapsed_ms:.1f} ms"))
+            if options["interval"] <= 0:
+                break
+            time.sleep(options["interval"])
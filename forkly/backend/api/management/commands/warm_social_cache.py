@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.social_graph import warm_friend_cache
+
+
+class Command(BaseCommand):
+    help = "Pre-load the per-user friend-id sets into the cache backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", dest="users", help="Warm only this user id (repeatable)")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Keys written per cache.set_many call")
+
+    def handle(self, *args, **options):
+        warmed = warm_friend_cache(options["users"], batch_size=max(1, options["batch_size"]))
+        self.stdout.write(self.style.SUCCESS(f"Warmed friend cache for {warmed} users"))
@@ -0,0 +1,398 @@
+"""
+Request metrics for Forkly API, exposed in Prometheus text format on /metrics.
+
+MetricsMiddleware records, per resolved URL pattern (not raw path), method
+and status class:
+
+- a latency histogram (LATENCY_BUCKETS, seconds);
+- DB time and query count (execute wrapper installed on every connection);
+- cache time and call count (reported by api.cache_backends.TieredCache);
+- response bytes.
+
+With the PostgreSQL connection pool (api.db_backends.postgresql) it also
+records, per database alias, how long each checkout waited for a connection
+and how long the connection was held before returning to the pool.
+
+Aggregation is lock-free on the request path: every thread writes to its own
+shard and readers merge the shards. Shards of threads that have exited are
+folded into process totals and dropped (when a new thread starts recording,
+or on collection), so short-lived executor threads don't accumulate. With
+several worker processes, set METRICS_DIR to a directory shared by the workers (wipe it on deploy): each
+process dumps its totals there periodically and /metrics sums all files.
+"""
+
+import contextvars
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger('api')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Layout of a series: count, latency sum, one slot per bucket (+Inf last), then the totals below
+COUNT, LATENCY_SUM, BUCKETS = 0, 1, 2
+DB_SECONDS = BUCKETS + len(LATENCY_BUCKETS) + 1
+DB_QUERIES, CACHE_SECONDS, CACHE_CALLS, RESPONSE_BYTES = DB_SECONDS + 1, DB_SECONDS + 2, DB_SECONDS + 3, DB_SECONDS + 4
+SERIES_SIZE = RESPONSE_BYTES + 1
+
+SeriesKey = Tuple[str, str, str]  # route, method, status class
+
+# Connection pool histograms: count, sum, one slot per bucket (+Inf last)
+POOL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+POOL_SERIES_SIZE = 2 + len(POOL_BUCKETS) + 1
+PoolKey = Tuple[str, str]  # database alias, phase ('wait' or 'checkout')
+
+# Per-request accumulator [db seconds, db queries, cache seconds, cache calls];
+# a context variable so it follows the request into sync_to_async threads
+_current = contextvars.ContextVar('forkly_request_metrics', default=None)
+
+
+# ----- recording -----
+
+class _Shard(threading.local):
+    """Series written by one thread only (no locking needed)"""
+
+    def __init__(self):
+        self.series: Dict[SeriesKey, List[float]] = {}
+        self.pool: Dict[PoolKey, List[float]] = {}
+        with _shards_lock:
+            _retire_finished()
+            _shards.append((threading.current_thread(), self.series, self.pool))
+
+
+# (owning thread, request series, pool series) per thread that recorded something
+_shards: List[Tuple[threading.Thread, Dict[SeriesKey, List[float]], Dict[PoolKey, List[float]]]] = []
+# Totals of finished threads: ASGI sync views and sync_to_async run on
+# short-lived executor threads, so their shards are folded here and dropped
+_retired_series: Dict[SeriesKey, List[float]] = {}
+_retired_pool: Dict[PoolKey, List[float]] = {}
+_shards_lock = threading.Lock()
+
+
+def _add_into(total: Dict, shard: Dict, size: int) -> None:
+    for key, series in list(shard.items()):
+        merged = total.setdefault(key, [0] * size)
+        for i, value in enumerate(list(series)):
+            merged[i] += value
+
+
+def _retire_finished() -> None:
+    """Fold the shards of threads that have exited into the retired totals (holding _shards_lock)"""
+    alive = []
+    for entry in _shards:
+        thread, series, pool = entry
+        if thread.is_alive():
+            alive.append(entry)
+        else:
+            _add_into(_retired_series, series, SERIES_SIZE)
+            _add_into(_retired_pool, pool, POOL_SERIES_SIZE)
+    _shards[:] = alive
+
+
+_shard = _Shard()
+
+
+def start_request() -> contextvars.Token:
+    return _current.set([0.0, 0, 0.0, 0])
+
+
+def finish_request(token: contextvars.Token, route: str, method: str, status: int,
+                   duration: float, response_bytes: int) -> None:
+    """Fold the current request into this thread's shard"""
+    accumulated = _current.get() or [0.0, 0, 0.0, 0]
+    _current.reset(token)
+
+    key = (route, method, f"{status // 100}xx")
+    series = _shard.series.get(key)
+    if series is None:
+        series = _shard.series[key] = [0] * SERIES_SIZE
+    series[COUNT] += 1
+    series[LATENCY_SUM] += duration
+    series[BUCKETS + bisect_left(LATENCY_BUCKETS, duration)] += 1
+    series[DB_SECONDS] += accumulated[0]
+    series[DB_QUERIES] += accumulated[1]
+    series[CACHE_SECONDS] += accumulated[2]
+    series[CACHE_CALLS] += accumulated[3]
+    series[RESPONSE_BYTES] += response_bytes
+    _ensure_dumper()
+
+
+def observe_cache(seconds: float) -> None:
+    """Add a cache call to the current request (no-op outside requests)"""
+    accumulated = _current.get()
+    if accumulated is not None:
+        accumulated[2] += seconds
+        accumulated[3] += 1
+
+
+def observe_db_pool(alias: str, phase: str, seconds: float) -> None:
+    """Record a pool checkout: `wait` for a connection or `checkout` (time held)"""
+    key = (alias, phase)
+    series = _shard.pool.get(key)
+    if series is None:
+        series = _shard.pool[key] = [0] * POOL_SERIES_SIZE
+    series[0] += 1
+    series[1] += seconds
+    series[2 + bisect_left(POOL_BUCKETS, seconds)] += 1
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    accumulated = _current.get()
+    if accumulated is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        accumulated[0] += time.perf_counter() - started
+        accumulated[1] += 1
+
+
+def _install_db_wrapper(sender, connection, **kwargs):
+    if _db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_db_wrapper)
+
+
+connection_created.connect(_install_db_wrapper, dispatch_uid='forkly_metrics_db_wrapper')
+
+
+# ----- aggregation -----
+
+def collect() -> Dict[SeriesKey, List[float]]:
+    """Merge the shards of this process"""
+    merged: Dict[SeriesKey, List[float]] = {}
+    with _shards_lock:
+        _retire_finished()
+        _add_into(merged, _retired_series, SERIES_SIZE)
+        shards = [series for _, series, _ in _shards]
+    for shard in shards:
+        _add_into(merged, shard, SERIES_SIZE)
+    return merged
+
+
+def collect_pool() -> Dict[PoolKey, List[float]]:
+    """Merge the connection pool histograms of this process"""
+    merged: Dict[PoolKey, List[float]] = {}
+    with _shards_lock:
+        _retire_finished()
+        _add_into(merged, _retired_pool, POOL_SERIES_SIZE)
+        shards = [pool for _, _, pool in _shards]
+    for shard in shards:
+        _add_into(merged, shard, POOL_SERIES_SIZE)
+    return merged
+
+
+def _pool_stats() -> Dict[str, Dict]:
+    """psycopg_pool gauges and counters of the pooled database aliases"""
+    from django.db import connections
+
+    stats = {}
+    for alias, settings_dict in connections.settings.items():
+        if settings_dict.get('OPTIONS', {}).get('pool'):
+            pool = connections[alias].pool
+            if pool is not None:
+                stats[f"db_pool_{alias}"] = pool.get_stats()
+    return stats
+
+
+def component_stats() -> Dict[str, Dict]:
+    """Numeric stats of the in-process components (caches, LLM gateway, log pipeline, DB pools and routing)"""
+    from . import ai_cache, cache_backends, db_routers, llm_gateway, logging_pipeline
+
+    components = {
+        'ai_response_cache': ai_cache.stats(),
+        'llm_gateway': llm_gateway.stats(),
+        'request_log': logging_pipeline.stats(),
+        **_pool_stats(),
+    }
+    if db_routers.replica_aliases():
+        components['db_routing'] = db_routers.stats()
+    tiered = cache_backends.stats()
+    if tiered is not None:
+        components['tiered_cache'] = {'local_entries': tiered['local_entries']}
+        for prefix, counts in tiered['prefixes'].items():
+            name = prefix.rstrip(':').replace(':', '_')
+            components['tiered_cache'].update({f"{name}_{k}": v for k, v in counts.items()})
+    return {
+        name: {k: v for k, v in values.items() if isinstance(v, (int, float)) and not isinstance(v, bool)}
+        for name, values in components.items()
+    }
+
+
+def _metrics_dir() -> Optional[str]:
+    return getattr(settings, 'METRICS_DIR', None) or None
+
+
+def dump() -> None:
+    """Write this process's totals to METRICS_DIR (atomically)"""
+    directory = _metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    pid = os.getpid()
+    payload = {
+        'pid': pid,
+        'series': [[*key, *values] for key, values in collect().items()],
+        'pool': [[*key, *values] for key, values in collect_pool().items()],
+        'components': component_stats(),
+    }
+    path = os.path.join(directory, f"metrics-{pid}.json")
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(payload, f)
+    os.replace(tmp, path)
+
+
+_dumper_pid = None
+_dumper_lock = threading.Lock()
+
+
+def _ensure_dumper() -> None:
+    """Start the periodic dump thread when METRICS_DIR is set (lazily and again after a fork)"""
+    global _dumper_pid
+    if _dumper_pid == os.getpid() or not _metrics_dir():
+        return
+    with _dumper_lock:
+        if _dumper_pid == os.getpid():
+            return
+        threading.Thread(target=_dump_loop, name='metrics-dumper', daemon=True).start()
+        _dumper_pid = os.getpid()
+
+
+def _dump_loop() -> None:
+    interval = getattr(settings, 'METRICS_DUMP_INTERVAL', 5.0)
+    while True:
+        time.sleep(interval)
+        try:
+            dump()
+        except Exception as e:
+            logger.warning(f"Metrics dump failed: {e.__class__.__name__}: {e}")
+
+
+def aggregate() -> Tuple[Dict[SeriesKey, List[float]], Dict[PoolKey, List[float]], Dict[str, Dict[str, Dict]]]:
+    """
+    Request and pool series summed over all workers, and component stats per worker pid.
+
+    Without METRICS_DIR only this process is reported.
+    """
+    directory = _metrics_dir()
+    if not directory:
+        return collect(), collect_pool(), {str(os.getpid()): component_stats()}
+
+    dump()  # make this process's numbers current
+    series: Dict[SeriesKey, List[float]] = {}
+    pool: Dict[PoolKey, List[float]] = {}
+    components: Dict[str, Dict[str, Dict]] = {}
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json')):
+        try:
+            with open(path) as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for row in payload['series']:
+            total = series.setdefault(tuple(row[:3]), [0] * SERIES_SIZE)
+            for i, value in enumerate(row[3:]):
+                total[i] += value
+        for row in payload.get('pool', []):
+            total = pool.setdefault(tuple(row[:2]), [0] * POOL_SERIES_SIZE)
+            for i, value in enumerate(row[2:]):
+                total[i] += value
+        components[str(payload['pid'])] = payload.get('components', {})
+    return series, pool, components
+
+
+# ----- exposition -----
+
+def _labels(**labels) -> str:
+    escaped = (
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render() -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    series, pool, components = aggregate()
+    lines = [
+        '# HELP forkly_http_request_duration_seconds Request latency by URL pattern.',
+        '# TYPE forkly_http_request_duration_seconds histogram',
+    ]
+    for (route, method, status), values in sorted(series.items()):
+        cumulative = 0
+        for i, bound in enumerate(LATENCY_BUCKETS + (float('inf'),)):
+            cumulative += values[BUCKETS + i]
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f"forkly_http_request_duration_seconds_bucket{_labels(route=route, method=method, status=status, le=le)} {cumulative}")
+        labels = _labels(route=route, method=method, status=status)
+        lines.append(f"forkly_http_request_duration_seconds_sum{labels} {values[LATENCY_SUM]:.6f}")
+        lines.append(f"forkly_http_request_duration_seconds_count{labels} {values[COUNT]}")
+
+    totals = [
+        ('forkly_http_db_seconds_total', 'Time spent in DB queries.', DB_SECONDS),
+        ('forkly_http_db_queries_total', 'DB queries executed.', DB_QUERIES),
+        ('forkly_http_cache_seconds_total', 'Time spent in cache calls.', CACHE_SECONDS),
+        ('forkly_http_cache_calls_total', 'Cache calls made.', CACHE_CALLS),
+        ('forkly_http_response_bytes_total', 'Response body bytes (non-streaming responses).', RESPONSE_BYTES),
+    ]
+    for name, help_text, index in totals:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (route, method, status), values in sorted(series.items()):
+            value = values[index]
+            formatted = f"{value:.6f}" if isinstance(value, float) else str(value)
+            lines.append(f"{name}{_labels(route=route, method=method, status=status)} {formatted}")
+
+    pool_histograms = [
+        ('forkly_db_pool_wait_seconds', 'Time waited for a pooled DB connection.', 'wait'),
+        ('forkly_db_pool_checkout_seconds', 'Time a pooled DB connection was held before being returned.', 'checkout'),
+    ]
+    for name, help_text, phase in pool_histograms:
+        rows = sorted((alias, values) for (alias, row_phase), values in pool.items() if row_phase == phase)
+        if not rows:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for alias, values in rows:
+            cumulative = 0
+            for i, bound in enumerate(POOL_BUCKETS + (float('inf'),)):
+                cumulative += values[2 + i]
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{_labels(database=alias, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(database=alias)} {values[1]:.6f}")
+            lines.append(f"{name}_count{_labels(database=alias)} {values[0]}")
+
+    lines.append('# HELP forkly_component_stat In-process component counters and gauges, per worker.')
+    lines.append('# TYPE forkly_component_stat gauge')
+    for pid, stats in sorted(components.items()):
+        for component, values in sorted(stats.items()):
+            for stat, value in sorted(values.items()):
+                lines.append(f"forkly_component_stat{_labels(pid=pid, component=component, stat=stat)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint.
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>`. Without a token the
+    endpoint is open only outside production; in production it fails closed.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        if getattr(settings, 'IS_PRODUCTION', True):
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', '').encode(), f"Bearer {token}".encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,135 +1,293 @@
 """
 Security middleware for Forkly API.
 
-Includes rate limiting, request logging, and security headers.
+Includes rate limiting, request logging, security headers and metrics.
 """
 
+import asyncio
+import math
 import time
 import logging
-from django.core.cache import cache
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.http import JsonResponse
-from django.utils.deprecation import MiddlewareMixin
+from django.urls import Resolver404, resolve
 from django.conf import settings
 from django.utils import timezone
-from django.core.exceptions import PermissionDenied
+from django.core.exceptions import MiddlewareNotUsed, PermissionDenied
 from ipware import get_client_ip
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import db_routers, metrics
+from .logging_pipeline import get_pipeline
+from .ratelimit import RedisTokenBuckets, get_rate_limiter
 
 logger = logging.getLogger('api')
 
 
-class RateLimitMiddleware(MiddlewareMixin):
+class ForklyMiddleware:
     """
-    Rate limiting middleware to prevent abuse.
+    Rate limiting, request logging and response headers in a single pass.
+    
+    - Resolves the client IP once per request.
+    - Token buckets per client IP: a global limit plus optional per-route
+      limits (RATE_LIMIT_RULES), checked with one atomic operation (see
+      api.ratelimit).
+    - Queues an access-log record for the background writer (see
+      api.logging_pipeline).
+    - Sets the security and API version headers from precomputed tuples.
     
-    Implements token bucket algorithm for rate limiting.
+    Works natively in sync and async chains. Under ASGI the in-process
+    limiter is checked inline; the Redis one is a blocking round trip, so it
+    runs in a worker thread (thread_sensitive=False) off the event loop.
     """
     
+    sync_capable = True
+    async_capable = True
+    
+    SECURITY_HEADERS = (
+        ('X-Content-Type-Options', 'nosniff'),
+        ('X-Frame-Options', 'DENY'),
+        ('X-XSS-Protection', '1; mode=block'),
+        ('Referrer-Policy', 'strict-origin-when-cross-origin'),
+    )
+    # Content Security Policy (basic), not sent for /admin/
+    CONTENT_SECURITY_POLICY = (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data: https:; "
+        "font-src 'self' data:; "
+        "connect-src 'self'; "
+        "frame-ancestors 'none';"
+    )
+    API_HEADERS = (
+        ('X-API-Version', '1.0'),
+        ('X-Server', 'Forkly-API'),
+    )
+    # Rate limiting is skipped for admin and static files
+    RATE_LIMIT_EXEMPT_PREFIXES = ('/admin/', '/static/')
+    
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        
         self.rate_limit_enabled = getattr(settings, 'RATE_LIMIT_ENABLED', True)
-        self.requests_per_minute = getattr(settings, 'RATE_LIMIT_REQUESTS_PER_MINUTE', 60)
-        self.burst_size = getattr(settings, 'RATE_LIMIT_BURST_SIZE', 10)
-        super().__init__(get_response)
+        self.limiter = get_rate_limiter() if self.rate_limit_enabled else None
+        self.limiter_blocks = self.rate_limit_enabled and isinstance(self.limiter.store, RedisTokenBuckets)
+        self.acheck_rate_limit = sync_to_async(self.check_rate_limit, thread_sensitive=False)
+        self.log_enabled = getattr(settings, 'REQUEST_LOG_ENABLED', True)
+        self.pipeline = get_pipeline() if self.log_enabled else None
+        
+        self.headers = self.SECURITY_HEADERS + self.API_HEADERS
+        self.headers_with_csp = self.headers + (('Content-Security-Policy', self.CONTENT_SECURITY_POLICY),)
     
-    def process_request(self, request):
-        if not self.rate_limit_enabled:
-            return None
-            
-        # Skip rate limiting for admin and static files
-        if request.path.startswith('/admin/') or request.path.startswith('/static/'):
-            return None
-            
-        # Get client IP
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.check_rate_limit(request)
+        if response is None:
+            response = self.get_response(request)
+        return self.finish(request, response, started)
+    
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if self.limiter_blocks:
+            response = await self.acheck_rate_limit(request)
+        else:
+            response = self.check_rate_limit(request)
+        if response is None:
+            response = await self.get_response(request)
+        return self.finish(request, response, started)
+    
+    def check_rate_limit(self, request):
+        """Resolve the client IP (kept on the request) and return a 429 response if limited"""
         client_ip, _ = get_client_ip(request)
-        if not client_ip:
+        request.client_ip = client_ip
+        if not self.rate_limit_enabled or not client_ip or request.path.startswith(self.RATE_LIMIT_EXEMPT_PREFIXES):
             return None
-            
-        # Rate limiting key
-        rate_key = f"rate_limit:{client_ip}"
         
-        # Token bucket algorithm
-        now = time.time()
-        bucket_data = cache.get(rate_key, {'tokens': self.burst_size, 'last_update': now})
+        decision = self.limiter.hit(client_ip, request.path)
+        if decision.allowed:
+            return None
         
-        # Add tokens based on time passed
-        time_passed = now - bucket_data['last_update']
-        tokens_to_add = time_passed * (self.requests_per_minute / 60.0)
-        bucket_data['tokens'] = min(self.burst_size, bucket_data['tokens'] + tokens_to_add)
-        bucket_data['last_update'] = now
+        # Rate limit exceeded
+        retry_after = max(1, math.ceil(decision.retry_after))
+        logger.warning(f"Rate limit exceeded for IP: {client_ip}")
+        response = JsonResponse({
+            'error': 'Rate limit exceeded',
+            'message': 'Too many requests. Please try again later.',
+            'retry_after': retry_after
+        }, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
+    
+    def finish(self, request, response, started):
+        """Set the static headers and queue the access-log record"""
+        headers = response.headers
+        for name, value in (self.headers if request.path.startswith('/admin/') else self.headers_with_csp):
+            headers[name] = value
         
-        # Check if request is allowed
-        if bucket_data['tokens'] >= 1:
-            bucket_data['tokens'] -= 1
-            cache.set(rate_key, bucket_data, timeout=3600)  # 1 hour
-            return None
-        else:
-            # Rate limit exceeded
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return JsonResponse({
-                'error': 'Rate limit exceeded',
-                'message': 'Too many requests. Please try again later.',
-                'retry_after': 60
-            }, status=429)
+        if self.log_enabled:
+            self.log_request(request, response, started)
+        return response
+    
+    def log_request(self, request, response, started):
+        self.pipeline.record(
+            request.method, request.path, response.status_code, (time.perf_counter() - started) * 1000,
+            getattr(request, 'client_ip', None), request.META.get('HTTP_USER_AGENT')
+        )
 
 
-class SecurityHeadersMiddleware(MiddlewareMixin):
+class MetricsMiddleware:
     """
-    Add security headers to all responses.
+    Record per-route latency, DB time, cache time and response size.
+
+    Routes are the resolved URL patterns (e.g. `api/ai/chat/send/`), so
+    paths with IDs share a series. Works natively in sync and async chains;
+    see api.metrics for aggregation and the /metrics endpoint.
     """
-    
-    def process_response(self, request, response):
-        # Security headers
-        response['X-Content-Type-Options'] = 'nosniff'
-        response['X-Frame-Options'] = 'DENY'
-        response['X-XSS-Protection'] = '1; mode=block'
-        response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        
-        # Content Security Policy (basic)
-        if not request.path.startswith('/admin/'):
-            csp = (
-                "default-src 'self'; "
-                "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
-                "style-src 'self' 'unsafe-inline'; "
-                "img-src 'self' data: https:; "
-                "font-src 'self' data:; "
-                "connect-src 'self'; "
-                "frame-ancestors 'none';"
-            )
-            response['Content-Security-Policy'] = csp
-        
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._finish(token, request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._finish(token, request, response, time.perf_counter() - started)
         return response
 
+    def _finish(self, token, request, response, duration):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None and match.route else '<unmatched>'
+        size = 0 if getattr(response, 'streaming', False) else len(response.content)
+        metrics.finish_request(token, route, request.method, response.status_code, duration, size)
+
 
-class RequestLoggingMiddleware(MiddlewareMixin):
+class SyncViewLimitMiddleware:
     """
-    Log all API requests for monitoring and debugging.
+    Under ASGI, cap how many sync (ORM/CPU-bound) views run at once per worker.
+
+    Django runs each sync view in a thread of its own request context, so
+    without a cap a burst of requests turns into a burst of threads and DB
+    connections. Requests over ASGI_SYNC_VIEW_CONCURRENCY wait on the event
+    loop (no thread held). Async views are not limited. Under WSGI this is
+    a pass-through.
     """
-    
-    def process_request(self, request):
-        # Log request details
-        client_ip, _ = get_client_ip(request)
-        user_agent = request.META.get('HTTP_USER_AGENT', 'Unknown')
-        
-        logger.info(f"Request: {request.method} {request.path} from {client_ip} - {user_agent}")
-        
-        # Log sensitive endpoints
-        if request.path in ['/api/auth/login/', '/api/auth/register/']:
-            logger.info(f"Authentication attempt from {client_ip}")
-    
-    def process_response(self, request, response):
-        # Log response status
-        if response.status_code >= 400:
-            logger.warning(f"Error response: {response.status_code} for {request.path}")
-        
-        return response
 
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limit = getattr(settings, 'ASGI_SYNC_VIEW_CONCURRENCY', 16)
+        self._semaphore = None
+        self._async_views = {}  # view callable -> is coroutine function
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.limit <= 0 or self._is_async_view(request):
+            return await self.get_response(request)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        async with self._semaphore:
+            return await self.get_response(request)
+
+    def _is_async_view(self, request) -> bool:
+        try:
+            func = resolve(request.path_info, getattr(request, 'urlconf', None)).func
+        except Resolver404:
+            return False
+        is_async = self._async_views.get(func)
+        if is_async is None:
+            is_async = self._async_views[func] = iscoroutinefunction(func)
+        return is_async
 
-class APIVersionMiddleware(MiddlewareMixin):
+
+class ReplicaRoutingMiddleware:
     """
-    Add API version information to responses.
+    Per-request state of the read-replica router (see api.db_routers).
+
+    Removed from the chain when no replicas are configured.
     """
-    
-    def process_response(self, request, response):
-        response['X-API-Version'] = '1.0'
-        response['X-Server'] = 'Forkly-API'
-        return response
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not db_routers.replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = db_routers.begin_request(request)
+        try:
+            return self.get_response(request)
+        finally:
+            db_routers.finish_request(token)
+
+    async def __acall__(self, request):
+        token = db_routers.begin_request(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            db_routers.finish_request(token)
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain.
+
+    Stock WhiteNoise is sync-only, so under ASGI Django would run every request
+    below it through a single thread-sensitive executor, serializing async
+    views (e.g. the AI chat) behind one another. Static files are still
+    served synchronously; everything else is awaited directly.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, **kwargs):
+        super().__init__(get_response, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:48
+
+import django.db.models.deletion
+from django.conf import settings
+from collections import Counter, defaultdict
+from django.db import migrations, models
+
+
+def build_network_recommendations(apps, schema_editor):
+    Friendship = apps.get_model('api', 'Friendship')
+    ListItem = apps.get_model('api', 'ListItem')
+    NetworkRecommendation = apps.get_model('api', 'NetworkRecommendation')
+
+    public_by_owner = defaultdict(set)
+    pairs = ListItem.objects.filter(lst__is_public=True).values_list('lst__owner_id', 'restaurant_id').distinct()
+    for owner_id, restaurant_id in pairs:
+        public_by_owner[owner_id].add(restaurant_id)
+
+    counts_by_user = defaultdict(Counter)
+    for user_id, friend_id in Friendship.objects.values_list('user_id', 'friend_id'):
+        counts_by_user[user_id].update(public_by_owner.get(friend_id, ()))
+
+    NetworkRecommendation.objects.bulk_create([
+        NetworkRecommendation(user_id=user_id, restaurant_id=restaurant_id, friend_count=count)
+        for user_id, counts in counts_by_user.items()
+        for restaurant_id, count in counts.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_profile_role'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NetworkRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('friend_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_recommendations', to='api.restaurant')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='network_recommendations', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-friend_count'], name='netrec_user_count_idx')],
+                'unique_together': {('user', 'restaurant')},
+            },
+        ),
+        migrations.RunPython(build_network_recommendations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:50
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_list_counters(apps, schema_editor):
+    Restaurant = apps.get_model('api', 'Restaurant')
+    counted = Restaurant.objects.annotate(
+        lists=Count('listitem__lst', distinct=True),
+        public_lists=Count('listitem__lst', filter=Q(listitem__lst__is_public=True), distinct=True),
+    ).values_list('id', 'lists', 'public_lists')
+    Restaurant.objects.bulk_update(
+        [Restaurant(id=pk, list_count=lists, public_list_count=public_lists) for pk, lists, public_lists in counted],
+        ['list_count', 'public_list_count'],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_networkrecommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='list_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='public_list_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['list_count', 'rating_avg'], name='restaurant_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_list_counters, migrations.RunPython.noop),
+    ]
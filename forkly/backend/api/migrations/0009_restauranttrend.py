@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_restaurant_list_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('region', models.CharField(max_length=32)),
+                ('log_score', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='trend', to='api.restaurant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['region', '-log_score'], name='trend_region_score_idx'), models.Index(fields=['-log_score'], name='trend_score_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_aiconversation_metadata_aimessage_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantInsights',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reservations_30d', models.IntegerField(default=0)),
+                ('reservations_prev_30d', models.IntegerField(default=0)),
+                ('reservations_60_90d', models.IntegerField(default=0)),
+                ('no_shows_30d', models.IntegerField(default=0)),
+                ('no_show_rate', models.FloatField(default=0.0)),
+                ('monthly_revenue', models.FloatField(default=0.0)),
+                ('growth_rate', models.FloatField(default=0.0)),
+                ('lift', models.FloatField(default=0.0)),
+                ('projected_revenue', models.FloatField(default=0.0)),
+                ('trend_direction', models.CharField(default='stable', max_length=10)),
+                ('seasonality', models.JSONField(blank=True, default=dict)),
+                ('computed_at', models.DateTimeField()),
+                ('restaurant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='insights', to='api.restaurant')),
+            ],
+        ),
+    ]
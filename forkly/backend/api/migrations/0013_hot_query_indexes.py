@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 19:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='aiconversation',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', '-updated_at'], name='aiconv_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(condition=models.Q(('is_referred', True)), fields=['user'], name='friendship_user_referred_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-points'], name='profile_points_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['inviter', 'status'], name='referral_inviter_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referral',
+            index=models.Index(fields=['invitee', 'status', 'created_at'], name='referral_invitee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['restaurant', 'status', 'created_at'], name='reservation_rest_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rewardledger',
+            index=models.Index(fields=['user', 'created_at'], name='ledger_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userachievement',
+            index=models.Index(fields=['user', 'unlocked_at'], name='userach_user_unlocked_idx'),
+        ),
+    ]
@@ -13,6 +13,11 @@ class Profile(models.Model):
     points = models.IntegerField(default=0)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='user')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-points'], name='profile_points_idx'),  # Ranking do leaderboard
+        ]
+
 class Restaurant(models.Model):
     name = models.CharField(max_length=140)
     address = models.CharField(max_length=240, blank=True)
@@ -22,6 +27,13 @@ class Restaurant(models.Model):
     price_level = models.IntegerField(default=1)  # 0..4
     rating_avg = models.FloatField(default=0)
     rating_count = models.IntegerField(default=0)
+    list_count = models.IntegerField(default=0)  # Listas distintas que contêm o restaurante (ver api.popularity)
+    public_list_count = models.IntegerField(default=0)  # Destas, quantas são públicas
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['list_count', 'rating_avg'], name='restaurant_popularity_idx'),
+        ]
 
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -50,6 +62,12 @@ class Referral(models.Model):
     status = models.CharField(max_length=20, choices=[('clicked','clicked'),('installed','installed'),('registered','registered'),('first_review','first_review')])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['inviter', 'status'], name='referral_inviter_status_idx'),
+            models.Index(fields=['invitee', 'status', 'created_at'], name='referral_invitee_status_idx'),
+        ]
+
 class RewardLedger(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     reason = models.CharField(max_length=40)
@@ -57,6 +75,11 @@ class RewardLedger(models.Model):
     meta = models.JSONField(default=dict)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='ledger_user_created_idx'),
+        ]
+
 class Friendship(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friends')
     friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name='friend_of')
@@ -66,6 +89,10 @@ class Friendship(models.Model):
     
     class Meta:
         unique_together = ['user', 'friend']
+        indexes = [
+            # Parcial: as views só filtram is_referred=True (e o SQLite não usa booleano no meio de um índice)
+            models.Index(fields=['user'], condition=models.Q(is_referred=True), name='friendship_user_referred_idx'),
+        ]
 
 # Sistema de Gamificação
 class Tier(models.Model):
@@ -113,6 +140,9 @@ class UserAchievement(models.Model):
     
     class Meta:
         unique_together = ['user', 'achievement']
+        indexes = [
+            models.Index(fields=['user', 'unlocked_at'], name='userach_user_unlocked_idx'),
+        ]
 
 class Reward(models.Model):
     name = models.CharField(max_length=100)
@@ -141,9 +171,14 @@ class AIConversation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    metadata = models.JSONField(default=dict, blank=True)  # Resumo das mensagens fora da janela (ver ai_history)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Parcial: a lista de conversas só mostra as ativas, mais recentes primeiro
+            models.Index(fields=['user', '-updated_at'], condition=models.Q(is_active=True), name='aiconv_user_active_idx'),
+        ]
 
 class AIMessage(models.Model):
     conversation = models.ForeignKey(AIConversation, on_delete=models.CASCADE, related_name='messages')
@@ -164,6 +199,9 @@ class AIMessage(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='aimessage_conv_created_idx'),
+        ]
 
 # Sistema de Restaurantes e Reservas
 class RestaurantOwner(models.Model):
@@ -222,6 +260,9 @@ class Reservation(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['restaurant', 'status', 'created_at'], name='reservation_rest_status_idx'),
+        ]
     
     def __str__(self):
         return f"Reserva {self.id} - {self.restaurant.name} - {self.customer.username}"
@@ -255,8 +296,8 @@ class RestaurantAnalytics(models.Model):
             self.total_reviews = reviews.count()
             self.average_rating = sum(review.rating for review in reviews) / self.total_reviews
         
-        # Contar recomendações (vezes que apareceu em listas)
-        self.times_in_lists = ListItem.objects.filter(restaurant=self.restaurant).count()
+        # Contar recomendações (vezes que apareceu em listas): contador mantido em Restaurant
+        self.times_in_lists = Restaurant.objects.filter(id=self.restaurant_id).values_list('list_count', flat=True).first() or 0
         
         # Contar vezes recomendado (simplificado - pode ser melhorado)
         self.times_recommended = self.times_in_lists
@@ -264,4 +305,89 @@ class RestaurantAnalytics(models.Model):
         self.save()
     
     def __str__(self):
-        return f"Analytics for {self.restaurant.name}"
\ No newline at end of file
+        return f"Analytics for {self.restaurant.name}"
+
+
+# Recomendações pré-calculadas da rede de amigos
+class NetworkRecommendation(models.Model):
+    """Restaurante em alta na rede de um usuário (mantido incrementalmente)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='network_recommendations')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='network_recommendations')
+    friend_count = models.IntegerField(default=0)  # Amigos com o restaurante em listas públicas
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['user', 'restaurant']
+        indexes = [
+            models.Index(fields=['user', '-friend_count'], name='netrec_user_count_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user.username} - {self.restaurant.name} ({self.friend_count})"
+
+# Tendências (score com decaimento exponencial)
+class RestaurantTrend(models.Model):
+    """Score de tendência do restaurante, em escala logarítmica relativa a uma época fixa (ver api.trending)"""
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, related_name='trend')
+    region = models.CharField(max_length=32)  # Célula da grade lat/lng
+    log_score = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['region', '-log_score'], name='trend_region_score_idx'),
+            models.Index(fields=['-log_score'], name='trend_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Trend for {self.restaurant.name}"
+
+# Insights pré-calculados do restaurante (job noturno, ver api.insights)
+class RestaurantInsights(models.Model):
+    """Tendência, no-shows, sazonalidade e projeção de receita do restaurante"""
+    restaurant = models.OneToOneField(Restaurant, on_delete=models.CASCADE, related_name='insights')
+    reservations_30d = models.IntegerField(default=0)  # Confirmadas/concluídas nos últimos 30 dias
+    reservations_prev_30d = models.IntegerField(default=0)  # 30-60 dias atrás
+    reservations_60_90d = models.IntegerField(default=0)  # 60-90 dias atrás
+    no_shows_30d = models.IntegerField(default=0)
+    no_show_rate = models.FloatField(default=0.0)  # no-shows / (concluídas + no-shows), últimos 30 dias
+    monthly_revenue = models.FloatField(default=0.0)
+    growth_rate = models.FloatField(default=0.0)
+    lift = models.FloatField(default=0.0)  # Lift de exposição em listas (máx. 30%)
+    projected_revenue = models.FloatField(default=0.0)  # Próximo mês
+    trend_direction = models.CharField(max_length=10, default='stable')  # up / down / stable
+    seasonality = models.JSONField(default=dict, blank=True)  # Reservas por dia da semana e hora (90 dias)
+    computed_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"Insights for {self.restaurant.name}"
+
+# Fila de jobs em segundo plano (emails, notificações; ver api.jobs)
+class Job(models.Model):
+    """Tarefa persistida, executada pelos workers de `run_job_worker`"""
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('running', 'Em execução'),
+        ('done', 'Concluído'),
+        ('failed', 'Falhou'),
+    ]
+
+    kind = models.CharField(max_length=50)  # Handler registrado em api.jobs
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField()  # Não executar antes (backoff entre tentativas)
+    locked_by = models.CharField(max_length=100, blank=True)  # Worker que reservou o job
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
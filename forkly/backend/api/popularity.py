@@ -0,0 +1,78 @@
+"""
+Contadores globais de popularidade dos restaurantes.
+
+`Restaurant.list_count` guarda em quantas listas distintas o restaurante
+aparece (e `public_list_count`, quantas delas são públicas). Os contadores são
+recalculados no banco, com a linha do restaurante travada, nas escritas de
+`ListItem` e nas mudanças de visibilidade de listas, o que transforma a
+leitura de populares em uma varredura do índice (list_count, rating_avg).
+"""
+
+from typing import Iterable, Optional
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import List, ListItem, Restaurant
+
+
+def _distinct_lists(public: bool = False) -> Coalesce:
+    """Subconsulta: listas distintas (ou só as públicas) com o restaurante da linha"""
+    items = ListItem.objects.filter(restaurant_id=OuterRef('pk'))
+    if public:
+        items = items.filter(lst__is_public=True)
+    counted = items.order_by().values('restaurant_id').annotate(n=Count('lst_id', distinct=True)).values('n')
+    return Coalesce(Subquery(counted), 0)
+
+
+def _refresh(restaurant_ids: Iterable[int]) -> None:
+    """
+    Recalcula os contadores dos restaurantes com as linhas travadas.
+
+    Checar "é o primeiro item do restaurante na lista?" e depois somar 1
+    contava em dobro (ou não contava) com dois itens iguais gravados ao mesmo
+    tempo. Com a trava, quem recalcula por último já enxerga os itens de
+    todas as transações concorrentes.
+    """
+    restaurant_ids = sorted(set(restaurant_ids))
+    if not restaurant_ids:
+        return
+    with transaction.atomic():
+        # Trava num comando separado: o UPDATE seguinte tira um snapshot novo (READ COMMITTED)
+        list(Restaurant.objects.select_for_update().filter(id__in=restaurant_ids).order_by('id').values_list('id', flat=True))
+        recount(restaurant_ids)
+
+
+def on_list_item_added(item: ListItem) -> None:
+    """Item novo: a lista passa a contar se for o primeiro item do restaurante nela"""
+    _refresh([item.restaurant_id])
+
+
+def on_list_item_removed(restaurant_id: int) -> None:
+    """Item removido: a lista deixa de contar se era o último item do restaurante nela"""
+    _refresh([restaurant_id])
+
+
+def on_list_visibility_changed(lst: List) -> None:
+    _refresh(lst.items.values_list('restaurant_id', flat=True))
+
+
+def on_list_deleted(restaurant_ids: Iterable[int]) -> None:
+    _refresh(restaurant_ids)
+
+
+def recount(restaurant_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recalcula os contadores a partir de `ListItem` (dados gravados fora das views).
+
+    Args:
+        restaurant_ids: Restaurantes a recalcular (todos se None)
+
+    Returns:
+        int: Número de restaurantes atualizados
+    """
+    restaurants = Restaurant.objects.all()
+    if restaurant_ids is not None:
+        restaurants = restaurants.filter(id__in=list(restaurant_ids))
+    return restaurants.update(list_count=_distinct_lists(), public_list_count=_distinct_lists(public=True))
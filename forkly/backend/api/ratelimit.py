@@ -0,0 +1,386 @@
+"""
+Rate limiting for Forkly API.
+
+Two limiters share the same storage strategy:
+
+- token buckets per client IP (ForklyMiddleware): the global limit plus
+  any limits configured for the route;
+- sliding-window counters per authenticated user and endpoint scope
+  (security.rate_limit_by_user).
+
+Every check is a single atomic operation:
+
+- Redis (django_redis cache): one EVALSHA of a Lua script that evaluates and
+  updates the state server-side, using the Redis clock so all workers agree;
+- any other cache backend (LocMem in development): a lock-protected
+  in-process store, since those caches are per-process anyway.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .cache_backends import shared_cache_alias
+
+logger = logging.getLogger('api')
+
+
+class Limit(NamedTuple):
+    """`rate` requests per `per` seconds, with bursts of up to `burst` requests"""
+    rate: float
+    per: float
+    burst: int
+
+    @property
+    def per_second(self) -> float:
+        return self.rate / self.per
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    retry_after: float  # seconds until the most constrained bucket has a token
+
+
+# KEYS: bucket keys. ARGV: cost, then (tokens per ms, burst) for each key.
+# Buckets are only written when every one of them allows the request.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cost = tonumber(ARGV[1])
+local tokens = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 2])
+  local burst = tonumber(ARGV[i * 2 + 1])
+  local state = redis.call('HMGET', key, 't', 'ts')
+  local current = tonumber(state[1]) or burst
+  local ts = tonumber(state[2]) or now
+  current = math.min(burst, current + math.max(0, now - ts) * rate)
+  tokens[i] = current
+  if current < cost then
+    wait = math.max(wait, (cost - current) / rate)
+  end
+end
+if wait > 0 then
+  return {0, math.ceil(wait)}
+end
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 2])
+  local burst = tonumber(ARGV[i * 2 + 1])
+  redis.call('HSET', key, 't', tostring(tokens[i] - cost), 'ts', now)
+  redis.call('PEXPIRE', key, math.ceil(burst / rate) + 1000)
+end
+return {1, 0}
+"""
+
+
+class RedisTokenBuckets:
+    """Token buckets evaluated atomically by a Lua script (one round trip per request)"""
+
+    def __init__(self, client):
+        self._script = client.register_script(TOKEN_BUCKET_LUA)
+
+    def consume(self, buckets: Sequence[Tuple[str, Limit]], cost: int = 1) -> Decision:
+        keys = [key for key, _ in buckets]
+        args = [cost]
+        for _, limit in buckets:
+            args.extend([repr(limit.per_second / 1000.0), limit.burst])
+        allowed, wait_ms = self._script(keys=keys, args=args)
+        return Decision(bool(allowed), int(wait_ms) / 1000.0)
+
+
+class LocalTokenBuckets:
+    """In-process token buckets behind a single lock (bounded LRU of keys)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, last_update]
+        self._lock = threading.Lock()
+
+    def consume(self, buckets: Sequence[Tuple[str, Limit]], cost: int = 1) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            refilled = []
+            wait = 0.0
+            for key, limit in buckets:
+                state = self._buckets.get(key)
+                tokens = limit.burst if state is None else min(
+                    limit.burst, state[0] + (now - state[1]) * limit.per_second
+                )
+                refilled.append(tokens)
+                if tokens < cost:
+                    wait = max(wait, (cost - tokens) / limit.per_second)
+            if wait > 0:
+                return Decision(False, wait)
+
+            for (key, _), tokens in zip(buckets, refilled):
+                self._buckets[key] = [tokens - cost, now]
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return Decision(True, 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+def _redis_client():
+    """Raw Redis client when the (shared tier of the) default cache is django_redis, else None"""
+    alias = shared_cache_alias('default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if 'django_redis' not in backend:
+        return None
+    from django_redis import get_redis_connection
+    return get_redis_connection(alias)
+
+
+def make_store():
+    """Token-bucket store for the configured cache backend"""
+    client = _redis_client()
+    if client is not None:
+        return RedisTokenBuckets(client)
+    return LocalTokenBuckets(getattr(settings, 'RATE_LIMIT_LOCAL_MAX_KEYS', 100000))
+
+
+def _parse_limits(raw) -> List[Limit]:
+    return [Limit(float(item['rate']), float(item.get('per', 60)), int(item['burst'])) for item in raw]
+
+
+class RateLimiter:
+    """
+    Resolves the limits for a path and consumes them in one atomic operation.
+
+    Args:
+        default_limits: Limits applied to every request
+        rules: (path prefix, limits) pairs; the longest matching prefix adds its limits
+        store: RedisTokenBuckets or LocalTokenBuckets
+    """
+
+    def __init__(self, default_limits: List[Limit], rules: List[Tuple[str, List[Limit]]], store):
+        self.default_limits = default_limits
+        self.rules = sorted(rules, key=lambda rule: len(rule[0]), reverse=True)
+        self.store = store
+
+    @classmethod
+    def from_settings(cls) -> 'RateLimiter':
+        per_minute = getattr(settings, 'RATE_LIMIT_REQUESTS_PER_MINUTE', 60)
+        burst = getattr(settings, 'RATE_LIMIT_BURST_SIZE', 10)
+        rules = [
+            (rule['prefix'], _parse_limits(rule['limits']))
+            for rule in getattr(settings, 'RATE_LIMIT_RULES', [])
+        ]
+        return cls([Limit(per_minute, 60, burst)], rules, make_store())
+
+    def buckets_for(self, identity: str, path: str) -> List[Tuple[str, Limit]]:
+        """Bucket keys (hash-tagged by identity, so they share a Redis Cluster slot) and limits"""
+        buckets = [(f"rl:{{{identity}}}:*:{i}", limit) for i, limit in enumerate(self.default_limits)]
+        for prefix, limits in self.rules:
+            if path.startswith(prefix):
+                buckets.extend((f"rl:{{{identity}}}:{prefix}:{i}", limit) for i, limit in enumerate(limits))
+                break
+        return buckets
+
+    def hit(self, identity: str, path: str, cost: int = 1) -> Decision:
+        """
+        Consume one request for `identity` on `path`.
+
+        Fails open (allows the request) if the store is unreachable.
+        """
+        try:
+            return self.store.consume(self.buckets_for(identity, path), cost)
+        except Exception as e:
+            logger.error(f"Rate limiter unavailable, allowing request: {e.__class__.__name__}: {e}")
+            return Decision(True, 0.0)
+
+
+# ----- sliding windows (per user) -----
+
+
+class Quota(NamedTuple):
+    """At most `limit` requests in any `window` seconds"""
+    limit: int
+    window: float
+
+
+# Sliding-window counter: the previous fixed window's count is weighted by how
+# much of it still overlaps the sliding window ending now. State is one hash
+# per key: w (current window index), p (previous count), c (current count).
+# KEYS: counter key. ARGV: limit, window (ms), cost.
+SLIDING_WINDOW_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local idx = math.floor(now / window)
+local state = redis.call('HMGET', KEYS[1], 'w', 'p', 'c')
+local w = tonumber(state[1]) or idx
+local prev = tonumber(state[2]) or 0
+local curr = tonumber(state[3]) or 0
+if w == idx - 1 then
+  prev = curr
+  curr = 0
+elseif w ~= idx then
+  prev = 0
+  curr = 0
+end
+local elapsed = now - idx * window
+if prev * (window - elapsed) / window + curr + cost <= limit then
+  redis.call('HSET', KEYS[1], 'w', idx, 'p', prev, 'c', curr + cost)
+  redis.call('PEXPIRE', KEYS[1], window * 2)
+  return {1, 0}
+end
+local wait
+if curr + cost <= limit then
+  wait = window * (1 - (limit - cost - curr) / prev) - elapsed
+else
+  wait = window - elapsed + window * (1 - (limit - cost) / curr)
+end
+return {0, math.ceil(wait)}
+"""
+
+
+def _window_retry_after(quota: Quota, prev: float, curr: float, elapsed: float, cost: int) -> float:
+    """
+    Seconds until the sliding-window estimate admits `cost` more requests.
+
+    Within the current window only the previous window's weight decays; if
+    the current window alone is over the limit, the wait runs into the next
+    window, where the current count becomes the decaying one.
+    """
+    window = quota.window
+    if curr + cost <= quota.limit:
+        return window * (1 - (quota.limit - cost - curr) / prev) - elapsed
+    return window - elapsed + window * (1 - (quota.limit - cost) / curr)
+
+
+class RedisSlidingWindows:
+    """Sliding-window counters evaluated atomically by a Lua script (one round trip per request)"""
+
+    def __init__(self, client):
+        self._script = client.register_script(SLIDING_WINDOW_LUA)
+
+    def consume(self, key: str, quota: Quota, cost: int = 1) -> Decision:
+        allowed, wait_ms = self._script(keys=[key], args=[quota.limit, int(quota.window * 1000), cost])
+        return Decision(bool(allowed), int(wait_ms) / 1000.0)
+
+
+class LocalSlidingWindows:
+    """In-process sliding-window counters behind a single lock (bounded LRU of keys)"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._windows = OrderedDict()  # key -> [window index, previous count, current count]
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, quota: Quota, cost: int = 1) -> Decision:
+        now = time.time()
+        idx = int(now // quota.window)
+        elapsed = now - idx * quota.window
+        with self._lock:
+            w, prev, curr = self._windows.get(key) or (idx, 0, 0)
+            if w == idx - 1:
+                prev, curr = curr, 0
+            elif w != idx:
+                prev, curr = 0, 0
+
+            if prev * (quota.window - elapsed) / quota.window + curr + cost > quota.limit:
+                return Decision(False, _window_retry_after(quota, prev, curr, elapsed, cost))
+
+            self._windows[key] = [idx, prev, curr + cost]
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.max_keys:
+                self._windows.popitem(last=False)
+            return Decision(True, 0.0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+
+
+def make_window_store():
+    """Sliding-window store for the configured cache backend"""
+    client = _redis_client()
+    if client is not None:
+        return RedisSlidingWindows(client)
+    return LocalSlidingWindows(getattr(settings, 'RATE_LIMIT_LOCAL_MAX_KEYS', 100000))
+
+
+def _parse_quota(raw) -> Quota:
+    return Quota(int(raw['limit']), float(raw['window']))
+
+
+class UserRateLimiter:
+    """
+    Per-user quotas per endpoint scope over a sliding window.
+
+    Args:
+        default_quota: Quota for scopes without an entry in `quotas`
+        quotas: scope -> Quota
+        store: RedisSlidingWindows or LocalSlidingWindows
+    """
+
+    def __init__(self, default_quota: Quota, quotas: Dict[str, Quota], store):
+        self.default_quota = default_quota
+        self.quotas = quotas
+        self.store = store
+
+    @classmethod
+    def from_settings(cls) -> 'UserRateLimiter':
+        default = getattr(settings, 'USER_RATE_LIMIT_DEFAULT', {'limit': 100, 'window': 3600})
+        quotas = {
+            scope: _parse_quota(raw)
+            for scope, raw in getattr(settings, 'USER_RATE_LIMITS', {}).items()
+        }
+        return cls(_parse_quota(default), quotas, make_window_store())
+
+    def quota_for(self, scope: str) -> Quota:
+        return self.quotas.get(scope, self.default_quota)
+
+    def hit(self, user_id, scope: str, quota: Optional[Quota] = None, cost: int = 1) -> Decision:
+        """
+        Count one request of `user_id` against `scope`.
+
+        Args:
+            user_id: Authenticated user's ID
+            scope: Endpoint scope (quota name)
+            quota: Explicit quota, overriding the configured one
+
+        Fails open (allows the request) if the store is unreachable.
+        """
+        quota = quota or self.quota_for(scope)
+        try:
+            return self.store.consume(f"url:{{{user_id}}}:{scope}", quota, cost)
+        except Exception as e:
+            logger.error(f"User rate limiter unavailable, allowing request: {e.__class__.__name__}: {e}")
+            return Decision(True, 0.0)
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter.from_settings()
+    return _limiter
+
+
+_user_limiter: Optional[UserRateLimiter] = None
+
+
+def get_user_rate_limiter() -> UserRateLimiter:
+    global _user_limiter
+    if _user_limiter is None:
+        with _limiter_lock:
+            if _user_limiter is None:
+                _user_limiter = UserRateLimiter.from_settings()
+    return _user_limiter
@@ -0,0 +1,176 @@
+"""
+Recomendações "em alta na sua rede" pré-calculadas.
+
+Para cada usuário guardamos, por restaurante, quantos amigos possuem o
+restaurante em alguma lista pública (`NetworkRecommendation.friend_count`).
+Os vetores são atualizados de forma incremental quando um amigo adiciona ou
+remove um `ListItem` ou muda a visibilidade de uma lista, de modo que o
+endpoint de recomendações vira uma única leitura indexada por usuário.
+Mudanças de amizade refazem o vetor inteiro do usuário num job
+(`schedule_rebuild`), fora da requisição.
+"""
+
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Set
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import jobs
+from .models import Friendship, Job, List, ListItem, NetworkRecommendation
+from .social_graph import get_friend_ids
+
+REBUILD_JOB = 'rebuild_network_recommendations'
+# Janela em que novas mudanças de amizade se juntam ao job já enfileirado
+REBUILD_DELAY_SECONDS = 5
+
+
+def _recount(owner_id: int, restaurant_ids: Iterable[int]) -> None:
+    """
+    Recalcula o friend_count de quem tem o dono como amigo, para cada restaurante.
+
+    Em vez de somar +1/-1 depois de checar se era a primeira (ou a última)
+    ocorrência pública do restaurante, as linhas afetadas são travadas e a
+    contagem é refeita no banco a partir das listas públicas dos amigos:
+    duas escritas simultâneas do mesmo dono não somam nem subtraem em dobro,
+    e a última a pegar a trava já enxerga os itens gravados pela outra.
+    """
+    restaurant_ids = sorted(set(restaurant_ids))
+    if not restaurant_ids:
+        return
+    follower_ids = sorted(Friendship.objects.filter(friend_id=owner_id).values_list('user_id', flat=True))
+    if not follower_ids:
+        return
+
+    # Donos distintos, entre os amigos do usuário da linha, com o restaurante numa lista pública
+    owners = ListItem.objects.filter(
+        restaurant_id=OuterRef('restaurant_id'),
+        lst__is_public=True,
+        lst__owner_id__in=Friendship.objects.filter(user_id=OuterRef(OuterRef('user_id'))).values('friend_id'),
+    ).order_by().values('restaurant_id').annotate(n=Count('lst__owner_id', distinct=True)).values('n')
+
+    with transaction.atomic():
+        NetworkRecommendation.objects.bulk_create(
+            [
+                NetworkRecommendation(user_id=follower_id, restaurant_id=restaurant_id, friend_count=0)
+                for follower_id in follower_ids
+                for restaurant_id in restaurant_ids
+            ],
+            ignore_conflicts=True,
+        )
+        rows = NetworkRecommendation.objects.filter(user_id__in=follower_ids, restaurant_id__in=restaurant_ids)
+        # A trava vem num comando anterior ao UPDATE para a contagem usar um snapshot
+        # tirado depois de a transação concorrente terminar (READ COMMITTED)
+        list(rows.select_for_update().order_by('id').values_list('id', flat=True))
+        rows.update(friend_count=Coalesce(Subquery(owners), 0))
+        rows.filter(friend_count__lte=0).delete()
+
+
+def on_list_item_added(item: ListItem) -> None:
+    """Novo item numa lista pública: recalcula o restaurante para os amigos do dono"""
+    lst = item.lst
+    if lst.is_public:
+        _recount(lst.owner_id, [item.restaurant_id])
+
+
+def on_list_item_removed(owner_id: int, restaurant_id: int, was_public: bool) -> None:
+    """Item removido de uma lista pública"""
+    if was_public:
+        _recount(owner_id, [restaurant_id])
+
+
+def on_list_visibility_changed(lst: List) -> None:
+    """Lista mudou de visibilidade: recalcula todos os restaurantes dela"""
+    _recount(lst.owner_id, lst.items.values_list('restaurant_id', flat=True))
+
+
+def on_list_deleted(owner_id: int, restaurant_ids: Iterable[int], was_public: bool) -> None:
+    """Lista apagada (itens removidos em cascata)"""
+    if was_public:
+        _recount(owner_id, restaurant_ids)
+
+
+def _public_restaurants_by_owner(owner_ids: Optional[Iterable[int]] = None) -> Dict[int, Set[int]]:
+    items = ListItem.objects.filter(lst__is_public=True)
+    if owner_ids is not None:
+        items = items.filter(lst__owner_id__in=list(owner_ids))
+    by_owner = defaultdict(set)
+    for owner_id, restaurant_id in items.values_list('lst__owner_id', 'restaurant_id').distinct().iterator():
+        by_owner[owner_id].add(restaurant_id)
+    return by_owner
+
+
+def _write_vector(user_id: int, counts: Counter) -> None:
+    NetworkRecommendation.objects.filter(user_id=user_id).delete()
+    NetworkRecommendation.objects.bulk_create([
+        NetworkRecommendation(user_id=user_id, restaurant_id=restaurant_id, friend_count=count)
+        for restaurant_id, count in counts.items()
+    ])
+
+
+def rebuild_for_user(user_id: int) -> int:
+    """Recalcula do zero o vetor de recomendações de um usuário"""
+    friend_ids = get_friend_ids(user_id)
+    counts = Counter()
+    for restaurants in _public_restaurants_by_owner(friend_ids).values():
+        counts.update(restaurants)
+    with transaction.atomic():
+        _write_vector(user_id, counts)
+    return len(counts)
+
+
+@jobs.handler(REBUILD_JOB)
+def _rebuild_job(payload: Dict) -> None:
+    rebuild_for_user(payload['user_id'])
+
+
+def schedule_rebuild(user_id: int) -> None:
+    """
+    Agenda a reconstrução do vetor de um usuário no worker de jobs.
+
+    Rajadas de mudanças de amizade do mesmo usuário (seed, aceite de vários
+    convites) viram um único job: só enfileira se não houver outro pendente.
+    """
+    pending = Job.objects.filter(kind=REBUILD_JOB, status=jobs.PENDING, payload__user_id=user_id)
+    if not pending.exists():
+        jobs.enqueue(REBUILD_JOB, {'user_id': user_id}, delay=REBUILD_DELAY_SECONDS)
+
+
+def rebuild_all(user_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Reconstrução offline dos vetores de todos os usuários.
+
+    Lê as amizades e os pares (dono, restaurante) públicos uma única vez e
+    monta os vetores em memória.
+
+    Args:
+        user_ids: Restringe a reconstrução a estes usuários (todos se None)
+
+    Returns:
+        int: Número de usuários reconstruídos
+    """
+    friendships = Friendship.objects.all()
+    if user_ids is not None:
+        user_ids = set(user_ids)
+        friendships = friendships.filter(user_id__in=user_ids)
+    friends_by_user = defaultdict(list)
+    for user_id, friend_id in friendships.values_list('user_id', 'friend_id').iterator():
+        friends_by_user[user_id].append(friend_id)
+
+    public_by_owner = _public_restaurants_by_owner()
+
+    rebuilt = 0
+    with transaction.atomic():
+        if user_ids is None:
+            NetworkRecommendation.objects.exclude(user_id__in=list(friends_by_user)).delete()
+        else:
+            for user_id in user_ids - set(friends_by_user):
+                NetworkRecommendation.objects.filter(user_id=user_id).delete()
+        for user_id, friend_ids in friends_by_user.items():
+            counts = Counter()
+            for friend_id in friend_ids:
+                counts.update(public_by_owner.get(friend_id, ()))
+            _write_vector(user_id, counts)
+            rebuilt += 1
+    return rebuilt
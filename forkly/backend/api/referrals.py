@@ -0,0 +1,98 @@
+"""
+Fluxo de referência (convites) do Forkly.
+
+O cadastro com código e a primeira review do convidado creditam pontos ao
+convidante. Cada etapa roda numa transação: usuário, perfil, `Referral`,
+pontos e extrato (`RewardLedger`) são gravados juntos ou não são gravados.
+
+Os pontos são somados no banco com F() (UPDATE ... SET points = points + N)
+em vez de ler-somar-gravar o perfil, que perdia créditos quando vários
+convidados do mesmo código se cadastravam ao mesmo tempo. A passagem
+registered -> first_review é um UPDATE condicional, então entre reviews
+simultâneas do mesmo convidado só uma paga o bônus.
+"""
+
+from collections import defaultdict
+from typing import Iterable, Optional, Tuple
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import F
+
+from .models import Profile, Referral, RewardLedger
+from .utils import gen_code
+
+REGISTER_POINTS = 50
+FIRST_REVIEW_POINTS = 100
+
+
+def credit_points(awards: Iterable[Tuple[int, int, str, dict]]) -> None:
+    """
+    Credita pontos a usuários.
+
+    Args:
+        awards: tuplas (user_id, pontos, motivo, meta); cada uma vira uma linha do extrato
+
+    Um UPDATE com F() por usuário (em ordem de id, para transações simultâneas
+    travarem os perfis na mesma ordem) e o extrato num único INSERT. Deve ser
+    chamado dentro da transação da operação que gerou os pontos.
+    """
+    awards = list(awards)
+    totals = defaultdict(int)
+    for user_id, points, _, _ in awards:
+        totals[user_id] += points
+    for user_id in sorted(totals):
+        Profile.objects.filter(user_id=user_id).update(points=F('points') + totals[user_id])
+    RewardLedger.objects.bulk_create([
+        RewardLedger(user_id=user_id, points=points, reason=reason, meta=meta)
+        for user_id, points, reason, meta in awards
+    ])
+
+
+def register_user(username: str, email: str, password: str, referral_code: Optional[str] = None) -> Tuple[User, Profile]:
+    """
+    Cadastra um usuário e, se o código de referência existir, registra o convite
+    e credita REGISTER_POINTS ao convidante.
+
+    Returns:
+        (usuário, perfil) criados
+    """
+    user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email))
+    # O hash da senha é caro: fica fora da transação (no SQLite ela já segura a trava de escrita)
+    # e, com o pool do PostgreSQL, sem segurar a conexão usada na validação do cadastro
+    connection = connections[router.db_for_write(User)]
+    if connection.settings_dict['OPTIONS'].get('pool') and not connection.in_atomic_block:
+        connection.close()
+    user.set_password(password)
+    with transaction.atomic():
+        user.save()
+        profile = Profile.objects.create(user=user, referral_code=gen_code(8))
+        if referral_code:
+            inviter_id = Profile.objects.filter(referral_code=referral_code).values_list('user_id', flat=True).first()
+            if inviter_id is not None:
+                Referral.objects.create(inviter_id=inviter_id, invitee=user, code=referral_code, status='registered')
+                credit_points([(inviter_id, REGISTER_POINTS, 'invite_registered', {'invitee': user.id})])
+    return user, profile
+
+
+def complete_first_review(invitee_id: int) -> Optional[Referral]:
+    """
+    Marca o convite do usuário como first_review e credita FIRST_REVIEW_POINTS
+    ao convidante, uma única vez por convite.
+
+    Pode ser chamado a cada review: depois da primeira não há mais convite em
+    'registered' (consulta pelo índice referral_invitee_status_idx).
+
+    Returns:
+        O convite concluído, ou None se não havia convite pendente
+    """
+    with transaction.atomic():
+        referral = Referral.objects.filter(invitee_id=invitee_id, status='registered').order_by('-created_at').first()
+        if referral is None:
+            return None
+        # Só a transação que fizer a transição paga o bônus
+        if not Referral.objects.filter(pk=referral.pk, status='registered').update(status='first_review'):
+            return None
+        credit_points([(referral.inviter_id, FIRST_REVIEW_POINTS, 'invite_first_review', {'invitee': referral.invitee_id})])
+    referral.status = 'first_review'
+    return referral
@@ -5,11 +5,14 @@ Includes input validation, sanitization, and security checks.
 """
 
 import re
+import math
 import hashlib
 import secrets
 import logging
 from functools import wraps
+from django.conf import settings
 from django.http import JsonResponse
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
@@ -19,6 +22,8 @@ from django.contrib.auth.models import User
 from rest_framework.response import Response
 from rest_framework import status
 
+from .ratelimit import Quota, get_user_rate_limiter
+
 logger = logging.getLogger('api')
 
 
@@ -101,34 +106,76 @@ def validate_input_data(data, required_fields=None, optional_fields=None):
     return len(errors) == 0, sanitized_data, errors
 
 
-def rate_limit_by_user(view_func):
+def user_rate_limit_response(user, scope, quota=None):
+    """
+    Count a request of `user` against the per-user quota of `scope`.
+    
+    Args:
+        user: Authenticated user
+        scope: Endpoint scope (key of USER_RATE_LIMITS)
+        quota: Explicit Quota, overriding the configured one
+    
+    Returns:
+        JsonResponse: 429 response with Retry-After if the quota is exhausted, else None
+    """
+    if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return None
+    
+    decision = get_user_rate_limiter().hit(user.id, scope, quota)
+    if decision.allowed:
+        return None
+    
+    retry_after = max(1, math.ceil(decision.retry_after))
+    logger.warning(f"User rate limit exceeded for user {user.id} on {scope}")
+    response = JsonResponse({
+        'error': 'User rate limit exceeded',
+        'message': 'Too many requests. Please try again later.',
+        'retry_after': retry_after
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit_by_user(view_func=None, *, scope=None, limit=None, window=None):
     """
     Decorator to apply rate limiting per user.
+    
+    Sliding-window quota per user and scope (see api.ratelimit), checked
+    with one atomic operation. Quotas come from USER_RATE_LIMITS[scope],
+    falling back to USER_RATE_LIMIT_DEFAULT, unless `limit`/`window` are
+    given. Unauthenticated requests are not counted.
+    
+    Usage:
+        @rate_limit_by_user
+        @rate_limit_by_user(scope='ai_chat')
+        @rate_limit_by_user(limit=10, window=60)
+    
+    Args:
+        scope: Quota name (defaults to the view function's name)
+        limit: Requests allowed per window
+        window: Window length in seconds
     """
-    @wraps(view_func)
-    def wrapper(request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return view_func(request, *args, **kwargs)
+    def decorator(func):
+        func_scope = scope or func.__name__
         
-        user_id = request.user.id
-        rate_key = f"user_rate_limit:{user_id}"
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                quota = None
+                if limit is not None or window is not None:
+                    configured = get_user_rate_limiter().quota_for(func_scope)
+                    quota = Quota(limit if limit is not None else configured.limit,
+                                  window if window is not None else configured.window)
+                limited = user_rate_limit_response(request.user, func_scope, quota)
+                if limited is not None:
+                    return limited
+            return func(request, *args, **kwargs)
         
-        # Check rate limit
-        from django.core.cache import cache
-        current_requests = cache.get(rate_key, 0)
-        
-        if current_requests >= 100:  # 100 requests per hour per user
-            return JsonResponse({
-                'error': 'User rate limit exceeded',
-                'message': 'Too many requests. Please try again later.'
-            }, status=429)
-        
-        # Increment counter
-        cache.set(rate_key, current_requests + 1, timeout=3600)
-        
-        return view_func(request, *args, **kwargs)
+        return wrapper
     
-    return wrapper
+    if view_func is not None:
+        return decorator(view_func)
+    return decorator
 
 
 def require_https(view_func):
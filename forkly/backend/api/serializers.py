@@ -20,6 +20,7 @@ class RestaurantSerializer(serializers.ModelSerializer):
     class Meta: 
         model=Restaurant; 
         fields="__all__"
+        read_only_fields=["list_count","public_list_count"]
 
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta: 
@@ -243,6 +244,18 @@ class AIConversationSerializer(serializers.ModelSerializer):
         fields = ['id', 'session_id', 'created_at', 'updated_at', 'is_active', 'messages']
         read_only_fields = ['id', 'session_id', 'created_at', 'updated_at']
 
+class AIConversationThreadSerializer(serializers.ModelSerializer):
+    """Conversa sem as mensagens (a thread é paginada na view)"""
+    summary = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = AIConversation
+        fields = ['id', 'session_id', 'created_at', 'updated_at', 'is_active', 'summary']
+        read_only_fields = fields
+    
+    def get_summary(self, obj):
+        return (obj.metadata or {}).get('summary', '')
+
 class ChatMessageSerializer(serializers.Serializer):
     message = serializers.CharField(max_length=1000)
     conversation_id = serializers.CharField(required=False, allow_blank=True)
@@ -274,6 +287,7 @@ class RestaurantDetailSerializer(serializers.ModelSerializer):
     class Meta:
         model = Restaurant
         fields = '__all__'
+        read_only_fields = ['list_count', 'public_list_count']
     
     def get_analytics(self, obj):
         try:
@@ -0,0 +1,65 @@
+"""
+Sinais do app `api`.
+
+Mantém os dados derivados (grafo social, recomendações da rede) coerentes com as escritas em
+`Friendship`, venham elas das views de amigos, do fluxo de referência ou dos
+scripts de seed, e invalida os snapshots de contexto dos assistentes de IA.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import ai_context
+from .models import (
+    Friendship, Reservation, RestaurantProfile, Review, Reward, Tier,
+    UserAchievement, UserReward, UserTier,
+)
+from .recommendations import schedule_rebuild
+from .social_graph import invalidate_friends
+
+
+@receiver(post_save, sender=Friendship)
+@receiver(post_delete, sender=Friendship)
+def friendship_changed(sender, instance, **kwargs):
+    """Após o commit, invalida a adjacência do dono da amizade e agenda a reconstrução das suas recomendações"""
+    user_id = instance.user_id
+
+    def refresh():
+        invalidate_friends(user_id)
+        ai_context.invalidate(ai_context.GAMIFICATION, user_id)
+        schedule_rebuild(user_id)
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=UserTier)
+@receiver(post_delete, sender=UserTier)
+@receiver(post_save, sender=UserAchievement)
+@receiver(post_delete, sender=UserAchievement)
+@receiver(post_save, sender=UserReward)
+@receiver(post_delete, sender=UserReward)
+def gamification_changed(sender, instance, **kwargs):
+    """Tier, conquistas ou resgates do usuário mudaram: descarta o snapshot de contexto"""
+    user_id = instance.user_id
+    transaction.on_commit(lambda: ai_context.invalidate(ai_context.GAMIFICATION, user_id))
+
+
+@receiver(post_save, sender=Tier)
+@receiver(post_delete, sender=Tier)
+@receiver(post_save, sender=Reward)
+@receiver(post_delete, sender=Reward)
+def gamification_catalog_changed(sender, instance, **kwargs):
+    """Tiers e recompensas entram no contexto de todos os usuários"""
+    transaction.on_commit(ai_context.invalidate_all)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=RestaurantProfile)
+def restaurant_activity_changed(sender, instance, **kwargs):
+    """Reservas, reviews ou ticket médio mudaram: descarta o snapshot do restaurante"""
+    restaurant_id = instance.restaurant_id
+    transaction.on_commit(lambda: ai_context.invalidate(ai_context.RESTAURANT, restaurant_id))
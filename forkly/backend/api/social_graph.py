@@ -0,0 +1,343 @@
+"""
+Grafo social do Forkly (amizades).
+
+Mantém no cache o conjunto de amigos de cada usuário para que os feeds
+sociais (listas dos amigos, recomendações da rede, gamificação) partam de um
+conjunto já carregado em vez de consultar `Friendship` a cada requisição.
+
+Também expõe um snapshot em memória do grafo no formato CSR (compressed
+sparse row) usado para consultas de amigos-de-amigos ("pessoas que você
+talvez conheça") sem self-joins no banco.
+"""
+
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+
+from .models import Friendship
+
+logger = logging.getLogger('api')
+
+FRIENDS_CACHE_PREFIX = 'social:friends'
+
+
+def _friends_key(user_id: int) -> str:
+    return f"{FRIENDS_CACHE_PREFIX}:{user_id}"
+
+
+def _cache_timeout() -> int:
+    return getattr(settings, 'SOCIAL_CACHE_TIMEOUT', 3600)
+
+
+def _empty_adjacency() -> Dict[str, List[int]]:
+    return {'friends': [], 'referred': []}
+
+
+def _load_adjacency(user_id: int) -> Dict[str, List[int]]:
+    """Carrega do banco os amigos (e os amigos referidos) de um usuário"""
+    adjacency = _empty_adjacency()
+    rows = Friendship.objects.filter(user_id=user_id).values_list('friend_id', 'is_referred')
+    for friend_id, is_referred in rows:
+        adjacency['friends'].append(friend_id)
+        if is_referred:
+            adjacency['referred'].append(friend_id)
+    return adjacency
+
+
+def get_adjacency(user_id: int) -> Dict[str, List[int]]:
+    """Retorna a adjacência do usuário, carregando e cacheando se necessário"""
+    key = _friends_key(user_id)
+    adjacency = cache.get(key)
+    if adjacency is None:
+        adjacency = _load_adjacency(user_id)
+        cache.set(key, adjacency, timeout=_cache_timeout())
+    return adjacency
+
+
+def get_friend_ids(user_id: int) -> List[int]:
+    """IDs de todos os amigos do usuário"""
+    return get_adjacency(user_id)['friends']
+
+
+def get_referred_friend_ids(user_id: int) -> List[int]:
+    """IDs dos amigos que entraram através do código de referência do usuário"""
+    return get_adjacency(user_id)['referred']
+
+
+def count_referred_friends(user_id: int) -> int:
+    return len(get_referred_friend_ids(user_id))
+
+
+def invalidate_friends(*user_ids: int) -> None:
+    """Descarta a adjacência cacheada dos usuários informados"""
+    keys = [_friends_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def _load_adjacencies(user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, List[int]]]:
+    """Adjacência de vários usuários (todos se None) com uma única varredura de `Friendship`"""
+    users = User.objects.all()
+    friendships = Friendship.objects.all()
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        users = users.filter(id__in=user_ids)
+        friendships = friendships.filter(user_id__in=user_ids)
+
+    adjacency = {user_id: _empty_adjacency() for user_id in users.values_list('id', flat=True)}
+    for user_id, friend_id, is_referred in friendships.values_list('user_id', 'friend_id', 'is_referred').iterator():
+        entry = adjacency.setdefault(user_id, _empty_adjacency())
+        entry['friends'].append(friend_id)
+        if is_referred:
+            entry['referred'].append(friend_id)
+    return adjacency
+
+
+def get_adjacencies(user_ids: Iterable[int]) -> Dict[int, Dict[str, List[int]]]:
+    """Adjacência de vários usuários: um get_many no cache e uma consulta para os que faltarem"""
+    keys = {_friends_key(user_id): user_id for user_id in set(user_ids)}
+    adjacency = {keys[key]: entry for key, entry in cache.get_many(list(keys)).items()}
+    missing = [user_id for user_id in keys.values() if user_id not in adjacency]
+    if missing:
+        loaded = _load_adjacencies(missing)
+        for user_id in missing:
+            loaded.setdefault(user_id, _empty_adjacency())
+        cache.set_many({_friends_key(user_id): entry for user_id, entry in loaded.items()}, timeout=_cache_timeout())
+        adjacency.update(loaded)
+    return adjacency
+
+
+def mutual_friend_counts(user_id: int, candidate_ids: Iterable[int]) -> Dict[int, int]:
+    """Número de amigos em comum entre o usuário e cada candidato (adjacências do cache, sem o snapshot)"""
+    direct = set(get_friend_ids(user_id))
+    candidate_ids = list(candidate_ids)
+    adjacency = get_adjacencies(candidate_ids)
+    return {candidate_id: len(direct.intersection(adjacency[candidate_id]['friends'])) for candidate_id in candidate_ids}
+
+
+def warm_friend_cache(user_ids: Optional[Iterable[int]] = None, batch_size: int = 1000) -> int:
+    """
+    Pré-carrega a adjacência de vários usuários com uma única varredura de `Friendship`.
+
+    Args:
+        user_ids: Usuários a aquecer (todos se None)
+        batch_size: Quantidade de chaves gravadas por `set_many`
+
+    Returns:
+        int: Número de usuários aquecidos
+    """
+    adjacency = _load_adjacencies(user_ids)
+    timeout = _cache_timeout()
+    batch = {}
+    for user_id, entry in adjacency.items():
+        batch[_friends_key(user_id)] = entry
+        if len(batch) >= batch_size:
+            cache.set_many(batch, timeout=timeout)
+            batch = {}
+    if batch:
+        cache.set_many(batch, timeout=timeout)
+    return len(adjacency)
+
+
+class FriendGraphSnapshot:
+    """
+    Snapshot imutável de `Friendship` em formato CSR.
+
+    Os vizinhos do nó `i` ficam em `indices[indptr[i]:indptr[i + 1]]`, e
+    `referred` marca as arestas criadas por código de referência. Os IDs de
+    usuário ficam ordenados em `user_ids`, então a busca do nó é binária.
+    """
+
+    def __init__(self, user_ids: array, indptr: array, indices: array, referred: bytearray, built_at: float):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.referred = referred
+        self.built_at = built_at
+
+    @classmethod
+    def build(cls) -> 'FriendGraphSnapshot':
+        """Monta o snapshot com uma única varredura ordenada de `Friendship`"""
+        rows = list(
+            Friendship.objects.order_by('user_id', 'friend_id')
+            .values_list('user_id', 'friend_id', 'is_referred')
+            .iterator()
+        )
+        user_ids = array('q', sorted({row[0] for row in rows} | {row[1] for row in rows}))
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+
+        indptr = array('i', [0] * (len(user_ids) + 1))
+        indices = array('i')
+        referred = bytearray()
+        for user_id, friend_id, is_referred in rows:
+            indptr[position[user_id] + 1] += 1
+            indices.append(position[friend_id])
+            referred.append(1 if is_referred else 0)
+        for i in range(len(user_ids)):
+            indptr[i + 1] += indptr[i]
+
+        return cls(user_ids, indptr, indices, referred, time.time())
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    def _node(self, user_id: int) -> Optional[int]:
+        i = bisect_left(self.user_ids, user_id)
+        if i < len(self.user_ids) and self.user_ids[i] == user_id:
+            return i
+        return None
+
+    def _edges(self, node: int) -> range:
+        return range(self.indptr[node], self.indptr[node + 1])
+
+    def suggestions(self, user_id: int, limit: int = 10, max_depth: int = 2,
+                    max_visits: int = 50000, exclude: Iterable[int] = ()) -> List[Dict[str, int]]:
+        """
+        Busca em largura limitada a partir do usuário.
+
+        Candidatos são ranqueados pela distância, pelo número de caminhos mais
+        curtos (para distância 2, o número de amigos em comum) e pelo número de
+        caminhos que passam por uma aresta de referência.
+
+        Args:
+            user_id: Usuário de origem
+            limit: Quantidade máxima de sugestões
+            max_depth: Profundidade máxima da busca (2 = amigos de amigos)
+            max_visits: Limite de arestas visitadas
+            exclude: IDs de usuário que não devem ser sugeridos
+
+        Returns:
+            list: Dicts com user_id, distance, mutual_friends e referral_links
+        """
+        source = self._node(user_id)
+        if source is None:
+            return []
+
+        distance = {source: 0}
+        paths = {source: 1}
+        referral_paths = {source: 0}
+        frontier = [source]
+        visits = 0
+        for depth in range(1, max_depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for edge in self._edges(node):
+                    visits += 1
+                    neighbor = self.indices[edge]
+                    seen = distance.get(neighbor)
+                    if seen is None:
+                        distance[neighbor] = depth
+                        paths[neighbor] = 0
+                        referral_paths[neighbor] = 0
+                        next_frontier.append(neighbor)
+                    elif seen != depth:
+                        continue
+                    paths[neighbor] += paths[node]
+                    referral_paths[neighbor] += paths[node] if self.referred[edge] else referral_paths[node]
+                if visits >= max_visits:
+                    break
+            frontier = next_frontier
+            if visits >= max_visits or not frontier:
+                break
+
+        excluded = set(exclude)
+        candidates = [
+            {
+                'user_id': self.user_ids[node],
+                'distance': dist,
+                'mutual_friends': paths[node] if dist == 2 else 0,
+                'referral_links': referral_paths[node],
+                '_paths': paths[node],
+            }
+            for node, dist in distance.items()
+            if dist >= 2 and self.user_ids[node] not in excluded
+        ]
+        candidates.sort(key=lambda c: (c['distance'], -c['_paths'], -c['referral_links'], c['user_id']))
+        for candidate in candidates:
+            del candidate['_paths']
+        return candidates[:limit]
+
+
+SNAPSHOT_CACHE_KEY = 'social:csr_snapshot'
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_build_lock = threading.Lock()  # serializa a construção inicial (processo ainda sem snapshot)
+_refreshing = False
+
+
+def _snapshot_ttl() -> int:
+    return getattr(settings, 'SOCIAL_GRAPH_SNAPSHOT_TTL', 300)
+
+
+def _is_fresh(snapshot: FriendGraphSnapshot) -> bool:
+    return time.time() - snapshot.built_at < _snapshot_ttl()
+
+
+def refresh_snapshot() -> FriendGraphSnapshot:
+    """Reconstrói o snapshot e o publica no cache para os demais workers"""
+    global _snapshot
+    snapshot = FriendGraphSnapshot.build()
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, timeout=None)
+    with _snapshot_lock:
+        _snapshot = snapshot
+    return snapshot
+
+
+def _refresh_in_background() -> None:
+    global _refreshing
+    try:
+        refresh_snapshot()
+    except Exception as e:
+        logger.error(f"Social graph snapshot refresh failed, serving the stale one: {e}")
+    finally:
+        connection.close()  # conexão própria desta thread
+        with _snapshot_lock:
+            _refreshing = False
+
+
+def get_snapshot() -> FriendGraphSnapshot:
+    """
+    Snapshot CSR do processo atual.
+
+    Reaproveita a cópia local enquanto estiver dentro do TTL. Vencido o TTL,
+    adota a versão publicada no cache pelo job de refresh, se for mais nova;
+    senão continua servindo a cópia velha enquanto uma única thread de fundo a
+    reconstrói. Só um processo sem snapshot algum constrói na requisição, e
+    uma requisição por vez (as demais esperam por ela).
+    """
+    global _snapshot, _refreshing
+    snapshot = _snapshot
+    if snapshot is not None and _is_fresh(snapshot):
+        return snapshot
+
+    with _snapshot_lock:
+        snapshot = _snapshot
+        if snapshot is not None and _refreshing:
+            return snapshot
+        shared = cache.get(SNAPSHOT_CACHE_KEY)
+        if shared is not None and (snapshot is None or shared.built_at > snapshot.built_at):
+            _snapshot = snapshot = shared
+        if snapshot is not None:
+            if not _is_fresh(snapshot):
+                _refreshing = True
+                threading.Thread(target=_refresh_in_background, name='social-graph-refresh', daemon=True).start()
+            return snapshot
+
+    with _build_lock:
+        return _snapshot if _snapshot is not None else refresh_snapshot()
+
+
+def suggest_friends(user_id: int, limit: int = 10, max_depth: int = 2) -> List[Dict[str, int]]:
+    """'Pessoas que você talvez conheça', ignorando quem já é amigo (adjacência atualizada)"""
+    exclude = set(get_friend_ids(user_id))
+    exclude.add(user_id)
+    return get_snapshot().suggestions(user_id, limit=limit, max_depth=max_depth, exclude=exclude)
@@ -1,3 +1,424 @@
-from django.test import TestCase
+import asyncio
+import base64
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import DatabaseError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import db_routers, jobs, metrics
+from .ai_cache import ResponseCache, context_bucket
+from .ai_gamification_service import AIGamificationService
+from .cache_backends import TieredCache
+from .llm_client import AsyncLLMClient
+from .llm_gateway import LLMError, LLMGateway
+from .models import Job, Restaurant
+from .ratelimit import Limit, LocalSlidingWindows, LocalTokenBuckets, Quota
+
+
+def _context(username, referrals, points):
+    return {
+        'username': username,
+        'current_tier': 'Prata',
+        'current_referrals': referrals,
+        'total_points': points,
+        'next_tier': 'Ouro',
+        'referrals_to_next': 6 - referrals,
+        'achievements_count': referrals,
+        'claimed_rewards': 1,
+        'available_rewards_count': 4,
+        'total_referrals': referrals,
+        'successful_referrals': referrals,
+    }
+
+
+class EchoLLM:
+    """LLM que repete o prompt inteiro: o pior caso para vazamento pela resposta cacheada"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def chat(self, messages, **kwargs):
+        self.prompts.append(messages[-1]['content'])
+        return messages[-1]['content']
+
+    async def stream_chat(self, messages, **kwargs):
+        self.prompts.append(messages[-1]['content'])
+        yield messages[-1]['content']
+
+
+class GamificationResponseCacheTests(SimpleTestCase):
+    """Usuários no mesmo bucket do cache nunca veem o nome ou os números um do outro"""
+
+    contexts = {
+        'alice_cache': _context('alice_cache', referrals=4, points=137),
+        'bruno_cache': _context('bruno_cache', referrals=5, points=412),
+    }
+
+    def setUp(self):
+        self.service = AIGamificationService()
+        self.service.openai_key = 'test-key'
+        self.service.llm = EchoLLM()
+        self.service.get_user_gamification_context = lambda user: self.contexts[user.username]
+        patcher = mock.patch('api.ai_gamification_service.get_response_cache', return_value=ResponseCache(100, 300))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.alice, self.bruno = User(username='alice_cache'), User(username='bruno_cache')
+
+    def assertNoDataOf(self, username, text):
+        context = self.contexts[username]
+        self.assertNotIn(username, text)
+        for figure in (context['total_points'], context['current_referrals']):
+            self.assertIsNone(re.search(rf'(?<![\d-]){figure}(?![\d-])', text), f"{figure} leaked: {text}")
+
+    def test_same_bucket(self):
+        self.assertEqual(context_bucket(self.contexts['alice_cache']), context_bucket(self.contexts['bruno_cache']))
+
+    async def test_cached_reply_does_not_leak(self):
+        first = await self.service.agenerate_ai_response(self.alice, 'Como subo de tier?')
+        second = await self.service.agenerate_ai_response(self.bruno, 'como subo de tier')
+        self.assertEqual(len(self.service.llm.prompts), 1)  # a segunda veio do cache
+        self.assertEqual(first, second)
+        self.assertNoDataOf('alice_cache', second)
+        self.assertNoDataOf('bruno_cache', first)
+
+    async def test_cached_stream_does_not_leak(self):
+        first = ''.join([delta async for delta in self.service.astream_ai_response(self.alice, 'Como subo de tier?')])
+        second = ''.join([delta async for delta in self.service.astream_ai_response(self.bruno, 'como subo de tier')])
+        self.assertEqual(len(self.service.llm.prompts), 1)
+        self.assertNoDataOf('alice_cache', second)
+        self.assertNoDataOf('bruno_cache', first)
+
+
+def _upstream(request):
+    """Upstream falso: o campo `case` do payload escolhe a falha"""
+    case = json.loads(request.content)['case']
+    if case == 'http_error':
+        return httpx.Response(500)
+    if case == 'invalid_json':
+        return httpx.Response(200, content=b'not json')
+    if case == 'connect_error':
+        raise httpx.ConnectError('refused', request=request)
+    if case == 'crash':
+        raise RuntimeError('bug no transporte')
+    if case == 'null_delta':
+        return httpx.Response(200, content=b'data: {"choices": [{"delta": null}]}\n\n')
+    return httpx.Response(200, json={'choices': [{'message': {'content': 'ok'}}]})
+
+
+class LLMGatewayFailureTests(SimpleTestCase):
+    """Toda falha resolve o chamador com LLMError e libera a entrada de deduplicação"""
+
+    url = 'http://llm.test/v1/chat/completions'
+
+    def gateway(self, handler=_upstream, **kwargs):
+        return LLMGateway(workers=2, transport=httpx.MockTransport(handler), **kwargs)
+
+    async def complete(self, gateway, case, url=None):
+        future = gateway.submit(url or self.url, {}, {'case': case}, 'key')
+        return await asyncio.wait_for(asyncio.wrap_future(future), 5)
+
+    async def test_every_failure_raises_llm_error(self):
+        gateway = self.gateway()
+        for case in ('http_error', 'invalid_json', 'connect_error', 'crash'):
+            with self.subTest(case=case), self.assertRaises(LLMError):
+                await self.complete(gateway, case)
+        with self.assertRaises(LLMError):
+            await self.complete(gateway, 'ok', url='http://llm\x00.test/')  # httpx.InvalidURL não é HTTPError
+        self.assertEqual(await self.complete(gateway, 'ok'), {'choices': [{'message': {'content': 'ok'}}]})
+        self.assertEqual(gateway.stats()['in_flight_unique'], 0)
+
+    async def test_malformed_stream_chunk_raises_llm_error(self):
+        with self.assertRaises(LLMError):
+            async for _ in self.gateway().stream(self.url, {}, {'case': 'null_delta'}, 'key'):
+                pass
+
+    async def test_deadline_checked_after_per_key_limits(self):
+        async def slow(request):
+            await asyncio.sleep(0.5)
+            return _upstream(request)
+
+        gateway = self.gateway(slow, key_concurrency=1, queue_timeout=0.2)
+        first = asyncio.wrap_future(gateway.submit(self.url, {}, {'case': 'ok'}, 'key'))
+        with self.assertRaisesMessage(LLMError, 'expired'):
+            await self.complete(gateway, 'ok-2')
+        await first
+        self.assertEqual(gateway.stats()['expired'], 1)
+
+    async def test_caller_timeout_releases_deduplication(self):
+        async def hang(request):
+            await asyncio.sleep(5)
+
+        gateway = self.gateway(hang, queue_timeout=0.1, timeout=0.2)
+        with mock.patch('api.llm_client.get_gateway', return_value=gateway):
+            with self.assertRaisesMessage(LLMError, 'timed out'):
+                await AsyncLLMClient(api_key='test-key').chat([{'role': 'user', 'content': 'oi'}])
+        self.assertEqual(gateway.stats()['in_flight_unique'], 0)
+
+
+class LocalRateLimitStoreTests(SimpleTestCase):
+    """Stores em processo: decisão e retry_after com o relógio controlado"""
+
+    def setUp(self):
+        self.now = 1000.0
+        for clock in ('monotonic', 'time'):
+            patcher = mock.patch(f'api.ratelimit.time.{clock}', side_effect=lambda: self.now)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_token_bucket_burst_then_refill(self):
+        store, limit = LocalTokenBuckets(), Limit(rate=2, per=1, burst=2)
+        self.assertTrue(store.consume([('ip:1', limit)]).allowed)
+        self.assertTrue(store.consume([('ip:1', limit)]).allowed)
+        denied = store.consume([('ip:1', limit)])
+        self.assertFalse(denied.allowed)
+        self.assertAlmostEqual(denied.retry_after, 0.5)
+        self.assertTrue(store.consume([('ip:2', limit)]).allowed)  # chaves independentes
+        self.now += 0.5
+        self.assertTrue(store.consume([('ip:1', limit)]).allowed)
+
+    def test_token_buckets_consume_all_or_nothing(self):
+        store = LocalTokenBuckets()
+        loose, tight = Limit(rate=10, per=1, burst=10), Limit(rate=1, per=10, burst=1)
+        self.assertTrue(store.consume([('global', loose), ('route', tight)]).allowed)
+        denied = store.consume([('global', loose), ('route', tight)])
+        self.assertFalse(denied.allowed)
+        self.assertAlmostEqual(denied.retry_after, 10.0)
+        # A negada não gastou o token do bucket folgado: restam 9 dos 10
+        for _ in range(9):
+            self.assertTrue(store.consume([('global', loose)]).allowed)
+        self.assertFalse(store.consume([('global', loose)]).allowed)
+
+    def test_sliding_window_limit_and_retry_after(self):
+        store, quota = LocalSlidingWindows(), Quota(limit=3, window=10)
+        for _ in range(3):
+            self.assertTrue(store.consume('user:1:ai_chat', quota).allowed)
+        denied = store.consume('user:1:ai_chat', quota)
+        self.assertFalse(denied.allowed)
+        self.assertAlmostEqual(denied.retry_after, 10 + 10 / 3)
+        self.now += denied.retry_after - 0.1
+        self.assertFalse(store.consume('user:1:ai_chat', quota).allowed)
+        self.now += 0.2
+        self.assertTrue(store.consume('user:1:ai_chat', quota).allowed)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tiered_remote': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-tests'},
+})
+class TieredCacheInvalidationTests(SimpleTestCase):
+    """Escritas pelo TieredCache descartam a cópia local; escritas fora dele só valem após o TTL local"""
+
+    def setUp(self):
+        self.remote = caches['tiered_remote']
+        self.remote.clear()
+        self.tiered = self.make_cache()
+
+    def make_cache(self):
+        return TieredCache(None, {'OPTIONS': {
+            'REMOTE': 'tiered_remote', 'LOCAL_TIMEOUT': 60, 'LOCAL_PREFIXES': ['social:'],
+            'CHANNEL': f'tests:{self.id()}',
+        }})
+
+    def test_local_copy_until_invalidated(self):
+        self.tiered.set('social:friends:1', [2])
+        self.remote.set('social:friends:1', [2, 3])  # outro processo, sem pub/sub
+        self.assertEqual(self.tiered.get('social:friends:1'), [2])
+        self.tiered.delete('social:friends:1')
+        self.assertIsNone(self.tiered.get('social:friends:1'))
+
+    def test_every_write_drops_the_local_copy(self):
+        writes = {
+            'set': lambda cache, key: cache.set(key, 'new'),
+            'set_many': lambda cache, key: cache.set_many({key: 'new'}),
+            'delete_many': lambda cache, key: cache.delete_many([key]),
+            'incr': lambda cache, key: cache.incr(key),
+        }
+        for name, write in writes.items():
+            with self.subTest(write=name):
+                key = f'social:{name}'
+                self.tiered.set(key, 1)
+                self.assertEqual(self.tiered.get(key), 1)
+                write(self.tiered, key)
+                self.assertEqual(self.tiered.get(key), self.remote.get(key))
+
+    def test_instances_of_other_threads_share_the_local_tier(self):
+        other = self.make_cache()
+        other.set('social:friends:7', [1])
+        self.assertEqual(self.tiered.get('social:friends:7'), [1])
+        self.tiered.delete('social:friends:7')
+        self.assertIsNone(other.get('social:friends:7'))
+
+    def test_keys_outside_prefixes_are_not_kept_locally(self):
+        self.tiered.set('db:sticky:user:1', 1)
+        self.remote.set('db:sticky:user:1', 2)
+        self.assertEqual(self.tiered.get('db:sticky:user:1'), 2)
+
+
+class JobWorkerTests(TestCase):
+    """Claim, retry com backoff e liberação de jobs presos (emails pelo backend de arquivo)"""
+
+    def setUp(self):
+        self.outbox = tempfile.mkdtemp()
+        patcher = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.filebased.EmailBackend', EMAIL_FILE_PATH=self.outbox,
+        )
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        jobs.get_mail_sender().close()
+        self.addCleanup(jobs.get_mail_sender().close)
+
+    def sent(self):
+        jobs.get_mail_sender().close()  # o backend de arquivo grava ao fechar a conexão
+        return sum(len(open(os.path.join(self.outbox, name)).read().split('Subject: ')) - 1
+                   for name in os.listdir(self.outbox))
+
+    def test_claims_only_due_jobs_once(self):
+        due = [jobs.enqueue_email(f'Oi {i}', 'corpo', [f'u{i}@forkly.local']) for i in range(2)]
+        later = jobs.enqueue_email('Depois', 'corpo', ['later@forkly.local'])
+        Job.objects.filter(pk=later.pk).update(run_at=timezone.now() + timedelta(hours=1))
+
+        self.assertEqual(jobs.JobWorker('w1').run_once(), 2)
+        self.assertEqual(jobs.JobWorker('w2').run_once(), 0)
+        self.assertEqual(self.sent(), 2)
+        self.assertEqual(set(Job.objects.filter(pk__in=[j.pk for j in due]).values_list('status', flat=True)), {jobs.DONE})
+        self.assertEqual(Job.objects.get(pk=later.pk).status, jobs.PENDING)
+
+    def test_failed_job_is_retried_then_marked_failed(self):
+        def flaky(payload):
+            raise RuntimeError('upstream fora do ar')
+
+        with mock.patch.dict(jobs._handlers, {'test_flaky': (flaky, False)}):
+            job = jobs.enqueue('test_flaky', {}, max_attempts=2)
+            worker = jobs.JobWorker('w1')
+            self.assertEqual(worker.run_once(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (jobs.PENDING, 1))
+            self.assertGreater(job.run_at, timezone.now())
+            self.assertIn('upstream fora do ar', job.last_error)
+
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+            self.assertEqual(worker.run_once(), 1)
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (jobs.FAILED, 2))
+            self.assertEqual(worker.counters['retried'], 1)
+            self.assertEqual(worker.counters['failed'], 1)
+
+    @override_settings(JOB_LOCK_TIMEOUT_SECONDS=60)
+    def test_release_stale_returns_only_expired_locks(self):
+        stale = jobs.enqueue_email('Preso', 'corpo', ['stale@forkly.local'])
+        alive = jobs.enqueue_email('Rodando', 'corpo', ['alive@forkly.local'])
+        Job.objects.filter(pk=stale.pk).update(status=jobs.RUNNING, locked_by='morto:1',
+                                               locked_at=timezone.now() - timedelta(seconds=61))
+        Job.objects.filter(pk=alive.pk).update(status=jobs.RUNNING, locked_by='vivo:2', locked_at=timezone.now())
+
+        worker = jobs.JobWorker('w1')
+        self.assertEqual(worker.release_stale(), 1)
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, jobs.DONE)
+        self.assertEqual(Job.objects.get(pk=alive.pk).locked_by, 'vivo:2')
+        self.assertEqual(self.sent(), 1)
+
+    def test_finish_skips_jobs_claimed_by_another_worker(self):
+        def slow(payload):
+            # Enquanto roda, o job é liberado como preso e reivindicado por outro worker
+            Job.objects.filter(kind='test_slow').update(locked_by='w2', locked_at=timezone.now())
+
+        with mock.patch.dict(jobs._handlers, {'test_slow': (slow, False)}):
+            job = jobs.enqueue('test_slow', {})
+            worker = jobs.JobWorker('w1')
+            with self.assertLogs('api', 'WARNING'):
+                self.assertEqual(worker.run_once(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by), (jobs.RUNNING, 'w2'))
+        self.assertEqual((worker.counters['done'], worker.counters['lost']), (0, 1))
+
+
+def _bearer(user_id):
+    payload = base64.urlsafe_b64encode(json.dumps({'user_id': user_id}).encode()).decode().rstrip('=')
+    return f'Bearer header.{payload}.signature'
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'], REPLICA_STICKY_SECONDS=5, REPLICA_RETRY_SECONDS=30)
+class ReplicaRouterTests(SimpleTestCase):
+    """Leituras seguras vão para a réplica; escritas fixam o usuário no primário; réplica fora cai no primário"""
+
+    def setUp(self):
+        self.router = db_routers.ReplicaRouter()
+        self.factory = RequestFactory()
+        self.replica = mock.Mock()
+        patcher = mock.patch.object(db_routers, 'connections', {
+            'default': mock.Mock(in_atomic_block=False), 'replica_1': self.replica,
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        down = mock.patch.dict(db_routers._down_until, clear=True)
+        down.start()
+        self.addCleanup(down.stop)
+        self.addCleanup(cache.delete_many, [f'{db_routers.STICKY_PREFIX}user:{i}' for i in (1, 2)])
+
+    def request(self, method='get', user_id=1):
+        return db_routers.begin_request(getattr(self.factory, method)('/api/x/', HTTP_AUTHORIZATION=_bearer(user_id)))
+
+    def test_safe_reads_use_the_replica(self):
+        token = self.request()
+        self.assertEqual(self.router.db_for_read(Restaurant), 'replica_1')
+        self.assertEqual(self.router.db_for_read(User), 'default')  # autenticação sempre no primário
+        db_routers.finish_request(token)
+
+        token = self.request('post')
+        self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+        db_routers.finish_request(token)
+
+    def test_write_sticks_the_user_to_the_primary(self):
+        token = self.request()
+        self.assertEqual(self.router.db_for_write(Restaurant), 'default')
+        self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+        db_routers.finish_request(token)
+
+        token = self.request()
+        self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+        db_routers.finish_request(token)
+        token = self.request(user_id=2)
+        self.assertEqual(self.router.db_for_read(Restaurant), 'replica_1')
+        db_routers.finish_request(token)
+
+    def test_unreachable_replica_falls_back_and_is_skipped(self):
+        self.replica.ensure_connection.side_effect = DatabaseError('connection refused')
+        with self.assertLogs('api', 'WARNING'):
+            for _ in range(2):
+                token = self.request()
+                self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+                db_routers.finish_request(token)
+        self.assertEqual(self.replica.ensure_connection.call_count, 1)  # a segunda nem tenta a réplica
+
+    def test_outside_requests_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Restaurant), 'default')
+
+
+class MetricsShardTests(SimpleTestCase):
+    """Shards de threads encerradas entram no total do processo e são descartados"""
+
+    def record(self):
+        token = metrics.start_request()
+        metrics.finish_request(token, 'shard-test/', 'GET', 200, 0.01, 10)
+
+    def test_finished_threads_are_folded_and_pruned(self):
+        before = metrics.collect().get(('shard-test/', 'GET', '2xx'), [0])[metrics.COUNT]
+        for _ in range(50):
+            thread = threading.Thread(target=self.record)
+            thread.start()
+            thread.join()
+        self.record()
+        series = metrics.collect()[('shard-test/', 'GET', '2xx')]
+        self.assertEqual(series[metrics.COUNT] - before, 51)
+        self.assertLessEqual(len(metrics._shards), threading.active_count())
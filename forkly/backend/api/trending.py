@@ -0,0 +1,92 @@
+"""
+Motor de tendências dos restaurantes.
+
+Cada evento (review, inclusão em lista, reserva) soma um peso ao score do
+restaurante, e o score decai exponencialmente com meia-vida configurável.
+Para atualizar em O(1) sem reescrever todos os scores, guardamos o valor em
+escala logarítmica relativa a uma época fixa T0:
+
+    log_score = ln(Σ peso_i · e^(λ·(t_i − T0)))
+
+A ordem entre restaurantes não depende do instante da leitura, então o top-k
+por região é uma varredura do índice (region, -log_score). O valor decaído só
+é calculado na leitura: score(t) = e^(log_score − λ·(t − T0)).
+"""
+
+import math
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Restaurant, RestaurantTrend
+
+def _decay_rate() -> float:
+    """λ por segundo a partir da meia-vida configurada"""
+    half_life_hours = getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 72)
+    return math.log(2) / (half_life_hours * 3600.0)
+
+
+def _epoch() -> datetime:
+    return datetime.fromisoformat(getattr(settings, 'TRENDING_EPOCH', '2025-01-01')).replace(tzinfo=dt_timezone.utc)
+
+
+def _elapsed(at: datetime) -> float:
+    return (at - _epoch()).total_seconds()
+
+
+def _weight(event: str) -> float:
+    return settings.TRENDING_WEIGHTS[event]
+
+
+def _logaddexp(a: float, b: float) -> float:
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+def region_for(lat: float, lng: float) -> str:
+    """Célula da grade (em graus) que contém o ponto"""
+    cell = getattr(settings, 'TRENDING_REGION_CELL_DEGREES', 0.5)
+    return f"{math.floor(lat / cell)}:{math.floor(lng / cell)}"
+
+
+def record_event(restaurant: Restaurant, event: str, at: Optional[datetime] = None) -> None:
+    """
+    Soma um evento ao score do restaurante em O(1).
+
+    Args:
+        restaurant: Restaurante que recebeu o evento
+        event: 'review', 'list_add' ou 'reservation'
+        at: Instante do evento (agora se None)
+    """
+    contribution = math.log(_weight(event)) + _decay_rate() * _elapsed(at or timezone.now())
+    region = region_for(restaurant.lat, restaurant.lng)
+    with transaction.atomic():
+        trend, _ = RestaurantTrend.objects.select_for_update().get_or_create(
+            restaurant=restaurant, defaults={'region': region}
+        )
+        if trend.log_score is None:
+            trend.log_score = contribution
+        else:
+            trend.log_score = _logaddexp(trend.log_score, contribution)
+        trend.region = region
+        trend.save(update_fields=['log_score', 'region', 'updated_at'])
+
+
+def decayed_score(log_score: float, at: Optional[datetime] = None) -> float:
+    """Valor do score no instante da leitura (decaimento preguiçoso)"""
+    return math.exp(log_score - _decay_rate() * _elapsed(at or timezone.now()))
+
+
+def top_trending(region: Optional[str] = None, limit: int = 20) -> List[Tuple[Restaurant, float]]:
+    """Top-k restaurantes em alta, opcionalmente restrito a uma região"""
+    trends = RestaurantTrend.objects.filter(log_score__isnull=False)
+    if region is not None:
+        trends = trends.filter(region=region)
+    now = timezone.now()
+    return [
+        (trend.restaurant, decayed_score(trend.log_score, now))
+        for trend in trends.select_related('restaurant').order_by('-log_score')[:limit]
+    ]
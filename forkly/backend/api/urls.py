@@ -30,6 +30,7 @@ urlpatterns = [
   path("friends/add/", add_friend_view),
   path("friends/<int:friend_id>/", remove_friend_view),
   path("users/search/", search_users_view),
+  path("users/suggestions/", friend_suggestions_view),
   
   # Rotas de Listas (específicas)
   path("lists/create/", create_list_view),
@@ -37,6 +38,7 @@ urlpatterns = [
   path("lists/friends/", friends_lists_view),
   path("restaurants/network-recommendations/", network_recommendations_view),
   path("restaurants/popular/", popular_restaurants_view),
+  path("restaurants/trending/", trending_restaurants_view),
   
   # Rotas de Gamificação
   path("gamification/stats/", gamification_stats_view),
@@ -53,6 +55,7 @@ urlpatterns = [
   # Rotas de Chat com IA
   path("ai/chat/start/", start_ai_conversation_view),
   path("ai/chat/send/", send_ai_message_view),
+  path("ai/chat/stream/", stream_ai_message_view),
   path("ai/chat/conversations/", get_ai_conversations_view),
   path("ai/chat/conversations/<str:conversation_id>/", get_ai_conversation_view),
   path("ai/chat/conversations/<str:conversation_id>/end/", end_ai_conversation_view),
@@ -1,39 +1,44 @@
 import os, json
 from dotenv import load_dotenv
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout
 from django.db.models import F
-from django.db import models
-from django.core.mail import send_mail
-from django.conf import settings
+from django.db import OperationalError, models, transaction
 from django.utils.crypto import get_random_string
-from rest_framework import viewsets, permissions, status
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from rest_framework import viewsets, permissions, status, exceptions
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Profile, Restaurant, Review, List, ListItem, Referral, RewardLedger, Tier, UserTier, Achievement, UserAchievement, Reward, UserReward, Friendship, AIConversation, AIMessage, RestaurantOwner, RestaurantProfile, Reservation, RestaurantAnalytics
+from .models import Profile, Restaurant, Review, List, ListItem, Referral, RewardLedger, Tier, UserTier, Achievement, UserAchievement, Reward, UserReward, Friendship, AIConversation, AIMessage, RestaurantOwner, RestaurantProfile, Reservation, RestaurantAnalytics, NetworkRecommendation
 from .serializers import *
 from .ai_gamification_service import AIGamificationService
 from .ai_restaurant_service import AIRestaurantService
-from .utils import gen_code, haversine
+from .social_graph import get_friend_ids, count_referred_friends, mutual_friend_counts, suggest_friends
+from . import ai_history, insights, jobs, popularity, recommendations, referrals, trending
+from .security import rate_limit_by_user, user_rate_limit_response, validate_coordinates
+from .utils import haversine
 
 load_dotenv()
 OPENAI_KEY = os.getenv("OPENAI_API_KEY")
 FRONTEND_BASE_URL = os.getenv("FRONTEND_BASE_URL", "http://localhost:43495")
 
 def _send_push_notification(user: User, title: str, body: str):
-    """Simple pseudo-push: send email if available (stub for FCM/OneSignal)."""
+    """Simple pseudo-push: send email if available (stub for FCM/OneSignal).
+
+    O email entra na fila de jobs (api.jobs); a view não espera o SMTP.
+    """
     try:
         if user.email:
-            send_mail(
-                subject=title,
-                message=body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=True,
-            )
+            jobs.enqueue_email(title, body, [user.email])
     except Exception:
         pass
 
@@ -87,15 +92,9 @@ def create_review(request):
     rest=Restaurant.objects.get(id=request.data["restaurant"])
     ratings=list(Review.objects.filter(restaurant=rest).values_list("rating", flat=True))
     rest.rating_count=len(ratings); rest.rating_avg=sum(ratings)/len(ratings) if ratings else 0; rest.save()
-    # referral milestone
-    first=Review.objects.filter(user_id=request.data["user"]).count()==1
-    if first:
-        ref=Referral.objects.filter(invitee_id=request.data["user"], status="registered").order_by("-created_at").first()
-        if ref:
-            ref.status="first_review"; ref.save()
-            inviter_prof=Profile.objects.get(user_id=ref.inviter_id)
-            inviter_prof.points += 100; inviter_prof.save()
-            RewardLedger.objects.create(user_id=ref.inviter_id, reason="invite_first_review", points=100, meta={})
+    trending.record_event(rest, "review")
+    # referral milestone (paga só uma vez por convite, mesmo com reviews simultâneas)
+    referrals.complete_first_review(ser.instance.user_id)
     return Response(ser.data)
 
 @api_view(["POST"])
@@ -103,15 +102,7 @@ def create_review(request):
 def register(request):
     # expects: username, email, password, referral_code (optional)
     data=request.data
-    u=User.objects.create_user(username=data["username"], email=data.get("email",""), password=data["password"])
-    prof=Profile.objects.create(user=u, referral_code=gen_code(8))
-    code = data.get("referral_code")
-    if code:
-        inviter_prof=Profile.objects.filter(referral_code=code).first()
-        if inviter_prof:
-            Referral.objects.create(inviter=inviter_prof.user, invitee=u, code=code, status="registered")
-            inviter_prof.points += 50; inviter_prof.save()
-            RewardLedger.objects.create(user=inviter_prof.user, reason="invite_registered", points=50, meta={"invitee":u.id})
+    u, prof = referrals.register_user(data["username"], data.get("email",""), data["password"], data.get("referral_code"))
     return Response({"user_id":u.id,"referral_code":prof.referral_code})
 
 @api_view(["POST"])
@@ -135,10 +126,56 @@ class ListViewSet(viewsets.ModelViewSet):
     
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
+    
+    def perform_update(self, serializer):
+        was_public = serializer.instance.is_public
+        lst = serializer.save()
+        if lst.is_public != was_public:
+            _on_list_visibility_changed(lst)
+    
+    def perform_destroy(self, instance):
+        owner_id, was_public = instance.owner_id, instance.is_public
+        restaurant_ids = list(instance.items.values_list('restaurant_id', flat=True))
+        instance.delete()
+        _on_list_deleted(owner_id, restaurant_ids, was_public)
 
 class ListItemViewSet(viewsets.ModelViewSet):
     queryset = ListItem.objects.all()
     serializer_class = ListItemSerializer
+    
+    def perform_create(self, serializer):
+        item = serializer.save()
+        _on_list_item_added(item)
+    
+    def perform_update(self, serializer):
+        old_lst, old_restaurant_id = serializer.instance.lst, serializer.instance.restaurant_id
+        item = serializer.save()
+        if item.lst_id != old_lst.id or item.restaurant_id != old_restaurant_id:
+            _on_list_item_removed(old_lst, old_restaurant_id)
+            _on_list_item_added(item)
+    
+    def perform_destroy(self, instance):
+        lst, restaurant_id = instance.lst, instance.restaurant_id
+        instance.delete()
+        _on_list_item_removed(lst, restaurant_id)
+
+# Dados derivados das listas (contadores de popularidade e recomendações da rede)
+def _on_list_item_added(item):
+    popularity.on_list_item_added(item)
+    recommendations.on_list_item_added(item)
+    trending.record_event(item.restaurant, 'list_add')
+
+def _on_list_item_removed(lst, restaurant_id):
+    popularity.on_list_item_removed(restaurant_id)
+    recommendations.on_list_item_removed(lst.owner_id, restaurant_id, lst.is_public)
+
+def _on_list_visibility_changed(lst):
+    popularity.on_list_visibility_changed(lst)
+    recommendations.on_list_visibility_changed(lst)
+
+def _on_list_deleted(owner_id, restaurant_ids, was_public):
+    popularity.on_list_deleted(restaurant_ids)
+    recommendations.on_list_deleted(owner_id, restaurant_ids, was_public)
 
 # Views de Autenticação
 @api_view(['POST'])
@@ -172,51 +209,37 @@ def login_view(request):
 @permission_classes([permissions.AllowAny])
 def register_view(request):
     serializer = RegisterSerializer(data=request.data)
-    if serializer.is_valid():
-        user = User.objects.create_user(
-            username=serializer.validated_data['username'],
-            email=serializer.validated_data['email'],
-            password=serializer.validated_data['password']
+    try:
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        # Usuário, perfil e (com código de referência) convite e pontos do convidante numa transação
+        user, profile = referrals.register_user(
+            serializer.validated_data['username'],
+            serializer.validated_data['email'],
+            serializer.validated_data['password'],
+            serializer.validated_data.get('referral_code'),
         )
-        profile = Profile.objects.create(user=user, referral_code=gen_code(8))
-        
-        # Processar código de referência se fornecido
-        referral_code = serializer.validated_data.get('referral_code')
-        if referral_code:
-            inviter_prof = Profile.objects.filter(referral_code=referral_code).first()
-            if inviter_prof:
-                Referral.objects.create(
-                    inviter=inviter_prof.user, 
-                    invitee=user, 
-                    code=referral_code, 
-                    status="registered"
-                )
-                inviter_prof.points += 50
-                inviter_prof.save()
-                RewardLedger.objects.create(
-                    user=inviter_prof.user, 
-                    reason="invite_registered", 
-                    points=50, 
-                    meta={"invitee": user.id}
-                )
-        
-        # Gerar JWT token
-        refresh = RefreshToken.for_user(user)
-        return Response({
-            'token': str(refresh.access_token),
-            'refresh': str(refresh),
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'profile': {
-                    'referral_code': profile.referral_code,
-                    'points': profile.points,
-                    'role': profile.role
-                }
+    except OperationalError:
+        # Pool esgotado (PoolTimeout) ou banco fora: o cliente pode tentar de novo
+        return Response({'error': 'Serviço temporariamente indisponível, tente novamente'},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+    
+    # Gerar JWT token
+    refresh = RefreshToken.for_user(user)
+    return Response({
+        'token': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'profile': {
+                'referral_code': profile.referral_code,
+                'points': profile.points,
+                'role': profile.role
             }
-        }, status=status.HTTP_201_CREATED)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        }
+    }, status=status.HTTP_201_CREATED)
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
@@ -252,29 +275,45 @@ def change_password_view(request):
         return Response({'message': 'Senha alterada com sucesso'})
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-@api_view(['POST'])
-@permission_classes([permissions.AllowAny])
-def password_reset_view(request):
-    serializer = PasswordResetSerializer(data=request.data)
-    if serializer.is_valid():
-        email = serializer.validated_data['email']
+def _request_data(request):
+    """Corpo da requisição (JSON ou formulário) para views assíncronas fora do DRF; None se inválido"""
+    if request.content_type == 'application/json':
         try:
-            user = User.objects.get(email=email)
-            # Gerar token de reset (simplificado para demo)
-            reset_token = get_random_string(32)
-            # Em produção, salvar o token em uma tabela com expiração
-            # Por agora, vamos apenas enviar um email simulado
-            send_mail(
-                'Reset de Senha - Forkly',
-                f'Seu token de reset é: {reset_token}',
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
-            return Response({'message': 'Email de reset enviado'})
-        except User.DoesNotExist:
-            return Response({'message': 'Email de reset enviado'})  # Não revelar se email existe
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+@csrf_exempt
+async def password_reset_view(request):
+    """Solicita o reset de senha.
+
+    O email é enfileirado (api.jobs) e enviado por `run_job_worker`: uma
+    falha ou lentidão do SMTP não afeta a resposta.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({'error': 'JSON inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = PasswordResetSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    email = serializer.validated_data['email']
+    user = await User.objects.filter(email=email).afirst()
+    if user is not None:
+        # Gerar token de reset (simplificado para demo)
+        reset_token = get_random_string(32)
+        # Em produção, salvar o token em uma tabela com expiração
+        # Por agora, vamos apenas enviar um email simulado
+        await jobs.aenqueue_email(
+            'Reset de Senha - Forkly',
+            f'Seu token de reset é: {reset_token}',
+            [email],
+        )
+    return JsonResponse({'message': 'Email de reset enviado'})  # Não revelar se email existe
 
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
@@ -296,7 +335,9 @@ def password_reset_confirm_view(request):
 @permission_classes([permissions.IsAuthenticated])
 def friends_list_view(request):
     """Lista todos os amigos do usuário"""
-    friendships = Friendship.objects.filter(user=request.user)
+    if not get_friend_ids(request.user.id):
+        return Response([])
+    friendships = Friendship.objects.filter(user=request.user).select_related('friend')
     serializer = FriendshipSerializer(friendships, many=True)
     return Response(serializer.data)
 
@@ -327,7 +368,7 @@ def add_friend_view(request):
             return Response({'error': 'Você não pode adicionar a si mesmo'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Verificar se já são amigos
-        if Friendship.objects.filter(user=request.user, friend=friend_user).exists():
+        if friend_user.id in get_friend_ids(request.user.id):
             return Response({'error': 'Vocês já são amigos'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Criar amizade
@@ -370,9 +411,38 @@ def search_users_view(request):
     if len(query) < 2:
         return Response({'error': 'Query deve ter pelo menos 2 caracteres'}, status=status.HTTP_400_BAD_REQUEST)
     
-    users = User.objects.filter(username__icontains=query).exclude(id=request.user.id)[:10]
-    serializer = UserSearchSerializer(users, many=True)
-    return Response(serializer.data)
+    # Candidatos por username, ranqueados por amigos em comum (adjacências cacheadas por usuário:
+    # uma busca não deve montar o snapshot CSR do grafo inteiro num processo frio)
+    users = list(User.objects.filter(username__icontains=query).exclude(id=request.user.id).order_by('username')[:50])
+    mutual = mutual_friend_counts(request.user.id, [u.id for u in users])
+    users.sort(key=lambda u: -mutual[u.id])
+    
+    serializer = UserSearchSerializer(users[:10], many=True)
+    return Response([data | {'mutual_friends': mutual[data['id']]} for data in serializer.data])
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def friend_suggestions_view(request):
+    """Pessoas que você talvez conheça (amigos de amigos)"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit deve ser inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+    depth = 3 if request.GET.get('depth') == '3' else 2
+    suggestions = suggest_friends(request.user.id, limit=limit, max_depth=depth)
+    
+    users = User.objects.in_bulk([s['user_id'] for s in suggestions])
+    data = []
+    for suggestion in suggestions:
+        user = users.get(suggestion['user_id'])
+        if user is None:
+            continue
+        data.append(UserSearchSerializer(user).data | {
+            'mutual_friends': suggestion['mutual_friends'],
+            'referral_links': suggestion['referral_links'],
+            'distance': suggestion['distance'],
+        })
+    return Response(data)
 
 # Views para listas
 @api_view(['POST'])
@@ -409,14 +479,16 @@ def my_lists_view(request):
 @permission_classes([permissions.IsAuthenticated])
 def friends_lists_view(request):
     """Lista todas as listas públicas dos amigos do usuário"""
-    # Buscar IDs dos amigos
-    friend_ids = Friendship.objects.filter(user=request.user).values_list('friend_id', flat=True)
+    # IDs dos amigos (cacheados)
+    friend_ids = get_friend_ids(request.user.id)
+    if not friend_ids:
+        return Response([])
     
     # Buscar listas públicas dos amigos
     friends_lists = List.objects.filter(
         owner_id__in=friend_ids,
         is_public=True
-    ).order_by('-id')
+    ).prefetch_related('items').order_by('-id')
     
     serializer = ListSerializer(friends_lists, many=True)
     return Response(serializer.data)
@@ -425,37 +497,49 @@ def friends_lists_view(request):
 @permission_classes([permissions.IsAuthenticated])
 def network_recommendations_view(request):
     """Restaurantes recomendados por amigos (em alta na rede)"""
-    # Buscar IDs dos amigos
-    friend_ids = Friendship.objects.filter(user=request.user).values_list('friend_id', flat=True)
-    
-    # Buscar restaurantes que estão em listas dos amigos
-    from django.db.models import Count
-    recommended_restaurants = Restaurant.objects.filter(
-        listitem__lst__owner_id__in=friend_ids,
-        listitem__lst__is_public=True
-    ).annotate(
-        friend_count=Count('listitem__lst__owner', distinct=True)
-    ).filter(
+    # Vetor pré-calculado (ver api.recommendations): leitura indexada por usuário
+    recommended = NetworkRecommendation.objects.filter(
+        user=request.user,
         friend_count__gte=2  # Pelo menos 2 amigos têm este restaurante
-    ).order_by('-friend_count', '-rating_avg')[:20]
+    ).select_related('restaurant').order_by('-friend_count', '-restaurant__rating_avg')[:20]
     
-    serializer = RestaurantSerializer(recommended_restaurants, many=True)
+    serializer = RestaurantSerializer([rec.restaurant for rec in recommended], many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def popular_restaurants_view(request):
     """Restaurantes populares em todo o Forkly (em várias listas)"""
-    from django.db.models import Count
-    popular_restaurants = Restaurant.objects.annotate(
-        list_count=Count('listitem__lst', distinct=True)
-    ).filter(
+    # list_count é mantido nas escritas de listas (api.popularity): varredura do índice
+    popular_restaurants = Restaurant.objects.filter(
         list_count__gte=3  # Pelo menos 3 listas contêm este restaurante
     ).order_by('-list_count', '-rating_avg')[:20]
     
     serializer = RestaurantSerializer(popular_restaurants, many=True)
     return Response(serializer.data)
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def trending_restaurants_view(request):
+    """Restaurantes em alta agora (score com decaimento exponencial), por região"""
+    region = request.query_params.get('region')
+    if region is None and request.query_params.get('lat') and request.query_params.get('lng'):
+        lat, lng = request.query_params['lat'], request.query_params['lng']
+        # Faixas válidas (também recusa inf e nan, que quebrariam o cálculo da célula)
+        if not validate_coordinates(lat, lng):
+            return Response({'error': 'Coordenadas inválidas'}, status=status.HTTP_400_BAD_REQUEST)
+        region = trending.region_for(float(lat), float(lng))
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 50)
+    except ValueError:
+        return Response({'error': 'limit deve ser inteiro'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = trending.top_trending(region=region, limit=limit)
+    return Response([
+        RestaurantSerializer(restaurant).data | {'trending_score': round(score, 4)}
+        for restaurant, score in results
+    ])
+
 # ===== SISTEMA DE GAMIFICAÇÃO =====
 
 @api_view(['GET'])
@@ -471,8 +555,8 @@ def gamification_stats_view(request):
     )
     
     # Atualizar estatísticas
-    # Contar referrals usando Friendship (sistema atual)
-    referrals_count = Friendship.objects.filter(user=user, is_referred=True).count()
+    # Contar referrals usando Friendship (sistema atual, via cache do grafo social)
+    referrals_count = count_referred_friends(user.id)
     user_tier.current_referrals = referrals_count
     user_tier.total_points = Profile.objects.get(user=user).points
     user_tier.save()
@@ -499,7 +583,7 @@ def gamification_stats_view(request):
     # Estatísticas de referência
     referral_stats = {
         'total_referrals': referrals_count,
-        'successful_referrals': Friendship.objects.filter(user=user, is_referred=True).count(),  # Todos os referrals são considerados bem-sucedidos
+        'successful_referrals': referrals_count,  # Todos os referrals são considerados bem-sucedidos
         'pending_referrals': 0,  # Não há referrals pendentes no sistema atual
         'total_points_earned': RewardLedger.objects.filter(user=user).aggregate(
             total=models.Sum('points')
@@ -547,7 +631,7 @@ def notifications_feed_view(request):
     user_tier, _ = UserTier.objects.get_or_create(
         user=user, defaults={'tier': Tier.objects.filter(min_referrals=0).first()}
     )
-    referrals_count = Friendship.objects.filter(user=user, is_referred=True).count()
+    referrals_count = count_referred_friends(user.id)
     next_tier = Tier.objects.filter(min_referrals__gt=user_tier.tier.min_referrals).order_by('min_referrals').first() if user_tier.tier else None
     tier_payload = []
     if next_tier:
@@ -585,34 +669,28 @@ def claim_reward_view(request):
     except Reward.DoesNotExist:
         return Response({'error': 'Recompensa não encontrada'}, status=status.HTTP_404_NOT_FOUND)
     
-    user_profile = Profile.objects.get(user=request.user)
-    
-    if user_profile.points < reward.points_cost:
-        return Response({'error': 'Pontos insuficientes'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Verificar se já possui esta recompensa
-    if UserReward.objects.filter(user=request.user, reward=reward).exists():
-        return Response({'error': 'Você já possui esta recompensa'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Descontar pontos
-    user_profile.points -= reward.points_cost
-    user_profile.save()
-    
-    # Criar recompensa do usuário
-    user_reward = UserReward.objects.create(user=request.user, reward=reward)
-    
-    # Registrar no ledger
-    RewardLedger.objects.create(
-        user=request.user,
-        reason='reward_claimed',
-        points=-reward.points_cost,
-        meta={'reward_id': reward.id, 'reward_name': reward.name}
-    )
+    with transaction.atomic():
+        # Trava o perfil: resgates simultâneos do mesmo usuário passam um de cada vez
+        points = Profile.objects.select_for_update().values_list('points', flat=True).get(user=request.user)
+        
+        if points < reward.points_cost:
+            return Response({'error': 'Pontos insuficientes'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verificar se já possui esta recompensa
+        if UserReward.objects.filter(user=request.user, reward=reward).exists():
+            return Response({'error': 'Você já possui esta recompensa'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Criar recompensa do usuário
+        user_reward = UserReward.objects.create(user=request.user, reward=reward)
+        
+        # Descontar pontos (UPDATE com F()) e registrar no ledger
+        referrals.credit_points([(request.user.id, -reward.points_cost, 'reward_claimed',
+                                  {'reward_id': reward.id, 'reward_name': reward.name})])
     
     return Response({
         'message': 'Recompensa resgatada com sucesso!',
         'user_reward': UserRewardSerializer(user_reward).data,
-        'remaining_points': user_profile.points
+        'remaining_points': points - reward.points_cost
     })
 
 @api_view(['POST'])
@@ -749,21 +827,16 @@ def check_achievements_view(request):
             should_unlock = True
         
         if should_unlock:
-            # Desbloquear conquista
-            user_achievement = UserAchievement.objects.create(user=user, achievement=achievement)
-            
-            # Adicionar pontos da conquista
-            if achievement.points_reward > 0:
-                user_profile = Profile.objects.get(user=user)
-                user_profile.points += achievement.points_reward
-                user_profile.save()
+            with transaction.atomic():
+                # Desbloquear conquista (numa verificação simultânea, só quem criar paga os pontos)
+                user_achievement, created = UserAchievement.objects.get_or_create(user=user, achievement=achievement)
+                if not created:
+                    continue
                 
-                RewardLedger.objects.create(
-                    user=user,
-                    reason='achievement_unlocked',
-                    points=achievement.points_reward,
-                    meta={'achievement_id': achievement.id, 'achievement_name': achievement.name}
-                )
+                # Adicionar pontos da conquista (UPDATE com F()) e registrar no ledger
+                if achievement.points_reward > 0:
+                    referrals.credit_points([(user.id, achievement.points_reward, 'achievement_unlocked',
+                                              {'achievement_id': achievement.id, 'achievement_name': achievement.name})])
             _send_push_notification(
                 user,
                 title=f"Conquista desbloqueada: {achievement.name}",
@@ -778,19 +851,95 @@ def check_achievements_view(request):
 
 # ===== SISTEMA DE CHAT COM IA =====
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def start_ai_conversation_view(request):
-    """Inicia uma nova conversa com IA"""
+def _authenticate_request(request):
+    """Autentica com as classes padrão do DRF (JWT/sessão) fora de uma APIView"""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
     try:
-        # Escolher serviço conforme role
-        service: object
-        if Profile.objects.get(user=request.user).role == 'restaurant_owner':
-            service = AIRestaurantService()
-        else:
-            service = AIGamificationService()
+        user = drf_request.user
+    except exceptions.APIException:
+        return None
+    if user is None or not user.is_authenticated:
+        return None
+    return user
 
-        conversation = service.create_conversation(request.user)
+
+def _ai_service_for(user):
+    """Escolhe o serviço de IA conforme o role do usuário"""
+    if Profile.objects.get(user=user).role == 'restaurant_owner':
+        return AIRestaurantService()
+    return AIGamificationService()
+
+
+def _get_or_create_conversation(service, user, conversation_id):
+    if conversation_id:
+        return AIConversation.objects.get(session_id=conversation_id, user=user, is_active=True)
+    return service.create_conversation(user)
+
+
+async def _authenticate_ai_request(request, scope):
+    """Checa o método, autentica e aplica a cota `scope` do usuário.
+
+    Retorna o usuário ou uma JsonResponse de erro.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    user = await sync_to_async(_authenticate_request)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    limited = await sync_to_async(user_rate_limit_response, thread_sensitive=False)(user, scope)
+    if limited is not None:
+        return limited
+    return user
+
+
+async def _begin_ai_chat(request):
+    """Autentica, valida e registra a mensagem do usuário.
+
+    Retorna (user, service, conversation, message) ou uma JsonResponse de erro.
+    """
+    user = await _authenticate_ai_request(request, 'ai_chat')
+    if isinstance(user, JsonResponse):
+        return user
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'JSON inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ChatMessageSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    service = await sync_to_async(_ai_service_for)(user)
+    message = serializer.validated_data['message']
+    conversation_id = serializer.validated_data.get('conversation_id')
+
+    # Buscar ou criar conversa
+    try:
+        conversation = await sync_to_async(_get_or_create_conversation)(service, user, conversation_id)
+    except AIConversation.DoesNotExist:
+        return JsonResponse({'error': 'Conversa não encontrada'}, status=status.HTTP_404_NOT_FOUND)
+
+    # Adicionar mensagem do usuário
+    await sync_to_async(service.add_message)(conversation, 'user', message, 'text')
+    return user, service, conversation, message
+
+
+@csrf_exempt
+async def start_ai_conversation_view(request):
+    """Inicia uma nova conversa com IA.
+
+    Assíncrona como send_ai_message_view: a mensagem de boas-vindas também
+    vem do LLM e não deve prender um worker.
+    """
+    try:
+        user = await _authenticate_ai_request(request, 'ai_conversation')
+        if isinstance(user, JsonResponse):
+            return user
+
+        service = await sync_to_async(_ai_service_for)(user)
+        conversation = await sync_to_async(service.create_conversation)(user)
 
         # Mensagem de boas-vindas específica
         welcome_prompt = (
@@ -798,63 +947,89 @@ def start_ai_conversation_view(request):
             if isinstance(service, AIRestaurantService) else
             "Olá! Como posso te ajudar com gamificação?"
         )
-        welcome_message = service.generate_ai_response(request.user, welcome_prompt)
-        service.add_message(conversation, 'assistant', welcome_message, 'text')
-        
-        serializer = AIConversationSerializer(conversation)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        welcome_message = await service.agenerate_ai_response(user, welcome_prompt)
+        await sync_to_async(service.add_message)(conversation, 'assistant', welcome_message, 'text')
+
+        data = await sync_to_async(lambda: AIConversationSerializer(conversation).data)()
+        return JsonResponse(data, status=status.HTTP_201_CREATED)
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def send_ai_message_view(request):
-    """Envia mensagem para IA e recebe resposta"""
-    serializer = ChatMessageSerializer(data=request.data)
-    if not serializer.is_valid():
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
+
+@csrf_exempt
+async def send_ai_message_view(request):
+    """Envia mensagem para IA e recebe resposta.
+
+    View assíncrona: a chamada ao LLM não prende um worker enquanto a
+    resposta é gerada (rodar via ASGI, ver server/asgi.py).
+    """
     try:
-        # Escolher serviço conforme role
-        service: object
-        if Profile.objects.get(user=request.user).role == 'restaurant_owner':
-            service = AIRestaurantService()
-        else:
-            service = AIGamificationService()
-        message = serializer.validated_data['message']
-        conversation_id = serializer.validated_data.get('conversation_id')
-        
-        # Buscar ou criar conversa
-        if conversation_id:
-            try:
-                conversation = AIConversation.objects.get(
-                session_id=conversation_id, 
-                user=request.user, 
-                is_active=True
-            )
-            except AIConversation.DoesNotExist:
-                return Response({'error': 'Conversa não encontrada'}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            conversation = service.create_conversation(request.user)
-        
-        # Adicionar mensagem do usuário
-        user_message = service.add_message(conversation, 'user', message, 'text')
-        
-        # Gerar resposta da IA
-        ai_response = service.generate_ai_response(request.user, message)
-        ai_message = service.add_message(conversation, 'assistant', ai_response, 'text')
-        
-        # Obter histórico da conversa
-        conversation_history = service.get_conversation_history(conversation)
-        
-        return Response({
+        started = await _begin_ai_chat(request)
+        if isinstance(started, JsonResponse):
+            return started
+        user, service, conversation, message = started
+
+        # Gerar resposta da IA (sem bloquear o event loop)
+        ai_response = await service.agenerate_ai_response(user, message, conversation)
+        ai_message = await sync_to_async(service.add_message)(conversation, 'assistant', ai_response, 'text')
+
+        # Obter histórico recente da conversa (o restante vira resumo)
+        await sync_to_async(ai_history.roll_summary)(conversation)
+        conversation_history = await sync_to_async(service.get_conversation_history)(conversation)
+
+        return JsonResponse({
             'conversation_id': conversation.session_id,
             'message': AIMessageSerializer(ai_message).data,
-            'conversation_history': conversation_history
+            'conversation_history': conversation_history,
+            'conversation_summary': conversation.metadata.get('summary', ''),
         })
-        
+
     except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder)}\n\n"
+
+
+@csrf_exempt
+async def stream_ai_message_view(request):
+    """Envia mensagem para IA e recebe a resposta em streaming (server-sent events).
+
+    Eventos: `conversation` (id da conversa), `token` (trecho da resposta),
+    `done` (AIMessage persistida) e `error`.
+    """
+    try:
+        started = await _begin_ai_chat(request)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    if isinstance(started, JsonResponse):
+        return started
+    user, service, conversation, message = started
+
+    async def events():
+        yield _sse('conversation', {'conversation_id': conversation.session_id})
+        parts = []
+        try:
+            async for delta in service.astream_ai_response(user, message, conversation):
+                parts.append(delta)
+                yield _sse('token', {'delta': delta})
+        except Exception as e:
+            yield _sse('error', {'error': str(e)})
+        finally:
+            # Persistir a resposta completa (ou parcial, se o cliente desconectar) ao fim do stream
+            if parts:
+                ai_message = await sync_to_async(service.add_message)(conversation, 'assistant', ''.join(parts), 'text')
+                await sync_to_async(ai_history.roll_summary)(conversation)
+            else:
+                ai_message = None
+        if ai_message is not None:
+            yield _sse('done', {'message': AIMessageSerializer(ai_message).data})
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # não bufferizar no nginx
+    return response
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
@@ -874,7 +1049,7 @@ def get_ai_conversations_view(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_ai_conversation_view(request, conversation_id):
-    """Obtém conversa específica com histórico"""
+    """Obtém conversa específica com histórico paginado (?before=<id da mensagem>&limit=50)"""
     try:
         conversation = AIConversation.objects.get(
             session_id=conversation_id,
@@ -882,8 +1057,19 @@ def get_ai_conversation_view(request, conversation_id):
             is_active=True
         )
         
-        serializer = AIConversationSerializer(conversation)
-        return Response(serializer.data)
+        try:
+            before = request.query_params.get('before')
+            before = int(before) if before else None
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 200)
+        except ValueError:
+            return Response({'error': 'before e limit devem ser inteiros'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        page = ai_history.get_thread_page(conversation, before=before, limit=limit)
+        data = AIConversationThreadSerializer(conversation).data
+        data['messages'] = AIMessageSerializer(page['messages'], many=True).data
+        data['has_more'] = page['has_more']
+        data['next_before'] = page['next_before']
+        return Response(data)
     except AIConversation.DoesNotExist:
         return Response({'error': 'Conversa não encontrada'}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
@@ -911,31 +1097,19 @@ def end_ai_conversation_view(request, conversation_id):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@rate_limit_by_user(scope='ai_recommendations')
 def get_ai_recommendations_view(request):
     """Obtém recomendações personalizadas da IA"""
     try:
         # Se for proprietário de restaurante, focar em métricas do restaurante
         try:
-            owner = RestaurantOwner.objects.get(user=request.user)
+            owner = RestaurantOwner.objects.select_related('restaurant').get(user=request.user)
             restaurant = owner.restaurant
-            # Garantir analytics atualizados
-            restaurant.analytics.update_stats()
-            from django.utils import timezone
-            from datetime import timedelta
-            now = timezone.now()
-            month_ago = now - timedelta(days=30)
-            monthly_reservations = Reservation.objects.filter(
-                restaurant=restaurant,
-                created_at__gte=month_ago,
-                status__in=['confirmed', 'completed']
-            )
-            monthly_count = monthly_reservations.count()
-            monthly_revenue = float(restaurant.profile.average_ticket) * monthly_count
-            recent_no_shows = Reservation.objects.filter(
-                restaurant=restaurant,
-                created_at__gte=month_ago,
-                status='no_show'
-            ).count()
+            # Números do mês vêm dos insights pré-calculados
+            restaurant_insights = insights.get_insights(restaurant)
+            monthly_count = restaurant_insights.reservations_30d
+            monthly_revenue = restaurant_insights.monthly_revenue
+            recent_no_shows = restaurant_insights.no_shows_30d
             recommendations = [
                 {
                     'type': 'restaurant_summary',
@@ -946,7 +1120,13 @@ def get_ai_recommendations_view(request):
                 {
                     'type': 'no_show_alert',
                     'title': 'No-shows no período',
-                    'description': f'{recent_no_shows} no-shows nos últimos 30 dias',
+                    'description': f'{recent_no_shows} no-shows nos últimos 30 dias ({restaurant_insights.no_show_rate * 100:.0f}% das reservas)',
+                    'priority': 'medium'
+                },
+                {
+                    'type': 'revenue_projection',
+                    'title': 'Projeção do próximo mês',
+                    'description': f'Receita projetada R$ {restaurant_insights.projected_revenue:.2f} (tendência: {restaurant_insights.trend_direction})',
                     'priority': 'medium'
                 },
             ]
@@ -958,6 +1138,7 @@ def get_ai_recommendations_view(request):
                     'monthly_reservations': monthly_count,
                     'monthly_revenue': monthly_revenue,
                     'no_shows_30d': recent_no_shows,
+                    'insights_computed_at': restaurant_insights.computed_at,
                 }
             })
         except RestaurantOwner.DoesNotExist:
@@ -1050,7 +1231,7 @@ def register_restaurant_view(request):
         # Atualizar role do usuário para restaurant_owner
         profile = Profile.objects.get(user=request.user)
         profile.role = 'restaurant_owner'
-        profile.save()
+        profile.save(update_fields=['role'])
         
         # Criar analytics
         RestaurantAnalytics.objects.create(restaurant=restaurant)
@@ -1127,58 +1308,18 @@ def restaurant_dashboard_view(request):
             restaurant=restaurant
         ).order_by('-created_at')[:10]
         
-        # Estatísticas mensais
-        from django.utils import timezone
-        from datetime import timedelta
-        now = timezone.now()
-        month_ago = now - timedelta(days=30)
-        
-        monthly_reservations = Reservation.objects.filter(
-            restaurant=restaurant,
-            created_at__gte=month_ago,
-            status__in=['confirmed', 'completed']
-        ).count()
-        
-        monthly_revenue = monthly_reservations * float(restaurant.profile.average_ticket)
-        
-        # Calcular projeção inteligente para o próximo mês
-        two_months_ago = now - timedelta(days=60)
-        previous_month_reservations = Reservation.objects.filter(
-            restaurant=restaurant,
-            created_at__gte=two_months_ago,
-            created_at__lt=month_ago,
-            status__in=['confirmed', 'completed']
-        ).count()
-        
-        # Calcular tendência
-        if previous_month_reservations > 0:
-            growth_rate = (monthly_reservations - previous_month_reservations) / previous_month_reservations
-        else:
-            growth_rate = 0.0
-        
-        # Aplicar lift de exposição em listas
-        analytics = restaurant.analytics
-        times_in_lists = float(analytics.times_in_lists or 0)
-        times_recommended = float(analytics.times_recommended or 0)
-        k = 200.0
-        raw_lift = (times_in_lists + times_recommended) / k
-        lift = max(0.0, min(raw_lift, 0.3))  # Máximo 30% de lift
-        
-        # Projeção baseada na tendência real + lift
-        trend_factor = 1.0 + (growth_rate * 0.5)  # Suavizar tendência
-        lift_factor = 1.0 + lift
-        projected_revenue = float(monthly_revenue) * trend_factor * lift_factor
-        
+        # Estatísticas mensais e projeção (insights pré-calculados, recentes: ficam ao lado das reservas ao vivo)
+        restaurant_insights = insights.get_insights(
+            restaurant, max_age_hours=getattr(settings, 'INSIGHTS_DASHBOARD_MAX_AGE_HOURS', 1)
+        )
         monthly_stats = {
-            'reservations': monthly_reservations,
-            'revenue': float(monthly_revenue),
+            'reservations': restaurant_insights.reservations_30d,
+            'revenue': restaurant_insights.monthly_revenue,
             'period': '30 dias',
-            'projection': {
-                'next_month_revenue': projected_revenue,
-                'growth_rate': growth_rate,
-                'lift_factor': lift,
-                'trend_direction': 'up' if growth_rate > 0.05 else 'down' if growth_rate < -0.05 else 'stable'
-            }
+            'no_show_rate': restaurant_insights.no_show_rate,
+            'seasonality': restaurant_insights.seasonality,
+            'projection': insights.projection_summary(restaurant_insights),
+            'computed_at': restaurant_insights.computed_at,
         }
         
         data = {
@@ -1224,8 +1365,9 @@ def create_reservation_view(request):
                 estimated_value=restaurant.profile.average_ticket * serializer.validated_data['party_size']
             )
             
-            # Atualizar analytics do restaurante
+            # Atualizar analytics e tendência do restaurante
             restaurant.analytics.update_stats()
+            trending.record_event(restaurant, 'reservation')
             
             response_serializer = ReservationSerializer(reservation)
             return Response(response_serializer.data, status=status.HTTP_201_CREATED)
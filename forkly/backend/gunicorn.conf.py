@@ -0,0 +1,36 @@
+"""
+Gunicorn configuration for Forkly backend.
+
+    gunicorn -c gunicorn.conf.py
+
+SERVER_MODE selects how Django is served:
+
+- wsgi (default): sync workers on server.wsgi. Every request, including an
+  AI chat waiting on the LLM, holds a worker for its whole duration.
+- asgi: uvicorn workers on server.asgi. The async AI chat views wait on
+  the LLM without holding a thread; sync views run in
+  Django's thread pool, capped per worker by ASGI_SYNC_VIEW_CONCURRENCY.
+
+Compare both with `python manage.py loadtest`.
+"""
+
+import multiprocessing
+import os
+
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None  # requests are logged by ForklyMiddleware (logs/requests.jsonl)
+
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'server.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'server.wsgi:application'
+    worker_class = 'sync'
+else:
+    raise ValueError(f"SERVER_MODE must be 'wsgi' or 'asgi', got {SERVER_MODE!r}")
@@ -3,6 +3,10 @@ ASGI config for server project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Async views (AI chat, password reset) only avoid blocking a worker when
+served through ASGI: ``SERVER_MODE=asgi gunicorn -c gunicorn.conf.py``
+(uvicorn workers), or ``uvicorn server.asgi:application --workers 4``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
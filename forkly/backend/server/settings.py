@@ -63,18 +63,18 @@ if IS_DEVELOPMENT:
     ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',  # Per-route latency/DB/cache metrics (exposed on /metrics)
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Static files serving
-    'api.middleware.RateLimitMiddleware',  # Rate limiting
-    'api.middleware.RequestLoggingMiddleware',  # Request logging
+    'api.middleware.AsyncWhiteNoiseMiddleware',  # Static files serving (async-capable WhiteNoise)
+    'api.middleware.ForklyMiddleware',  # Rate limiting, request logging, security and API version headers
+    'api.middleware.ReplicaRoutingMiddleware',  # Read replicas: per-request routing state (only with DATABASE_REPLICA_URLS)
+    'api.middleware.SyncViewLimitMiddleware',  # ASGI: bound concurrent sync views per worker
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'axes.middleware.AxesMiddleware',  # Security: login attempt tracking
-    'api.middleware.SecurityHeadersMiddleware',  # Security headers
-    'api.middleware.APIVersionMiddleware',  # API version headers
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -118,13 +118,79 @@ else:
         }
     }
 
-# Database connection pooling for production
-if IS_PRODUCTION:
-    DATABASES['default']['CONN_MAX_AGE'] = 60
-    DATABASES['default']['OPTIONS'] = {
-        'MAX_CONNS': 20,
-        'MIN_CONNS': 5,
-    }
+# Read replicas (comma-separated URLs): GET/HEAD requests read from them, see
+# api.db_routers. Schema and data arrive by replication, never by migrate; locally
+# `python manage.py sync_sqlite_replicas` keeps SQLite copies of db.sqlite3 up to date.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+if DATABASE_REPLICA_URLS:
+    import dj_database_url
+    for index, url in enumerate(DATABASE_REPLICA_URLS, start=1):
+        replica = dj_database_url.parse(url)
+        if replica['ENGINE'] == 'django.db.backends.sqlite3':
+            # Read-only: a missing file fails the connection (-> primary) instead of creating an empty database
+            replica['NAME'] = f"file:{replica['NAME']}?mode=ro"
+            replica.setdefault('OPTIONS', {})['uri'] = True
+        replica['TEST'] = {'MIRROR': 'default'}
+        DATABASES[f'replica_{index}'] = replica
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter'] if DATABASE_REPLICAS else []
+# Read-your-writes: after a user writes, their requests read from the primary this long
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+# A replica that fails to connect is skipped (reads go to the primary) this long
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', '30'))
+
+# SQLite (small deployments): WAL lets readers run alongside the single writer, and
+# IMMEDIATE transactions take the write lock up front, so concurrent writers queue on
+# busy_timeout instead of failing with "database is locked" when upgrading a read lock.
+SQLITE_TUNING_ENABLED = os.getenv('SQLITE_TUNING_ENABLED', 'True').lower() == 'true'
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.sqlite3' or not SQLITE_TUNING_ENABLED:
+        continue
+    database.setdefault('OPTIONS', {}).update({
+        'transaction_mode': 'IMMEDIATE',
+        # Applied on every new connection
+        'init_command': ';'.join([
+            'PRAGMA journal_mode=WAL',
+            f"PRAGMA synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",  # Durable at checkpoints in WAL mode
+            f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+            f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+            f"PRAGMA cache_size=-{int(os.getenv('SQLITE_CACHE_SIZE_KB', '65536'))}",  # Negative = KiB
+            'PRAGMA temp_store=MEMORY',
+        ]),
+    })
+
+# PostgreSQL connections: a psycopg 3 pool per worker process. Django returns the
+# connection to the pool at the end of each request; keep
+# WEB_CONCURRENCY x DB_POOL_MAX_SIZE (+ job workers) below the server's max_connections.
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'True').lower() == 'true'
+# ASGI: max sync (ORM/CPU-bound) views running at once per worker; 0 = unlimited.
+# Each holds a pooled connection, so the pool defaults to this cap plus headroom
+# for the DB calls of async views (AI chat), and a smaller pool is refused below.
+ASGI_SYNC_VIEW_CONCURRENCY = int(os.getenv('ASGI_SYNC_VIEW_CONCURRENCY', '16'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', str(max(10, ASGI_SYNC_VIEW_CONCURRENCY + 4))))
+for database in DATABASES.values():
+    if database['ENGINE'] != 'django.db.backends.postgresql':
+        continue
+    # Pool: validate connections on checkout; without pool: before reusing a persistent one
+    database['CONN_HEALTH_CHECKS'] = True
+    if DB_POOL_ENABLED:
+        database['ENGINE'] = 'api.db_backends.postgresql'  # + pool wait/checkout metrics
+        database['CONN_MAX_AGE'] = 0  # The pool owns the connections' lifetime
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # Max seconds waiting for a connection
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', '300')),  # Idle connections above min_size are closed
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),  # Connections are recycled
+        }
+        if os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi' and DB_POOL_MAX_SIZE < ASGI_SYNC_VIEW_CONCURRENCY:
+            # Sync views past the pool size would wait DB_POOL_TIMEOUT and fail with PoolTimeout
+            raise ValueError(
+                f"DB_POOL_MAX_SIZE ({DB_POOL_MAX_SIZE}) must be at least "
+                f"ASGI_SYNC_VIEW_CONCURRENCY ({ASGI_SYNC_VIEW_CONCURRENCY})"
+            )
+    else:
+        database['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
 
 
 # Password validation
@@ -257,13 +323,31 @@ if IS_PRODUCTION:
     CSRF_COOKIE_SAMESITE = 'Strict'
 
 # ===== EMAIL CONFIGURATION =====
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Mail is sent by the job workers (api.jobs); locally use the console or file backend:
+# django.core.mail.backends.console.EmailBackend / django.core.mail.backends.filebased.EmailBackend
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', str(BASE_DIR / 'logs' / 'emails'))
 EMAIL_HOST = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.getenv('EMAIL_PORT', '587'))
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', 'True').lower() == 'true'
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'noreply@forkly.com')
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '10'))  # Seconds; a stalled SMTP server fails the attempt
+# Worker SMTP connection is reused across batches, closed after this many idle seconds
+EMAIL_CONNECTION_IDLE_SECONDS = int(os.getenv('EMAIL_CONNECTION_IDLE_SECONDS', '60'))
+
+# ===== BACKGROUND JOBS =====
+# Executed by `python manage.py run_job_worker` (see api.jobs)
+JOB_BATCH_SIZE = int(os.getenv('JOB_BATCH_SIZE', '50'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1.0'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+# Retry n waits JOB_RETRY_BASE_SECONDS * 2^(n-1), capped at JOB_RETRY_MAX_SECONDS
+JOB_RETRY_BASE_SECONDS = int(os.getenv('JOB_RETRY_BASE_SECONDS', '30'))
+JOB_RETRY_MAX_SECONDS = int(os.getenv('JOB_RETRY_MAX_SECONDS', '3600'))
+# Jobs running longer than this are assumed abandoned by a dead worker and requeued
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv('JOB_LOCK_TIMEOUT_SECONDS', '300'))
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
 
 # ===== CACHING CONFIGURATION =====
 REDIS_URL = os.getenv('REDIS_URL')
@@ -277,6 +361,19 @@ if REDIS_URL:
             }
         }
     }
+    # In-process LRU tier in front of Redis for hot, read-mostly keys (see api/cache_backends.py)
+    if os.getenv('CACHE_LOCAL_TIER_ENABLED', 'True').lower() == 'true':
+        CACHES['redis'] = CACHES['default']
+        CACHES['default'] = {
+            'BACKEND': 'api.cache_backends.TieredCache',
+            'OPTIONS': {
+                'REMOTE': 'redis',
+                'LOCAL_TIMEOUT': float(os.getenv('CACHE_LOCAL_TIMEOUT', '5')),
+                'LOCAL_MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '10000')),
+                'LOCAL_PREFIXES': ['social:', 'ai:ctx:'],
+                'INVALIDATION': os.getenv('CACHE_LOCAL_INVALIDATION', 'pubsub') or None,
+            }
+        }
 else:
     CACHES = {
         'default': {
@@ -284,6 +381,76 @@ else:
         }
     }
 
+# ===== RATE LIMITING =====
+# Token buckets per client IP (see api/ratelimit.py); Redis when REDIS_URL is set, in-process otherwise
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+RATE_LIMIT_REQUESTS_PER_MINUTE = int(os.getenv('RATE_LIMIT_REQUESTS_PER_MINUTE', '60'))
+RATE_LIMIT_BURST_SIZE = int(os.getenv('RATE_LIMIT_BURST_SIZE', '10'))
+# Extra limits per route (longest matching prefix wins); `rate` requests per `per` seconds, `burst` max
+RATE_LIMIT_RULES = [
+    {'prefix': '/api/auth/login/', 'limits': [{'rate': 10, 'per': 60, 'burst': 5}, {'rate': 50, 'per': 3600, 'burst': 20}]},
+    {'prefix': '/api/auth/register/', 'limits': [{'rate': 5, 'per': 60, 'burst': 3}]},
+    {'prefix': '/api/auth/password-reset/', 'limits': [{'rate': 5, 'per': 3600, 'burst': 3}]},
+    {'prefix': '/api/ai/', 'limits': [{'rate': 20, 'per': 60, 'burst': 5}, {'rate': 300, 'per': 3600, 'burst': 30}]},
+]
+# Per-user sliding-window quotas (`limit` requests in any `window` seconds) for views using
+# security.rate_limit_by_user; the scope defaults to the view name
+USER_RATE_LIMIT_DEFAULT = {'limit': 100, 'window': 3600}
+USER_RATE_LIMITS = {
+    'ai_chat': {'limit': int(os.getenv('USER_RATE_LIMIT_AI_CHAT_PER_HOUR', '120')), 'window': 3600},
+    'ai_conversation': {'limit': 30, 'window': 3600},
+    'ai_recommendations': {'limit': 60, 'window': 3600},
+}
+
+# ===== SOCIAL GRAPH =====
+# TTL (seconds) of the cached per-user friend-id sets (invalidated on Friendship writes)
+SOCIAL_CACHE_TIMEOUT = int(os.getenv('SOCIAL_CACHE_TIMEOUT', '3600'))
+# Max age (seconds) of the in-memory CSR friendship snapshot used for friend suggestions
+SOCIAL_GRAPH_SNAPSHOT_TTL = int(os.getenv('SOCIAL_GRAPH_SNAPSHOT_TTL', '300'))
+
+# ===== TRENDING =====
+# Exponentially decayed restaurant scores (see api/trending.py)
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', '72'))
+TRENDING_EPOCH = '2025-01-01'  # Fixed reference time for the log-space scores; changing it requires a rebuild
+TRENDING_REGION_CELL_DEGREES = 0.5  # Region grid cell size (~55 km)
+TRENDING_WEIGHTS = {
+    'review': 3.0,
+    'list_add': 2.0,
+    'reservation': 4.0,
+}
+
+# ===== RESTAURANT INSIGHTS =====
+# Stored insights are refreshed nightly (`python manage.py refresh_restaurant_insights`);
+# readers recompute a restaurant on demand when its record is older than this
+INSIGHTS_MAX_AGE_HOURS = int(os.getenv('INSIGHTS_MAX_AGE_HOURS', '36'))
+# The owner dashboard shows them next to live reservations, so it accepts much younger records
+INSIGHTS_DASHBOARD_MAX_AGE_HOURS = float(os.getenv('INSIGHTS_DASHBOARD_MAX_AGE_HOURS', '1'))
+
+# ===== LLM (AI CHAT) =====
+# Any OpenAI-compatible endpoint; point at `python manage.py llm_stub` for local load tests
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'https://api.openai.com/v1')
+LLM_MODEL = os.getenv('LLM_MODEL', 'gpt-3.5-turbo')
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '15'))
+LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv('LLM_CONNECT_TIMEOUT_SECONDS', '3'))
+# LLM gateway (api/llm_gateway.py): worker pool size = max in-flight LLM requests per process;
+# requests queued longer than LLM_QUEUE_TIMEOUT_SECONDS (or beyond LLM_GATEWAY_QUEUE_SIZE) fall back
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '20'))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '5'))
+LLM_GATEWAY_QUEUE_SIZE = int(os.getenv('LLM_GATEWAY_QUEUE_SIZE', '1000'))
+# Per API key/model limits (rate 0 = unlimited)
+LLM_KEY_MAX_CONCURRENCY = int(os.getenv('LLM_KEY_MAX_CONCURRENCY', '20'))
+LLM_KEY_RATE_PER_SECOND = float(os.getenv('LLM_KEY_RATE_PER_SECOND', '0'))
+# Max age (seconds) of the cached per-user/per-restaurant AI context snapshots (also invalidated on writes)
+AI_CONTEXT_CACHE_TIMEOUT = int(os.getenv('AI_CONTEXT_CACHE_TIMEOUT', '300'))
+# Messages returned/loaded per AI chat turn; older ones are folded into AIConversation.metadata['summary']
+AI_HISTORY_WINDOW = int(os.getenv('AI_HISTORY_WINDOW', '50'))
+AI_SUMMARY_MAX_CHARS = int(os.getenv('AI_SUMMARY_MAX_CHARS', '2000'))
+# Per-process LRU cache of gamification assistant replies (see api/ai_cache.py); TTL 0 disables it
+AI_RESPONSE_CACHE_TTL = int(os.getenv('AI_RESPONSE_CACHE_TTL', '3600'))
+AI_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('AI_RESPONSE_CACHE_MAX_ENTRIES', '2000'))
+# Cosine similarity (0-1) for near-duplicate lookups within a context bucket; 0 = exact match only
+AI_RESPONSE_CACHE_SIMILARITY = float(os.getenv('AI_RESPONSE_CACHE_SIMILARITY', '0'))
+
 # ===== LOGGING CONFIGURATION =====
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE_PATH = os.getenv('LOG_FILE_PATH', 'logs/forkly.log')
@@ -291,6 +458,14 @@ LOG_FILE_PATH = os.getenv('LOG_FILE_PATH', 'logs/forkly.log')
 # Ensure log directory exists
 os.makedirs(os.path.dirname(LOG_FILE_PATH), exist_ok=True)
 
+# Per-request access log: JSON lines written in batches by a background thread (see api/logging_pipeline.py)
+REQUEST_LOG_ENABLED = os.getenv('REQUEST_LOG_ENABLED', 'True').lower() == 'true'
+REQUEST_LOG_PATH = os.getenv('REQUEST_LOG_PATH', os.path.join(os.path.dirname(LOG_FILE_PATH), 'requests.jsonl'))
+REQUEST_LOG_QUEUE_SIZE = int(os.getenv('REQUEST_LOG_QUEUE_SIZE', '10000'))  # records beyond this are dropped (counted)
+REQUEST_LOG_BATCH_SIZE = int(os.getenv('REQUEST_LOG_BATCH_SIZE', '500'))
+REQUEST_LOG_FLUSH_INTERVAL = float(os.getenv('REQUEST_LOG_FLUSH_INTERVAL', '1.0'))
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv('REQUEST_LOG_SAMPLE_RATE', '1.0'))  # fraction of non-error responses kept
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -335,6 +510,18 @@ LOGGING = {
     },
 }
 
+# ===== SERVING (WSGI / ASGI) =====
+# `gunicorn -c gunicorn.conf.py` with SERVER_MODE=wsgi (sync workers) or asgi (uvicorn workers)
+# ASGI_SYNC_VIEW_CONCURRENCY is set with the DB pool (above), which is sized from it
+
+# ===== METRICS =====
+# Prometheus scrape endpoint /metrics (see api/metrics.py); Bearer token required when set.
+# Unset: open in development/staging, always 403 in production
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Directory shared by all workers of a host (wipe on deploy); unset = report this process only
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_DUMP_INTERVAL = float(os.getenv('METRICS_DUMP_INTERVAL', '5'))
+
 # ===== STATIC FILES CONFIGURATION =====
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'